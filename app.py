@@ -23,6 +23,9 @@ logger = logging.getLogger("WasteSorterDashboard")
 # Database path
 DB_PATH = './data/sorting_data.db'
 
+# Embedding index built by embedding_index.py
+INDEX_PATH = './data/embedding_index.npz'
+
 # Create necessary directories - MOVED OUTSIDE MAIN BLOCK
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 os.makedirs(os.path.join(os.path.dirname(__file__), 'templates'), exist_ok=True)
@@ -195,6 +198,22 @@ def get_total_statistics():
         'grand_total': 0
     }
 
+# Function to get the embedding index, reloaded when the file changes
+_embedding_index = {'mtime': None, 'index': None}
+
+def get_embedding_index():
+    """Get the embedding index (None if it has not been built)"""
+    if not os.path.exists(INDEX_PATH):
+        return None
+    
+    mtime = os.path.getmtime(INDEX_PATH)
+    if _embedding_index['mtime'] != mtime:
+        from embedding_index import EmbeddingIndex
+        _embedding_index['index'] = EmbeddingIndex.load(INDEX_PATH)
+        _embedding_index['mtime'] = mtime
+        logger.info(f"Loaded embedding index with {len(_embedding_index['index'])} images")
+    return _embedding_index['index']
+
 # Routes
 @app.route('/')
 def index():
@@ -271,6 +290,52 @@ def api_thumbnail(image_id):
         logger.error(f"Error serving thumbnail: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/similar/<image_id>')
+def api_similar_images(image_id):
+    """API endpoint for images similar to a stored image"""
+    k = request.args.get('k', default=10, type=int)
+    logger.info(f"Similar images API called for image_id={image_id} with k={k}")
+    try:
+        index = get_embedding_index()
+        if index is None:
+            return jsonify({'error': 'Embedding index not built'}), 404
+        
+        results = index.similar_to(image_id, k)
+        return jsonify([
+            {
+                'image_id': similar_id,
+                'similarity': similarity,
+                'item_type': label or None,
+                'thumbnail_url': f'/api/thumbnail/{similar_id}'
+            }
+            for similar_id, similarity, label in results
+        ])
+    except KeyError:
+        return jsonify({'error': 'Image not in the embedding index'}), 404
+    except Exception as e:
+        logger.error(f"Error finding similar images: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/duplicates')
+def api_duplicates():
+    """API endpoint for near-duplicate captures"""
+    threshold = request.args.get('threshold', default=0.97, type=float)
+    window = request.args.get('window', default=50, type=int)
+    logger.info(f"Duplicates API called with threshold={threshold}, window={window}")
+    try:
+        index = get_embedding_index()
+        if index is None:
+            return jsonify({'error': 'Embedding index not built'}), 404
+        
+        pairs = index.find_duplicates(threshold, window or None)
+        return jsonify([
+            {'image_id': first, 'duplicate_id': second, 'similarity': similarity}
+            for first, second, similarity in pairs
+        ])
+    except Exception as e:
+        logger.error(f"Error finding duplicates: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/stats/daily')
 def api_daily_stats():
     """API endpoint for daily statistics"""
@@ -0,0 +1,111 @@
+# benchmark_startup.py - Compare startup time and memory of the inference backends
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+
+def resident_memory_mb():
+    """Current resident set size of this process in MiB (peak RSS when psutil is missing)"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure_child(backend, model_path, num_threads):
+    """Start the app's inference path from a fresh interpreter and report its cost"""
+    start = time.perf_counter()
+
+    # The same imports main.py needs before the window opens
+    from classifier_engine import ClassifierEngine
+    import main  # noqa: F401
+    import_s = time.perf_counter() - start
+
+    engine = ClassifierEngine.load(backend, model_dir="models", model_path=model_path,
+                                   num_threads=num_threads, warmup=False)
+    load_s = time.perf_counter() - start - import_s
+
+    import numpy as np
+    frame = np.random.default_rng(0).integers(0, 256, (720, 1280, 3), dtype=np.uint8)
+    first = time.perf_counter()
+    engine.classify(frame)
+    ready = time.perf_counter()
+    first_inference_ms = (ready - first) * 1000
+
+    latencies = []
+    for _ in range(20):
+        engine.classify(frame)
+        latencies.append(engine.last_latency_ms)
+
+    print(json.dumps({
+        "backend": backend,
+        "import_s": import_s,
+        "load_s": load_s,
+        "ready_s": ready - start,
+        "first_inference_ms": first_inference_ms,
+        "steady_latency_ms": sorted(latencies)[len(latencies) // 2],
+        "rss_mb": resident_memory_mb(),
+        "tensorflow_imported": "tensorflow" in sys.modules
+    }))
+
+
+def run_child(backend, model_path, num_threads):
+    """Run one measurement in a separate process so imports start cold"""
+    command = [sys.executable, os.path.abspath(__file__), "--child", backend]
+    if model_path:
+        command += ["--model_path", model_path]
+    if num_threads:
+        command += ["--num_threads", str(num_threads)]
+
+    result = subprocess.run(command, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "unknown error"
+        print(f"{backend}: failed ({error})")
+        return None
+
+    # The last line is the JSON report; anything before it is log output
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description='Benchmark app startup per inference backend')
+    parser.add_argument('--backends', type=str, nargs='+', default=['keras', 'opencv'],
+                        help='Backends to compare')
+    parser.add_argument('--model_path', type=str, default=None,
+                        help='Model file (only when benchmarking a single backend)')
+    parser.add_argument('--num_threads', type=int, default=None, help='Number of CPU threads')
+    parser.add_argument('--runs', type=int, default=3, help='Cold starts per backend')
+    parser.add_argument('--child', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure_child(args.child, args.model_path, args.num_threads)
+        return
+
+    print(f"{'backend':<8} {'import':>8} {'load':>8} {'ready':>8} {'first':>9} {'steady':>9} "
+          f"{'RSS':>9}  TensorFlow")
+    for backend in args.backends:
+        reports = [run_child(backend, args.model_path, args.num_threads) for _ in range(args.runs)]
+        reports = [r for r in reports if r is not None]
+        if not reports:
+            continue
+
+        # Report the median cold start
+        reports.sort(key=lambda r: r["ready_s"])
+        r = reports[len(reports) // 2]
+        print(f"{backend:<8} {r['import_s']:7.2f}s {r['load_s']:7.2f}s {r['ready_s']:7.2f}s "
+              f"{r['first_inference_ms']:7.1f}ms {r['steady_latency_ms']:7.1f}ms "
+              f"{r['rss_mb']:7.0f}MiB  {'yes' if r['tensorflow_imported'] else 'no'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# calibration.py - Confidence calibration for the classifier's softmax outputs
+import os
+import json
+import logging
+import numpy as np
+
+from model_cache import file_checksum
+
+logger = logging.getLogger("WasteSorter")
+
+CALIBRATION_FILE = "calibration.json"
+
+
+def apply_temperature(probabilities, temperature):
+    """Rescale softmax probabilities as if the logits were divided by a temperature"""
+    logits = np.log(np.clip(probabilities, 1e-12, 1.0)) / temperature
+    logits -= logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def negative_log_likelihood(probabilities, labels):
+    """Mean negative log-likelihood of the true labels"""
+    return float(-np.mean(np.log(np.clip(probabilities[np.arange(len(labels)), labels], 1e-12, 1.0))))
+
+
+def expected_calibration_error(probabilities, labels, bins=10):
+    """Gap between confidence and accuracy, averaged over confidence bins"""
+    confidence = probabilities.max(axis=1)
+    correct = probabilities.argmax(axis=1) == labels
+    edges = np.linspace(0.0, 1.0, bins + 1)
+
+    error = 0.0
+    for low, high in zip(edges[:-1], edges[1:]):
+        in_bin = (confidence > low) & (confidence <= high)
+        if np.any(in_bin):
+            error += np.mean(in_bin) * abs(np.mean(correct[in_bin]) - np.mean(confidence[in_bin]))
+    return float(error)
+
+
+def fit_temperature(probabilities, labels, low=0.05, high=10.0, iterations=60):
+    """Temperature that minimises the negative log-likelihood (golden-section search on log T)"""
+    ratio = (np.sqrt(5) - 1) / 2
+    a, b = np.log(low), np.log(high)
+
+    def loss(log_t):
+        return negative_log_likelihood(apply_temperature(probabilities, np.exp(log_t)), labels)
+
+    c, d = b - ratio * (b - a), a + ratio * (b - a)
+    loss_c, loss_d = loss(c), loss(d)
+    for _ in range(iterations):
+        if loss_c < loss_d:
+            b, d, loss_d = d, c, loss_c
+            c = b - ratio * (b - a)
+            loss_c = loss(c)
+        else:
+            a, c, loss_c = c, d, loss_d
+            d = a + ratio * (b - a)
+            loss_d = loss(d)
+    return float(np.exp((a + b) / 2))
+
+
+def fit_class_thresholds(probabilities, labels, target_precision=0.90, min_samples=20):
+    """Lowest confidence per predicted class at which its precision reaches the target
+
+    Classes with too few validation predictions are left out, so the
+    caller's default threshold applies to them.
+    """
+    predicted = probabilities.argmax(axis=1)
+    confidence = probabilities.max(axis=1)
+    thresholds = {}
+
+    for class_id in range(probabilities.shape[1]):
+        mask = predicted == class_id
+        if np.count_nonzero(mask) < min_samples:
+            continue
+
+        # Precision of the predictions at or above each candidate threshold
+        order = np.argsort(-confidence[mask])
+        sorted_confidence = confidence[mask][order]
+        sorted_correct = (labels[mask] == class_id)[order]
+        precision = np.cumsum(sorted_correct) / np.arange(1, len(sorted_correct) + 1)
+
+        # Deepest cut-off whose precision (and every stricter one's) meets the target
+        meets = precision >= target_precision
+        if not meets[0]:
+            continue
+        failing = np.flatnonzero(~meets)
+        last = (failing[0] - 1) if len(failing) else len(meets) - 1
+        thresholds[str(class_id)] = float(sorted_confidence[last])
+
+    return thresholds
+
+
+class Calibration:
+    """Temperature scaling plus optional per-class confidence thresholds
+
+    Saved as calibration.json next to class_mapping.json and applied by
+    ClassifierEngine.interpret, so every consumer of classification
+    results sees calibrated probabilities.
+
+    The file holds one entry per fitted model, each with the SHA-256 of
+    the model files it applies to (the .h5 and its exports). Saving a new
+    calibration adds its entry and keeps the others, so calibrating a
+    pruned or distilled model does not evict latest_model.h5's. A model
+    file with no entry runs uncalibrated.
+    """
+
+    def __init__(self, temperature=1.0, class_thresholds=None, metrics=None, models=None):
+        """Initialize the calibration"""
+        self.temperature = temperature
+        self.class_thresholds = class_thresholds or {}
+        self.metrics = metrics or {}
+        self.models = models or {}
+
+    def add_model(self, model_path):
+        """Mark a model file as one the calibration applies to"""
+        self.models[os.path.basename(model_path)] = file_checksum(model_path)
+
+    @classmethod
+    def fit(cls, probabilities, labels, target_precision=0.90):
+        """Fit temperature scaling and per-class thresholds on held-out predictions"""
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        labels = np.asarray(labels)
+
+        temperature = fit_temperature(probabilities, labels)
+        calibrated = apply_temperature(probabilities, temperature)
+        metrics = {
+            "samples": int(len(labels)),
+            "target_precision": target_precision,
+            "nll_before": negative_log_likelihood(probabilities, labels),
+            "nll_after": negative_log_likelihood(calibrated, labels),
+            "ece_before": expected_calibration_error(probabilities, labels),
+            "ece_after": expected_calibration_error(calibrated, labels)
+        }
+        return cls(temperature, fit_class_thresholds(calibrated, labels, target_precision), metrics)
+
+    def apply(self, probabilities):
+        """Calibrated probabilities for one row or a batch of softmax outputs"""
+        if self.temperature == 1.0:
+            return probabilities
+        return apply_temperature(probabilities, self.temperature).astype(np.float32)
+
+    def threshold(self, class_id):
+        """Confidence threshold for a class, or None to use the policy's default"""
+        return self.class_thresholds.get(str(class_id))
+
+    def to_dict(self):
+        """Entry of calibration.json"""
+        return {
+            "temperature": self.temperature,
+            "class_thresholds": self.class_thresholds,
+            "metrics": self.metrics,
+            "models": self.models
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Calibration from an entry of calibration.json"""
+        return cls(data["temperature"], data.get("class_thresholds"), data.get("metrics"), data.get("models"))
+
+    @staticmethod
+    def read_entries(model_dir):
+        """Entries of calibration.json in the model directory (empty if missing)"""
+        path = os.path.join(model_dir, CALIBRATION_FILE)
+        if not os.path.exists(path):
+            return []
+
+        with open(path, 'r') as f:
+            data = json.load(f)
+        # A file with a single calibration at the top level is one entry
+        return data["calibrations"] if "calibrations" in data else [data]
+
+    def save(self, model_dir="models"):
+        """Add or update this calibration's entry in calibration.json, keeping the other models' entries"""
+        checksums = set(self.models.values())
+        entries = []
+        for entry in self.read_entries(model_dir):
+            # Model files this calibration now covers leave their previous entry
+            models = {name: checksum for name, checksum in entry.get("models", {}).items()
+                      if checksum not in checksums}
+            if models:
+                entries.append(dict(entry, models=models))
+        entries.append(self.to_dict())
+
+        path = os.path.join(model_dir, CALIBRATION_FILE)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({"calibrations": entries}, f, indent=4)
+        os.replace(temp_path, path)
+        logger.info(f"Saved calibration to {path} ({len(entries)} calibrated models)")
+        return path
+
+    @classmethod
+    def load(cls, model_dir, model_path):
+        """Load the calibration.json entry fitted for a model file
+
+        Returns None when the file is missing or has no entry for
+        model_path.
+        """
+        entries = cls.read_entries(model_dir)
+        if not entries:
+            return None
+
+        calibration = None
+        if os.path.exists(model_path):
+            checksum = file_checksum(model_path)
+            for entry in entries:
+                if checksum in entry.get("models", {}).values():
+                    calibration = cls.from_dict(entry)
+                    break
+
+        if calibration is None:
+            logger.warning(f"Ignoring {os.path.join(model_dir, CALIBRATION_FILE)}: it has no calibration for "
+                           f"{os.path.basename(model_path)} (refit with train_model.py --calibrate)")
+            return None
+
+        logger.info(f"Loaded calibration: temperature {calibration.temperature:.3f}, "
+                    f"{len(calibration.class_thresholds)} class thresholds")
+        return calibration
@@ -0,0 +1,213 @@
+# cascade.py - Two-stage classification: a cheap gate model in front of the full classifier
+import os
+import time
+import logging
+import cv2
+import numpy as np
+
+logger = logging.getLogger("WasteSorter")
+
+# First-stage classifiers selectable from the command line
+CASCADE_GATES = ["histogram", "model"]
+
+DEFAULT_GATE_PATH = os.path.join("models", "gate_classifier.npz")
+
+
+def histogram_features(frame, size=64, bgr=True):
+    """Colour and texture histogram of a frame
+
+    An 8x4x4 HSV colour histogram plus a 9-bin histogram of gradient
+    orientations weighted by magnitude, computed on a small thumbnail so
+    it costs well under a millisecond.
+    """
+    small = cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA)
+    if not bgr:
+        small = cv2.cvtColor(small, cv2.COLOR_RGB2BGR)
+
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    color = cv2.calcHist([hsv], [0, 1, 2], None, [8, 4, 4], [0, 180, 0, 256, 0, 256]).ravel()
+    color /= max(color.sum(), 1.0)
+
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+    magnitude, angle = cv2.cartToPolar(gx, gy, angleInDegrees=True)
+    texture, _ = np.histogram(angle % 180, bins=9, range=(0, 180), weights=magnitude)
+    texture = texture.astype(np.float32) / max(float(texture.sum()), 1.0)
+
+    # Overall edge strength separates shiny, printed cans from plain items
+    edge_strength = np.float32(magnitude.mean() / 255.0)
+
+    return np.concatenate([color, texture, [edge_strength]]).astype(np.float32)
+
+
+class HistogramGateClassifier:
+    """Softmax regression on colour and texture histograms
+
+    Trained with numpy on the same class folders as the full model, so the
+    class indices match class_mapping.json.
+    """
+
+    def __init__(self, class_names, weights=None, bias=None, mean=None, std=None):
+        """Initialize the classifier (untrained unless weights are given)"""
+        self.class_names = list(class_names)
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.std = std
+
+    def fit(self, features, labels, epochs=500, learning_rate=0.5, l2=1e-3):
+        """Fit the weights with full-batch gradient descent"""
+        features = np.asarray(features, dtype=np.float32)
+        labels = np.asarray(labels)
+        num_classes = len(self.class_names)
+
+        self.mean = features.mean(axis=0)
+        self.std = features.std(axis=0) + 1e-6
+        x = (features - self.mean) / self.std
+        targets = np.eye(num_classes, dtype=np.float32)[labels]
+
+        self.weights = np.zeros((x.shape[1], num_classes), dtype=np.float32)
+        self.bias = np.zeros(num_classes, dtype=np.float32)
+        for _ in range(epochs):
+            probabilities = self._softmax(x @ self.weights + self.bias)
+            error = (probabilities - targets) / len(x)
+            self.weights -= learning_rate * (x.T @ error + l2 * self.weights)
+            self.bias -= learning_rate * error.sum(axis=0)
+
+        return self
+
+    @staticmethod
+    def _softmax(logits):
+        """Row-wise softmax"""
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def predict_features(self, features):
+        """Class probabilities for a batch of feature vectors"""
+        x = (np.atleast_2d(features) - self.mean) / self.std
+        return self._softmax(x @ self.weights + self.bias)
+
+    def predict_proba(self, frame, bgr=True):
+        """Class probabilities for a frame"""
+        return self.predict_features(histogram_features(frame, bgr=bgr))[0]
+
+    def save(self, path=DEFAULT_GATE_PATH):
+        """Save the classifier"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, class_names=np.array(self.class_names), weights=self.weights, bias=self.bias,
+                 mean=self.mean, std=self.std)
+        logger.info(f"Saved gate classifier to {path}")
+
+    @classmethod
+    def load(cls, path=DEFAULT_GATE_PATH):
+        """Load a saved classifier"""
+        data = np.load(path)
+        return cls([str(name) for name in data["class_names"]], data["weights"], data["bias"],
+                   data["mean"], data["std"])
+
+
+class ModelGate:
+    """Gate backed by a small model, e.g. a distilled tiny_cnn student"""
+
+    def __init__(self, engine):
+        """Wrap a ClassifierEngine for the small model"""
+        self.engine = engine
+        self.class_names = [engine.class_name(i) for i in range(len(engine.class_mapping or {}))]
+
+    def predict_proba(self, frame, bgr=True):
+        """Class probabilities for a frame"""
+        return self.engine.predict_frame(frame, bgr=bgr)[0]
+
+
+def load_gate(kind="histogram", path=None, model_dir="models", num_threads=None):
+    """Load a first-stage classifier"""
+    if kind == "histogram":
+        return HistogramGateClassifier.load(path or DEFAULT_GATE_PATH)
+
+    if kind == "model":
+        from classifier_engine import ClassifierEngine
+        from model_backends import backend_for_path
+
+        if path is None:
+            raise ValueError("A gate model path is required for the model gate")
+        return ModelGate(ClassifierEngine.load(backend_for_path(path), model_dir=model_dir, model_path=path,
+                                               num_threads=num_threads))
+
+    raise ValueError(f"Unknown gate: {kind}")
+
+
+class CascadeClassifier:
+    """Runs the gate on every frame and the full model only when the gate is unsure
+
+    The gate's class probabilities are summed into sort categories; when
+    the margin between the two most likely categories is at least
+    margin_threshold the gate's answer is used as is. Otherwise the frame
+    goes to the full ClassifierEngine. Results have the same layout as
+    ClassifierEngine.classify, plus the stage that produced them.
+    """
+
+    def __init__(self, gate, engine, margin_threshold=0.5):
+        """Initialize the cascade"""
+        if not engine.has_custom_mapping:
+            raise ValueError("The cascade needs a trained model with a class mapping")
+
+        expected = [engine.class_name(i) for i in range(len(engine.class_mapping))]
+        if list(gate.class_names) != expected:
+            raise ValueError(f"Gate classes {gate.class_names} do not match the model's {expected}")
+
+        self.gate = gate
+        self.engine = engine
+        self.margin_threshold = margin_threshold
+        self.reset_stats()
+
+    def classify(self, frame, bgr=True):
+        """Classify a frame with the gate, falling back to the full model"""
+        start = time.perf_counter()
+        # The model's calibration does not apply to the gate's probabilities
+        result = self.engine.interpret(self.gate.predict_proba(frame, bgr=bgr), calibrate=False)
+        gate_time = time.perf_counter() - start
+
+        top_two = np.sort(list(result["category_probabilities"].values()))[-2:]
+        margin = float(top_two[1] - top_two[0])
+
+        self.frames += 1
+        self.gate_time += gate_time
+        if margin >= self.margin_threshold:
+            self.gate_hits += 1
+            result["stage"] = "gate"
+        else:
+            full_start = time.perf_counter()
+            result = self.engine.classify(frame, bgr=bgr)
+            self.full_time += time.perf_counter() - full_start
+            result["stage"] = "full"
+
+        elapsed = time.perf_counter() - start
+        self.total_time += elapsed
+        result["gate_margin"] = margin
+        result["latency_ms"] = elapsed * 1000
+        return result
+
+    def reset_stats(self):
+        """Reset the per-stage statistics"""
+        self.frames = 0
+        self.gate_hits = 0
+        self.gate_time = 0.0
+        self.full_time = 0.0
+        self.total_time = 0.0
+
+    def get_stats(self):
+        """Get per-stage hit rates and average latency"""
+        full_runs = self.frames - self.gate_hits
+        return {
+            "frames": self.frames,
+            "margin_threshold": self.margin_threshold,
+            "gate_hits": self.gate_hits,
+            "gate_hit_rate": self.gate_hits / self.frames if self.frames else 0.0,
+            "full_runs": full_runs,
+            "full_rate": full_runs / self.frames if self.frames else 0.0,
+            "mean_gate_ms": self.gate_time / self.frames * 1000 if self.frames else 0.0,
+            "mean_full_ms": self.full_time / full_runs * 1000 if full_runs else 0.0,
+            "mean_latency_ms": self.total_time / self.frames * 1000 if self.frames else 0.0
+        }
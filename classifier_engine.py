@@ -0,0 +1,274 @@
+# classifier_engine.py - Shared classification engine for the waste sorting system
+import time
+import threading
+import logging
+import cv2
+import numpy as np
+
+from model_backends import KerasBackend, create_backend, default_model_path
+from calibration import Calibration
+
+logger = logging.getLogger("WasteSorter")
+
+# ImageNet classes used when no custom model is available
+IMAGENET_CAN_CLASSES = [482, 483, 810]  # Can related classes
+IMAGENET_RECYCLABLE_CLASSES = [494, 440, 672, 802, 965, 611]  # Recyclable classes
+
+# Sort categories understood by the Arduino firmware
+SORT_CATEGORIES = ["Can", "Recycling", "Garbage"]
+
+
+def preprocess_frame(frame, image_size=(224, 224), bgr=True):
+    """Convert a camera frame into a normalized float32 batch of one image
+
+    Frames from OpenCV (cv2.VideoCapture, cv2.imread) are BGR and are
+    converted to the RGB order the model was trained on.
+    """
+    img = cv2.resize(frame, (image_size[1], image_size[0]))
+    if bgr:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img = img.astype(np.float32) / 255.0
+    return np.expand_dims(img, axis=0)
+
+
+class FramePreprocessor:
+    """Allocation-free preprocessing into a caller-provided input buffer
+
+    The frame is resized into a preallocated uint8 buffer, then the BGR to
+    RGB swap and scaling are fused into a single numpy pass that writes
+    directly into the model's input buffer (a float32 array for Keras, the
+    interpreter's own input tensor for TFLite). No per-frame arrays are
+    allocated.
+    """
+
+    def __init__(self, image_size=(224, 224)):
+        """Preallocate the resize buffer"""
+        self.image_size = tuple(image_size)
+        self._resized = np.empty((*self.image_size, 3), dtype=np.uint8)
+
+    def process(self, frame, out, bgr=True, scale=1.0 / 255.0, offset=0.0):
+        """Write frame * scale + offset into out (shape (H, W, 3)), resized and as RGB"""
+        cv2.resize(frame, (self.image_size[1], self.image_size[0]), dst=self._resized)
+        pixels = self._resized[..., ::-1] if bgr else self._resized
+
+        if np.issubdtype(out.dtype, np.integer):
+            # Quantized input: pixels map to integers through scale and zero point
+            if scale == 1.0 and offset == 0.0:
+                np.copyto(out, pixels, casting='unsafe')
+            elif scale == 1.0 and offset == -128.0 and out.dtype == np.int8:
+                # p - 128 in two's complement is p with the top bit flipped
+                np.bitwise_xor(pixels, np.uint8(0x80), out=out.view(np.uint8))
+            else:
+                info = np.iinfo(out.dtype)
+                out[...] = np.clip(np.round(pixels * scale + offset), info.min, info.max)
+            return out
+
+        np.multiply(pixels, np.float32(scale), out=out, casting='unsafe')
+        if offset:
+            np.add(out, np.float32(offset), out=out)
+        return out
+
+
+class ClassifierEngine:
+    """Preprocessing, inference and class mapping shared by every entry point
+
+    main.py, camera_test.py and WasteClassifierTrainer all classify frames
+    through this class so that preprocessing is identical everywhere and
+    latency is measured the same way.
+    """
+
+    def __init__(self, backend, class_mapping=None, calibration=None):
+        """Wrap a loaded backend (see model_backends), its class mapping and optional calibration"""
+        self.backend = backend
+        self.calibration = calibration
+        self.image_size = tuple(backend.input_shape[:2])
+
+        # Normalize mapping keys to strings ({"0": "can", ...})
+        self.class_mapping = None
+        if class_mapping is not None:
+            self.class_mapping = {str(k): v for k, v in class_mapping.items()}
+
+        # Reusable preprocessing buffers; the lock keeps the UI thread and the
+        # inference worker from sharing them (and the backend) at the same time
+        self.preprocessor = FramePreprocessor(self.image_size)
+        self._lock = threading.Lock()
+        self._batch_buffer = None
+
+        # Class indices per sort category, built on first use
+        self._category_indices = None
+
+        # Latency statistics
+        self.inference_count = 0
+        self.total_inference_time = 0.0
+        self.last_latency_ms = 0.0
+
+    @classmethod
+    def load(cls, backend="keras", model_dir="models", model_path=None, num_threads=None, warmup=True,
+             use_cache=False):
+        """Load a backend from the model directory and build an engine around it"""
+        model_backend, class_mapping = create_backend(
+            backend,
+            model_dir=model_dir,
+            model_path=model_path,
+            num_threads=num_threads,
+            use_cache=use_cache
+        )
+        # Calibration is fitted for a trained model file, never for the ImageNet
+        # fallback or the few-shot classes
+        calibration = None
+        if class_mapping is not None and model_backend.name != "few_shot":
+            calibration = Calibration.load(model_dir, model_path or default_model_path(backend, model_dir))
+        engine = cls(model_backend, class_mapping, calibration)
+        if warmup:
+            engine.warmup()
+        return engine
+
+    @classmethod
+    def from_keras_model(cls, model, class_mapping=None):
+        """Build an engine around an in-memory Keras model"""
+        return cls(KerasBackend(model=model), class_mapping)
+
+    @property
+    def has_custom_mapping(self):
+        """Whether a custom class mapping is loaded (otherwise ImageNet classes)"""
+        return self.class_mapping is not None
+
+    def warmup(self, runs=2):
+        """Run a few dummy inferences so the first real frame is not slow"""
+        dummy = np.zeros((1, *self.image_size, 3), dtype=np.float32)
+        start = time.perf_counter()
+        for _ in range(runs):
+            self.backend.predict(dummy)
+        logger.info(f"Classifier warm-up finished in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def preprocess(self, frame, bgr=True):
+        """Preprocess a frame for the loaded model"""
+        return preprocess_frame(frame, self.image_size, bgr=bgr)
+
+    def _record_latency(self, elapsed):
+        """Update latency statistics"""
+        self.inference_count += 1
+        self.total_inference_time += elapsed
+        self.last_latency_ms = elapsed * 1000
+
+    def predict(self, batch):
+        """Run the backend on a preprocessed batch and record latency"""
+        with self._lock:
+            start = time.perf_counter()
+            predictions = self.backend.predict(batch)
+            self._record_latency(time.perf_counter() - start)
+        return predictions
+
+    def predict_frame(self, frame, bgr=True):
+        """Preprocess a frame straight into the backend's input buffer and run it"""
+        def fill(out, scale, offset):
+            self.preprocessor.process(frame, out, bgr=bgr, scale=scale, offset=offset)
+
+        with self._lock:
+            start = time.perf_counter()
+            predictions = self.backend.predict_frame(fill)
+            self._record_latency(time.perf_counter() - start)
+        return predictions
+
+    def predict_frames(self, frames, bgr=True):
+        """Preprocess several frames into one batch and run them in a single backend call"""
+        with self._lock:
+            count = len(frames)
+            if self._batch_buffer is None or len(self._batch_buffer) < count:
+                self._batch_buffer = np.zeros((count, *self.image_size, 3), dtype=np.float32)
+            batch = self._batch_buffer[:count]
+            for frame, out in zip(frames, batch):
+                self.preprocessor.process(frame, out, bgr=bgr)
+
+            start = time.perf_counter()
+            predictions = self.backend.predict(batch)
+            self._record_latency(time.perf_counter() - start)
+        return predictions
+
+    def class_name(self, class_id):
+        """Get the class name for a class index"""
+        if self.class_mapping is None:
+            return f"Class {class_id}"
+        return self.class_mapping.get(str(class_id), f"Class {class_id}")
+
+    def sort_category(self, class_id):
+        """Map a class index to a sort category: Can, Recycling or Garbage"""
+        if self.class_mapping is not None:
+            class_name = self.class_name(class_id).lower()
+            if "can" in class_name:
+                return "Can"
+            elif "recycling" in class_name:
+                return "Recycling"
+            return "Garbage"
+
+        # Pre-trained model: use ImageNet class lists
+        if class_id in IMAGENET_CAN_CLASSES:
+            return "Can"
+        elif class_id in IMAGENET_RECYCLABLE_CLASSES:
+            return "Recycling"
+        return "Garbage"
+
+    def category_probabilities(self, probabilities):
+        """Sum class probabilities into the Can, Recycling and Garbage categories"""
+        if self._category_indices is None or self._category_indices[1] != len(probabilities):
+            categories = np.array([self.sort_category(i) for i in range(len(probabilities))])
+            indices = {category: np.flatnonzero(categories == category) for category in SORT_CATEGORIES}
+            self._category_indices = (indices, len(probabilities))
+
+        indices = self._category_indices[0]
+        return {category: float(probabilities[idx].sum()) for category, idx in indices.items()}
+
+    def interpret(self, probabilities, calibrate=True):
+        """Build a classification result from one row of class probabilities
+
+        With a calibration loaded the probabilities are temperature-scaled
+        first, and the class's fitted confidence threshold (if any) is
+        returned as "threshold" for the decision policy.
+        """
+        threshold = None
+        if calibrate and self.calibration is not None:
+            probabilities = self.calibration.apply(probabilities)
+
+        class_id = int(np.argmax(probabilities))
+        if calibrate and self.calibration is not None:
+            threshold = self.calibration.threshold(class_id)
+
+        return {
+            "class_id": class_id,
+            "class_name": self.class_name(class_id),
+            "confidence": float(probabilities[class_id]),
+            "sort_as": self.sort_category(class_id),
+            "probabilities": probabilities,
+            "category_probabilities": self.category_probabilities(probabilities),
+            "threshold": threshold
+        }
+
+    def classify(self, frame, bgr=True):
+        """Preprocess and classify a single frame"""
+        predictions = self.predict_frame(frame, bgr=bgr)
+        result = self.interpret(predictions[0])
+        result["latency_ms"] = self.last_latency_ms
+        return result
+
+    def classify_frames(self, frames, bgr=True):
+        """Classify several frames with one batched forward pass"""
+        predictions = self.predict_frames(frames, bgr=bgr)
+        results = []
+        for row in predictions:
+            result = self.interpret(row)
+            result["latency_ms"] = self.last_latency_ms
+            result["batch_size"] = len(frames)
+            results.append(result)
+        return results
+
+    def get_stats(self):
+        """Get inference latency statistics"""
+        mean_ms = 0.0
+        if self.inference_count:
+            mean_ms = self.total_inference_time / self.inference_count * 1000
+        return {
+            "backend": self.backend.name,
+            "inferences": self.inference_count,
+            "mean_latency_ms": mean_ms,
+            "last_latency_ms": self.last_latency_ms
+        }
@@ -61,16 +61,65 @@ class SortingDatabase:
         )
         ''')
         
+        # Shadow evaluations table - candidate model agreement with production, per interval
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shadow_evaluations (
+            id TEXT PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            candidate_model TEXT NOT NULL,
+            production_model TEXT NOT NULL,
+            frames_evaluated INTEGER DEFAULT 0,
+            class_agreements INTEGER DEFAULT 0,
+            sort_agreements INTEGER DEFAULT 0,
+            decisions INTEGER DEFAULT 0,
+            decision_agreements INTEGER DEFAULT 0,
+            mean_latency_ms REAL,
+            cpu_fraction REAL,
+            metadata TEXT
+        )
+        ''')
+        
+        # Reclassification results table - predictions of other models for archived images
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reclassification_results (
+            id TEXT PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            model_name TEXT NOT NULL,
+            image_id TEXT NOT NULL,
+            class_name TEXT NOT NULL,
+            sort_as TEXT NOT NULL,
+            confidence REAL NOT NULL,
+            metadata TEXT,
+            UNIQUE (model_name, image_id)
+        )
+        ''')
+        
+        # Add columns introduced after the original schema
+        self._add_missing_columns("sort_events", {"station_id": "TEXT", "model_version": "TEXT"})
+        
+        # Look up the sort event of an image without scanning the table
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_sort_events_image_id ON sort_events (image_id)")
+        
         # Commit changes
         self.conn.commit()
     
+    def _add_missing_columns(self, table, columns):
+        """Add columns to an existing table if they are missing"""
+        self.cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in self.cursor.fetchall()}
+        
+        for column, column_type in columns.items():
+            if column not in existing:
+                self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    
     def close(self):
         """Close database connection"""
         if self.conn:
             self.conn.close()
     
     # Sort Event Methods
-    def add_sort_event(self, item_type, confidence, sort_destination, image=None, user_id=None, metadata=None):
+    def add_sort_event(self, item_type, confidence, sort_destination, image=None, user_id=None, metadata=None,
+                       station_id=None, model_version=None):
         """Add a new sort event to the database"""
         event_id = str(uuid.uuid4())
         timestamp = datetime.now().isoformat()
@@ -87,9 +136,10 @@ class SortingDatabase:
         
         # Insert sort event
         self.cursor.execute(
-            "INSERT INTO sort_events (id, timestamp, item_type, confidence, sort_destination, image_id, user_id, metadata) "
-            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            (event_id, timestamp, item_type, confidence, sort_destination, image_id, user_id, metadata_json)
+            "INSERT INTO sort_events (id, timestamp, item_type, confidence, sort_destination, image_id, user_id, "
+            "metadata, station_id, model_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (event_id, timestamp, item_type, confidence, sort_destination, image_id, user_id, metadata_json,
+             station_id, model_version)
         )
         
         # Update statistics
@@ -215,6 +265,108 @@ class SortingDatabase:
         
         return None
     
+    def count_images(self):
+        """Number of stored images"""
+        self.cursor.execute("SELECT COUNT(*) FROM images")
+        return self.cursor.fetchone()[0]
+    
+    def get_image_blobs(self, after_rowid=0, limit=256, skip_model=None):
+        """Get a chunk of encoded images in storage order
+        
+        Returns (rowid, image_id, image_data, item_type) tuples, where
+        item_type is what the image was originally sorted as (None for
+        images without a sort event). Pass the last rowid of a chunk as
+        after_rowid to get the next one. With skip_model, images that
+        model has already been scored on are left out.
+        """
+        query = (
+            "SELECT i.rowid, i.id, i.image_data, "
+            "(SELECT e.item_type FROM sort_events e WHERE e.image_id = i.id LIMIT 1) "
+            "FROM images i WHERE i.rowid > ?"
+        )
+        params = [after_rowid]
+        if skip_model is not None:
+            query += (" AND NOT EXISTS (SELECT 1 FROM reclassification_results r "
+                      "WHERE r.model_name = ? AND r.image_id = i.id)")
+            params.append(skip_model)
+        query += " ORDER BY i.rowid LIMIT ?"
+        params.append(limit)
+        
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
+    
+    # Reclassification Methods
+    def add_reclassification_results(self, model_name, results):
+        """Store a model's predictions for archived images, replacing earlier ones
+        
+        results is a list of dicts with image_id, class_name, sort_as,
+        confidence and an optional metadata dict.
+        """
+        timestamp = datetime.now().isoformat()
+        rows = [
+            (str(uuid.uuid4()), timestamp, model_name, result["image_id"], result["class_name"],
+             result["sort_as"], result["confidence"],
+             json.dumps(result["metadata"]) if result.get("metadata") else None)
+            for result in results
+        ]
+        self.cursor.executemany(
+            "INSERT OR REPLACE INTO reclassification_results (id, timestamp, model_name, image_id, class_name, "
+            "sort_as, confidence, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        self.conn.commit()
+        return len(rows)
+    
+    def get_reclassification_summary(self, model_name=None):
+        """Get per-model counts and agreement with the original sort decisions"""
+        query = """
+            SELECT 
+                r.model_name,
+                COUNT(*) as images,
+                AVG(r.confidence) as mean_confidence,
+                SUM(CASE WHEN r.sort_as = 'Can' THEN 1 ELSE 0 END) as can_count,
+                SUM(CASE WHEN r.sort_as = 'Recycling' THEN 1 ELSE 0 END) as recycling_count,
+                SUM(CASE WHEN r.sort_as = 'Garbage' THEN 1 ELSE 0 END) as garbage_count,
+                SUM(CASE WHEN e.item_type IS NOT NULL THEN 1 ELSE 0 END) as sorted_images,
+                SUM(CASE WHEN LOWER(r.sort_as) = e.item_type THEN 1 ELSE 0 END) as agreements,
+                MAX(r.timestamp) as last_run
+            FROM reclassification_results r
+            LEFT JOIN sort_events e ON e.image_id = r.image_id
+        """
+        params = []
+        if model_name is not None:
+            query += " WHERE r.model_name = ?"
+            params.append(model_name)
+        query += " GROUP BY r.model_name ORDER BY last_run DESC"
+        self.cursor.execute(query, params)
+        
+        columns = [column[0] for column in self.cursor.description]
+        summary = []
+        
+        for row in self.cursor.fetchall():
+            row_dict = dict(zip(columns, row))
+            sorted_images = row_dict["sorted_images"] or 0
+            row_dict["agreement"] = row_dict["agreements"] / sorted_images if sorted_images else 0.0
+            summary.append(row_dict)
+        
+        return summary
+    
+    def get_reclassification_differences(self, model_name, other_model, limit=None):
+        """Get images two models sort differently, as (image_id, sort_as, other_sort_as, confidence) rows"""
+        query = """
+            SELECT a.image_id, a.sort_as, b.sort_as, a.confidence
+            FROM reclassification_results a
+            JOIN reclassification_results b ON b.image_id = a.image_id AND b.model_name = ?
+            WHERE a.model_name = ? AND a.sort_as != b.sort_as
+            ORDER BY a.confidence DESC
+        """
+        params = [other_model, model_name]
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
+    
     # Statistics Methods
     def _update_statistics(self, item_type):
         """Update daily statistics based on sort event"""
@@ -298,6 +450,66 @@ class SortingDatabase:
             "grand_total": 0
         }
     
+    # Shadow Evaluation Methods
+    def add_shadow_evaluation(self, stats):
+        """Store one interval of shadow model statistics (see ShadowEvaluator.get_stats)"""
+        evaluation_id = str(uuid.uuid4())
+        timestamp = datetime.now().isoformat()
+        
+        metadata = {
+            "frames_offered": stats["frames_offered"],
+            "skipped_sample": stats["skipped_sample"],
+            "skipped_budget": stats["skipped_budget"],
+            "skipped_latency": stats["skipped_latency"]
+        }
+        
+        self.cursor.execute(
+            "INSERT INTO shadow_evaluations (id, timestamp, candidate_model, production_model, frames_evaluated, "
+            "class_agreements, sort_agreements, decisions, decision_agreements, mean_latency_ms, cpu_fraction, "
+            "metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (evaluation_id, timestamp, stats["candidate_model"], stats["production_model"],
+             stats["frames_evaluated"], stats["class_agreements"], stats["sort_agreements"],
+             stats["decisions"], stats["decision_agreements"], stats["mean_latency_ms"],
+             stats["cpu_fraction"], json.dumps(metadata))
+        )
+        self.conn.commit()
+        
+        return evaluation_id
+    
+    def get_shadow_summary(self):
+        """Get agreement rates per candidate and production model across all intervals"""
+        self.cursor.execute("""
+            SELECT 
+                candidate_model,
+                production_model,
+                SUM(frames_evaluated) as frames,
+                SUM(class_agreements) as class_agreements,
+                SUM(sort_agreements) as sort_agreements,
+                SUM(decisions) as decisions,
+                SUM(decision_agreements) as decision_agreements,
+                SUM(mean_latency_ms * frames_evaluated) as total_latency_ms,
+                MIN(timestamp) as first_seen,
+                MAX(timestamp) as last_seen
+            FROM shadow_evaluations
+            GROUP BY candidate_model, production_model
+            ORDER BY last_seen DESC
+        """)
+        
+        columns = [column[0] for column in self.cursor.description]
+        summary = []
+        
+        for row in self.cursor.fetchall():
+            row_dict = dict(zip(columns, row))
+            frames = row_dict["frames"] or 0
+            decisions = row_dict["decisions"] or 0
+            row_dict["class_agreement"] = row_dict["class_agreements"] / frames if frames else 0.0
+            row_dict["sort_agreement"] = row_dict["sort_agreements"] / frames if frames else 0.0
+            row_dict["decision_agreement"] = row_dict["decision_agreements"] / decisions if decisions else 0.0
+            row_dict["mean_latency_ms"] = row_dict.pop("total_latency_ms") / frames if frames else 0.0
+            summary.append(row_dict)
+        
+        return summary
+    
     # Backup and Restore
     def backup_database(self, backup_path="./data/backup"):
         """Backup database to JSON files"""
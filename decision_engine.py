@@ -0,0 +1,261 @@
+# decision_engine.py - Sort decision policies for auto-sort mode
+import math
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger("WasteSorter")
+
+# Policies selectable from the command line
+DECISION_POLICIES = ["timer", "sprt", "ema"]
+
+
+class DecisionPolicy:
+    """Base class for auto-sort decision policies
+
+    A policy receives one classification result per analysed frame (see
+    ClassifierEngine.interpret) and returns a decision once it has seen
+    enough evidence to sort the item, otherwise None.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        """Initialize decision statistics"""
+        self.decisions = 0
+        self.total_decision_time = 0.0
+        self.total_decision_frames = 0
+        self.reset()
+
+    def reset(self):
+        """Forget all evidence about the current item"""
+        self.first_frame_time = None
+        self.frames = 0
+
+    def update(self, result, timestamp=None):
+        """Add evidence from one frame; returns a decision dict or None"""
+        timestamp = timestamp if timestamp is not None else time.time()
+        if self.first_frame_time is None:
+            self.first_frame_time = timestamp
+        self.frames += 1
+
+        decision = self._update(result, timestamp)
+        if decision is None:
+            return None
+
+        return self._commit(decision[0], decision[1], timestamp)
+
+    def _update(self, result, timestamp):
+        """Policy-specific update; returns (sort_as, confidence) or None"""
+        raise NotImplementedError
+
+    def _commit(self, sort_as, confidence, timestamp):
+        """Build the decision, record time-to-decision and reset for the next item"""
+        time_to_decision = timestamp - self.first_frame_time
+        decision = {
+            "sort_as": sort_as,
+            "confidence": confidence,
+            "policy": self.name,
+            "frames": self.frames,
+            "time_to_decision": time_to_decision
+        }
+
+        self.decisions += 1
+        self.total_decision_time += time_to_decision
+        self.total_decision_frames += self.frames
+
+        logger.info(f"Decision ({self.name}): {sort_as} with {confidence:.2%} confidence "
+                    f"after {time_to_decision:.2f}s and {self.frames} frames "
+                    f"(mean {self.mean_decision_time:.2f}s over {self.decisions} items)")
+
+        self.reset()
+        return decision
+
+    @property
+    def mean_decision_time(self):
+        """Mean time-to-decision in seconds over all committed items"""
+        return self.total_decision_time / self.decisions if self.decisions else 0.0
+
+    def get_stats(self):
+        """Get decision statistics"""
+        return {
+            "policy": self.name,
+            "decisions": self.decisions,
+            "mean_time_to_decision": self.mean_decision_time,
+            "mean_frames": self.total_decision_frames / self.decisions if self.decisions else 0.0
+        }
+
+
+class TimerPolicy(DecisionPolicy):
+    """Sort once the same class has stayed above a confidence threshold for a fixed time
+
+    This is the original auto-sort behaviour (0.90 for 4 seconds). When the
+    result carries a calibrated per-class threshold it replaces the fixed one.
+    """
+
+    name = "timer"
+
+    def __init__(self, threshold=0.90, hold_time=4.0):
+        """Initialize the policy"""
+        self.threshold = threshold
+        self.hold_time = hold_time
+        self.timer_resets = 0
+        super().__init__()
+
+    def reset(self):
+        """Forget all evidence about the current item"""
+        super().reset()
+        self._reset_timer()
+
+    def _reset_timer(self):
+        """Stop the confidence timer; the item's first frame and frame count are kept"""
+        self.current_classification = None
+        self.last_high_confidence_time = None
+
+    def _update(self, result, timestamp):
+        """Track how long the current classification has stayed confident"""
+        sort_as = result["sort_as"]
+        confidence = result["confidence"]
+        threshold = result.get("threshold") or self.threshold
+
+        if confidence < threshold:
+            # Confidence dropped below threshold, reset timer
+            if self.last_high_confidence_time is not None:
+                self.timer_resets += 1
+            self._reset_timer()
+            return None
+
+        if self.current_classification != sort_as:
+            # New classification detected, restart timer
+            if self.last_high_confidence_time is not None:
+                self.timer_resets += 1
+            self.current_classification = sort_as
+            self.last_high_confidence_time = timestamp
+            return None
+
+        if timestamp - self.last_high_confidence_time >= self.hold_time:
+            return sort_as, confidence
+        return None
+
+    def get_stats(self):
+        """Get decision statistics, including how often a running timer was reset"""
+        stats = super().get_stats()
+        stats["timer_resets"] = self.timer_resets
+        return stats
+
+
+class SPRTPolicy(DecisionPolicy):
+    """Multi-hypothesis sequential probability ratio test over sort categories
+
+    Per-frame category probabilities are treated as likelihoods and summed
+    in log space over a sliding window. The item is sorted as soon as the
+    posterior of the leading category reaches 1 - error_rate. Consecutive
+    frames are strongly correlated, so each frame's evidence is scaled by
+    frame_weight to avoid overconfidence.
+    """
+
+    name = "sprt"
+
+    def __init__(self, error_rate=0.01, min_frames=2, window=30, frame_weight=0.5):
+        """Initialize the policy"""
+        self.error_rate = error_rate
+        self.min_frames = min_frames
+        self.window = window
+        self.frame_weight = frame_weight
+        super().__init__()
+
+    def reset(self):
+        """Forget all evidence about the current item"""
+        super().reset()
+        self.evidence = deque(maxlen=self.window)
+
+    def posterior(self):
+        """Posterior probability of each category given the evidence window"""
+        totals = {}
+        for frame_log_probs in self.evidence:
+            for category, log_prob in frame_log_probs.items():
+                totals[category] = totals.get(category, 0.0) + log_prob
+
+        if not totals:
+            return {}
+
+        # Normalize in log space (uniform prior)
+        max_log = max(totals.values())
+        exp_totals = {category: math.exp(value - max_log) for category, value in totals.items()}
+        norm = sum(exp_totals.values())
+        return {category: value / norm for category, value in exp_totals.items()}
+
+    def _update(self, result, timestamp):
+        """Accumulate log-likelihoods and test the leading category"""
+        self.evidence.append({
+            category: self.frame_weight * math.log(max(prob, 1e-9))
+            for category, prob in result["category_probabilities"].items()
+        })
+
+        if len(self.evidence) < self.min_frames:
+            return None
+
+        posterior = self.posterior()
+        sort_as = max(posterior, key=posterior.get)
+        if posterior[sort_as] >= 1.0 - self.error_rate:
+            return sort_as, posterior[sort_as]
+        return None
+
+
+class EMAMarginPolicy(DecisionPolicy):
+    """Sort when the exponential moving average of the leading category beats the runner-up by a margin"""
+
+    name = "ema"
+
+    def __init__(self, alpha=0.4, margin=0.6, min_frames=3):
+        """Initialize the policy"""
+        self.alpha = alpha
+        self.margin = margin
+        self.min_frames = min_frames
+        super().__init__()
+
+    def reset(self):
+        """Forget all evidence about the current item"""
+        super().reset()
+        self.average = None
+
+    def _update(self, result, timestamp):
+        """Update the moving average and test the margin"""
+        probabilities = result["category_probabilities"]
+
+        if self.average is None:
+            self.average = dict(probabilities)
+        else:
+            for category, prob in probabilities.items():
+                previous = self.average.get(category, 0.0)
+                self.average[category] = self.alpha * prob + (1 - self.alpha) * previous
+
+        if self.frames < self.min_frames:
+            return None
+
+        ranked = sorted(self.average.items(), key=lambda item: item[1], reverse=True)
+        top_category, top_prob = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if top_prob - runner_up >= self.margin:
+            return top_category, top_prob
+        return None
+
+
+def create_decision_policy(name="timer", error_rate=None, **kwargs):
+    """Create a decision policy by name
+
+    error_rate sets the SPRT error bound; for the EMA policy it is turned
+    into the equivalent margin (1 - 2 * error_rate).
+    """
+    if name == "timer":
+        return TimerPolicy(**kwargs)
+    if name == "sprt":
+        if error_rate is not None:
+            kwargs["error_rate"] = error_rate
+        return SPRTPolicy(**kwargs)
+    if name == "ema":
+        if error_rate is not None:
+            kwargs["margin"] = max(0.0, 1.0 - 2 * error_rate)
+        return EMAMarginPolicy(**kwargs)
+
+    raise ValueError(f"Unknown decision policy: {name}")
@@ -0,0 +1,379 @@
+# embedding_index.py - Similarity search over embeddings of the archived images
+import os
+import time
+import argparse
+import logging
+import numpy as np
+
+logger = logging.getLogger("WasteSorter")
+
+DEFAULT_INDEX_PATH = os.path.join("data", "embedding_index.npz")
+
+
+def feature_model(model_path=None, image_size=(224, 224)):
+    """Keras model that outputs the pooled MobileNetV2 features before the dense head
+
+    With a model trained by WasteClassifierTrainer the output of its
+    GlobalAveragePooling2D layer is used, so the embedding reflects the
+    fine-tuned features; without one, the ImageNet MobileNetV2.
+    """
+    import tensorflow as tf
+
+    if model_path is None or not os.path.exists(model_path):
+        return tf.keras.applications.MobileNetV2(input_shape=(*image_size, 3), include_top=False,
+                                                 weights='imagenet', pooling='avg')
+
+    model = tf.keras.models.load_model(model_path)
+    pooling = [layer for layer in model.layers if isinstance(layer, tf.keras.layers.GlobalAveragePooling2D)]
+    if not pooling:
+        raise ValueError(f"No pooled feature layer in {model_path}")
+    return tf.keras.Model(inputs=model.input, outputs=pooling[-1].output)
+
+
+def load_feature_engine(model_path=None, image_size=(224, 224)):
+    """ClassifierEngine whose predictions are embeddings, so frames go through the app's preprocessing"""
+    from classifier_engine import ClassifierEngine
+    from model_backends import KerasBackend
+
+    engine = ClassifierEngine(KerasBackend(model=feature_model(model_path, image_size)))
+    engine.warmup()
+    return engine
+
+
+class EmbeddingIndex:
+    """Array-backed index of L2-normalised embeddings searched with NumPy
+
+    Embeddings are optionally reduced with PCA to `dims` components (fitted
+    on the first items added) and normalised, so cosine similarity is a
+    single matrix-vector product. At 256 dimensions, 100k items take 100 MB
+    in memory (half that on disk as float16) and a top-k search takes a
+    few milliseconds.
+
+    Each item keeps its image id and a label (the item type it was
+    originally sorted as, if any).
+    """
+
+    def __init__(self, dims=256, model_name=None):
+        """Create an empty index"""
+        self.dims = dims
+        self.model_name = model_name
+        self.mean = None
+        self.components = None
+        self.last_rowid = 0
+
+        self.ids = []
+        self.labels = []
+        self._chunks = []
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._positions = None
+
+    def __len__(self):
+        """Number of indexed items"""
+        return len(self.ids)
+
+    @property
+    def fitted(self):
+        """Whether the projection is known (or not needed)"""
+        return self.dims is None or self.components is not None
+
+    def fit_projection(self, embeddings):
+        """Fit the PCA projection on a sample of raw embeddings"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self.dims is None or self.dims >= embeddings.shape[1] or len(embeddings) < self.dims:
+            # Too few samples for a stable projection: keep the full features
+            self.dims = None
+            return
+
+        self.mean = embeddings.mean(axis=0)
+        # Right singular vectors are the principal directions
+        _, _, vt = np.linalg.svd(embeddings - self.mean, full_matrices=False)
+        self.components = vt[:self.dims].T.astype(np.float32)
+        logger.info(f"Fitted a {embeddings.shape[1]} -> {self.dims} projection on {len(embeddings)} embeddings")
+
+    def project(self, embeddings):
+        """Reduce and L2-normalise raw embeddings"""
+        vectors = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        if self.components is not None:
+            vectors = (vectors - self.mean) @ self.components
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add(self, ids, embeddings, labels=None):
+        """Add raw embeddings for a list of image ids"""
+        if not self.fitted:
+            self.fit_projection(embeddings)
+        self._chunks.append(self.project(embeddings))
+        self.ids.extend(ids)
+        self.labels.extend(labels if labels is not None else [""] * len(ids))
+        self._positions = None
+
+    @property
+    def vectors(self):
+        """All indexed vectors as one (N, D) array"""
+        if self._chunks:
+            # Appended chunks are merged on first use instead of on every add
+            arrays = [self._vectors] + self._chunks if len(self._vectors) else self._chunks
+            self._vectors = np.concatenate(arrays)
+            self._chunks = []
+        return self._vectors
+
+    def position(self, image_id):
+        """Row of an image id in the index"""
+        if self._positions is None:
+            self._positions = {image_id: i for i, image_id in enumerate(self.ids)}
+        if image_id not in self._positions:
+            raise KeyError(f"Image not in the index: {image_id}")
+        return self._positions[image_id]
+
+    def _top_k(self, scores, k):
+        """Indices of the k highest scores, best first"""
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def search_vector(self, vector, k=10, exclude=None):
+        """Nearest items to a projected vector as (image_id, similarity, label) tuples"""
+        if not len(self):
+            return []
+        scores = self.vectors @ vector
+        if exclude is not None:
+            scores[exclude] = -np.inf
+        return [(self.ids[i], float(scores[i]), self.labels[i]) for i in self._top_k(scores, k)
+                if np.isfinite(scores[i])]
+
+    def search(self, embedding, k=10):
+        """Nearest items to a raw embedding, e.g. of a live frame"""
+        return self.search_vector(self.project(embedding)[0], k)
+
+    def similar_to(self, image_id, k=10):
+        """Nearest items to an indexed image, excluding the image itself"""
+        i = self.position(image_id)
+        return self.search_vector(self.vectors[i], k, exclude=i)
+
+    def find_duplicates(self, threshold=0.97, window=50):
+        """Pairs of near-identical items as (image_id, image_id, similarity) tuples
+
+        Duplicate captures of one item are stored close together, so each
+        item is only compared with the next `window` items in storage order
+        (pass None to compare every pair).
+        """
+        vectors = self.vectors
+        count = len(vectors)
+        pairs = []
+        block = 1024
+        for start in range(0, count, block):
+            stop = min(start + block, count)
+            end = count if window is None else min(stop + window, count)
+            scores = vectors[start:stop] @ vectors[start:end].T
+            rows, cols = np.nonzero(scores >= threshold)
+            for row, col in zip(rows, cols):
+                i, j = start + row, start + col
+                if j > i and (window is None or j - i <= window):
+                    pairs.append((self.ids[i], self.ids[j], float(scores[row, col])))
+        return pairs
+
+    def hard_examples(self, k=10, limit=100):
+        """Items whose nearest neighbours mostly carry a different label
+
+        Returns (image_id, label, disagreement) tuples, most disputed first.
+        These are the images worth reviewing and adding to the training set.
+        """
+        vectors = self.vectors
+        labels = np.array(self.labels)
+        labelled = np.flatnonzero(labels != "")
+        results = []
+        block = 512
+        for start in range(0, len(labelled), block):
+            rows = labelled[start:start + block]
+            scores = vectors[rows] @ vectors[labelled].T
+            scores[np.arange(len(rows)), start + np.arange(len(rows))] = -np.inf
+            kk = min(k, len(labelled) - 1)
+            if kk <= 0:
+                break
+            neighbours = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            disagreement = (labels[labelled][neighbours] != labels[rows][:, None]).mean(axis=1)
+            results.extend(zip(rows, disagreement))
+
+        results.sort(key=lambda r: -r[1])
+        return [(self.ids[i], self.labels[i], float(d)) for i, d in results[:limit] if d > 0]
+
+    def save(self, path=DEFAULT_INDEX_PATH):
+        """Write the index to an .npz file (vectors stored as float16)"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = path + ".tmp.npz"
+        np.savez(
+            temp_path,
+            ids=np.array(self.ids, dtype=str),
+            labels=np.array(self.labels, dtype=str),
+            vectors=self.vectors.astype(np.float16),
+            mean=self.mean if self.mean is not None else np.empty(0, dtype=np.float32),
+            components=self.components if self.components is not None else np.empty((0, 0), dtype=np.float32),
+            dims=np.array(-1 if self.dims is None else self.dims),
+            model_name=np.array(self.model_name or ""),
+            last_rowid=np.array(self.last_rowid)
+        )
+        os.replace(temp_path, path)
+        logger.info(f"Saved embedding index with {len(self)} items to {path}")
+
+    @classmethod
+    def load(cls, path=DEFAULT_INDEX_PATH):
+        """Load an index saved by save()"""
+        data = np.load(path)
+        dims = int(data["dims"])
+        index = cls(None if dims < 0 else dims, str(data["model_name"]) or None)
+        if data["components"].size:
+            index.mean = data["mean"]
+            index.components = data["components"]
+        index.last_rowid = int(data["last_rowid"])
+        index.ids = [str(i) for i in data["ids"]]
+        index.labels = [str(label) for label in data["labels"]]
+        index._vectors = data["vectors"].astype(np.float32)
+        return index
+
+
+def build_index(db, engine, index, chunk_size=256, batch_size=64, workers=None, fit_samples=5000):
+    """Embed the archived images that are not in the index yet
+
+    Reuses the archive streaming of reclassify_archive: blobs are read in
+    chunks after the index's last rowid, decoded in a process pool and
+    embedded in batches. The projection is fitted on the first
+    fit_samples embeddings of a new index.
+    """
+    import multiprocessing
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    from reclassify_archive import decode_chunk, init_worker
+
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    added = 0
+    exhausted = False
+    pending = deque()
+    buffered = []
+    start = time.perf_counter()
+
+    def flush(force=False):
+        """Add buffered embeddings once enough are collected to fit the projection"""
+        nonlocal buffered, added
+        count = sum(len(ids) for ids, _, _ in buffered)
+        if not buffered or (not index.fitted and count < fit_samples and not force):
+            return
+        if not index.fitted:
+            index.fit_projection(np.concatenate([e for _, e, _ in buffered]))
+        for ids, embeddings, labels in buffered:
+            index.add(ids, embeddings, labels)
+            added += len(ids)
+        buffered = []
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker) as executor:
+        while True:
+            while not exhausted and len(pending) < workers * 2:
+                rows = db.get_image_blobs(index.last_rowid, chunk_size)
+                if not rows:
+                    exhausted = True
+                    break
+                index.last_rowid = rows[-1][0]
+                pending.append(([row[1] for row in rows], [row[3] or "" for row in rows],
+                                executor.submit(decode_chunk, [row[2] for row in rows], engine.image_size)))
+
+            if not pending:
+                break
+
+            image_ids, labels, future = pending.popleft()
+            frames, ok = future.result()
+            valid = np.flatnonzero(ok)
+            if len(valid):
+                embeddings = np.concatenate([
+                    engine.predict_frames(frames[valid[i:i + batch_size]], bgr=True)
+                    for i in range(0, len(valid), batch_size)
+                ])
+                buffered.append(([image_ids[i] for i in valid], embeddings, [labels[i] for i in valid]))
+                flush()
+
+            embedded = added + sum(len(ids) for ids, _, _ in buffered)
+            print(f"{embedded} images embedded ({embedded / (time.perf_counter() - start):.0f}/s)")
+
+    flush(force=True)
+    return added
+
+
+def main():
+    """Build and query the index from the command line"""
+    parser = argparse.ArgumentParser(description='Embedding index over the archived images')
+    parser.add_argument('--index', type=str, default=DEFAULT_INDEX_PATH, help='Index file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Embed archived images not yet in the index')
+    build_parser.add_argument('--db', type=str, default='./data/sorting_data.db', help='Sorting database')
+    build_parser.add_argument('--model_path', type=str, default=os.path.join('models', 'latest_model.h5'),
+                              help='Trained Keras model whose pooled features are used (ImageNet if missing)')
+    build_parser.add_argument('--image_size', type=int, default=224,
+                              help='Input size for the ImageNet feature model (square)')
+    build_parser.add_argument('--dims', type=int, default=256,
+                              help='PCA dimensions of the stored embeddings (0 keeps the full features)')
+    build_parser.add_argument('--rebuild', action='store_true', help='Start a new index')
+    build_parser.add_argument('--workers', type=int, default=None, help='Decode processes')
+    build_parser.add_argument('--chunk_size', type=int, default=256, help='Images read at a time')
+    build_parser.add_argument('--batch_size', type=int, default=64, help='Images per inference batch')
+
+    similar_parser = subparsers.add_parser('similar', help='Find images similar to an archived image')
+    similar_parser.add_argument('image_id', type=str)
+    similar_parser.add_argument('-k', type=int, default=10, help='Number of results')
+
+    duplicates_parser = subparsers.add_parser('duplicates', help='Find near-duplicate captures')
+    duplicates_parser.add_argument('--threshold', type=float, default=0.97, help='Minimum cosine similarity')
+    duplicates_parser.add_argument('--window', type=int, default=50,
+                                   help='Compare each image with this many following images (0 for all pairs)')
+
+    hard_parser = subparsers.add_parser('hard', help='List images whose neighbours were sorted differently')
+    hard_parser.add_argument('-k', type=int, default=10, help='Neighbours per image')
+    hard_parser.add_argument('--limit', type=int, default=50, help='Number of results')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from database import SortingDatabase
+
+        model_name = os.path.basename(args.model_path) if os.path.exists(args.model_path) else "imagenet"
+        if os.path.exists(args.index) and not args.rebuild:
+            index = EmbeddingIndex.load(args.index)
+            if index.model_name != model_name:
+                print(f"The index was built with {index.model_name}; use --rebuild to switch to {model_name}")
+                return
+        else:
+            index = EmbeddingIndex(args.dims or None, model_name)
+
+        engine = load_feature_engine(args.model_path, (args.image_size, args.image_size))
+        db = SortingDatabase(args.db)
+        try:
+            added = build_index(db, engine, index, chunk_size=args.chunk_size, batch_size=args.batch_size,
+                                workers=args.workers)
+        finally:
+            db.close()
+        index.save(args.index)
+        print(f"Added {added} images; the index holds {len(index)}")
+        return
+
+    index = EmbeddingIndex.load(args.index)
+
+    if args.command == 'similar':
+        start = time.perf_counter()
+        results = index.similar_to(args.image_id, args.k)
+        print(f"{len(results)} results in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for image_id, similarity, label in results:
+            print(f"  {image_id}  {similarity:.3f}  {label}")
+
+    elif args.command == 'duplicates':
+        pairs = index.find_duplicates(args.threshold, args.window or None)
+        print(f"{len(pairs)} near-duplicate pairs")
+        for first, second, similarity in pairs:
+            print(f"  {first}  {second}  {similarity:.3f}")
+
+    elif args.command == 'hard':
+        for image_id, label, disagreement in index.hard_examples(args.k, args.limit):
+            print(f"  {image_id}  {label:<10} {disagreement:.0%} of neighbours differ")
+
+
+if __name__ == "__main__":
+    main()
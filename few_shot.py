@@ -0,0 +1,312 @@
+# few_shot.py - Few-shot classifier: nearest centroid or k-NN on frozen MobileNetV2 features
+import os
+import glob
+import time
+import argparse
+import logging
+import numpy as np
+
+from embedding_index import feature_model
+
+logger = logging.getLogger("WasteSorter")
+
+DEFAULT_FEW_SHOT_PATH = os.path.join("models", "few_shot.npz")
+
+# Ways of turning similarities into class probabilities
+FEW_SHOT_METHODS = ["centroid", "knn"]
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def _normalize(vectors):
+    """L2-normalise the rows of an array"""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class FewShotClassifier:
+    """Labelled example embeddings and the classes they define
+
+    Adding a class only stores the embeddings of its examples, so it takes
+    as long as a forward pass over a handful of images. Class names follow
+    the trainer's folder convention: names containing "can" or "recycling"
+    sort into those categories, anything else is Garbage.
+
+    - centroid: cosine similarity to each class's mean embedding
+    - knn: similarity-weighted vote of the k most similar examples
+    Similarities become probabilities through a softmax with `scale`.
+    """
+
+    def __init__(self, method="centroid", k=5, scale=20.0, feature_model_path=None, image_size=(224, 224)):
+        """Create an empty classifier"""
+        if method not in FEW_SHOT_METHODS:
+            raise ValueError(f"Unknown few-shot method: {method}")
+
+        self.method = method
+        self.k = k
+        self.scale = scale
+        self.feature_model_path = feature_model_path
+        self.image_size = tuple(image_size)
+
+        self.class_names = []
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
+        self.labels = np.empty(0, dtype=np.int64)
+        self.centroids = None
+
+    @property
+    def class_mapping(self):
+        """Class mapping in the class_mapping.json layout"""
+        return {str(i): name for i, name in enumerate(self.class_names)}
+
+    def add_embeddings(self, class_name, embeddings):
+        """Add example embeddings for a class, creating the class if it is new"""
+        embeddings = _normalize(embeddings)
+        if class_name not in self.class_names:
+            self.class_names.append(class_name)
+        label = self.class_names.index(class_name)
+
+        if self.embeddings.size:
+            self.embeddings = np.concatenate([self.embeddings, embeddings])
+        else:
+            self.embeddings = embeddings
+        self.labels = np.concatenate([self.labels, np.full(len(embeddings), label, dtype=np.int64)])
+        self._update_centroids()
+
+    def remove_class(self, class_name):
+        """Remove a class and its examples"""
+        label = self.class_names.index(class_name)
+        keep = self.labels != label
+        self.embeddings = self.embeddings[keep]
+        self.labels = self.labels[keep]
+        # Later classes move down one index
+        self.labels[self.labels > label] -= 1
+        del self.class_names[label]
+        self._update_centroids()
+
+    def _update_centroids(self):
+        """Recompute the normalised mean embedding of every class"""
+        if not self.class_names:
+            self.centroids = None
+            return
+        self.centroids = _normalize(np.stack([
+            self.embeddings[self.labels == label].mean(axis=0) for label in range(len(self.class_names))
+        ]))
+
+    def predict_embeddings(self, embeddings):
+        """Class probabilities for a batch of raw embeddings"""
+        if self.centroids is None:
+            raise ValueError("The few-shot classifier has no classes")
+
+        embeddings = _normalize(embeddings)
+        num_classes = len(self.class_names)
+
+        if self.method == "centroid":
+            logits = self.scale * (embeddings @ self.centroids.T)
+        else:
+            similarity = embeddings @ self.embeddings.T
+            k = min(self.k, similarity.shape[1])
+            neighbours = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+            weights = np.exp(self.scale * (np.take_along_axis(similarity, neighbours, axis=1) - 1.0))
+            votes = np.zeros((len(embeddings), num_classes), dtype=np.float32)
+            np.add.at(votes, (np.arange(len(embeddings))[:, None], self.labels[neighbours]), weights)
+            logits = np.log(votes + 1e-6)
+
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return (exp / exp.sum(axis=1, keepdims=True)).astype(np.float32)
+
+    def get_stats(self):
+        """Examples per class"""
+        return {name: int(np.count_nonzero(self.labels == label)) for label, name in enumerate(self.class_names)}
+
+    def save(self, path=DEFAULT_FEW_SHOT_PATH):
+        """Save the classes and example embeddings"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(
+            path,
+            class_names=np.array(self.class_names, dtype=str),
+            embeddings=self.embeddings,
+            labels=self.labels,
+            method=np.array(self.method),
+            k=np.array(self.k),
+            scale=np.array(self.scale),
+            feature_model_path=np.array(self.feature_model_path or ""),
+            image_size=np.array(self.image_size)
+        )
+        logger.info(f"Saved few-shot classifier with {len(self.class_names)} classes to {path}")
+
+    @classmethod
+    def load(cls, path=DEFAULT_FEW_SHOT_PATH):
+        """Load a saved classifier"""
+        data = np.load(path)
+        classifier = cls(str(data["method"]), int(data["k"]), float(data["scale"]),
+                         str(data["feature_model_path"]) or None, tuple(int(v) for v in data["image_size"]))
+        classifier.class_names = [str(name) for name in data["class_names"]]
+        classifier.embeddings = data["embeddings"].astype(np.float32)
+        classifier.labels = data["labels"].astype(np.int64)
+        classifier._update_centroids()
+        return classifier
+
+
+class FewShotBackend:
+    """Inference backend that classifies frozen MobileNetV2 features with a FewShotClassifier
+
+    It has the same interface as the backends in model_backends, so a
+    ClassifierEngine around it preprocesses frames exactly like the live
+    app does for a trained model.
+    """
+
+    name = "few_shot"
+
+    def __init__(self, classifier):
+        """Build the frozen feature extractor for a classifier"""
+        from model_backends import KerasBackend
+
+        self.classifier = classifier
+        self.features = KerasBackend(model=feature_model(classifier.feature_model_path, classifier.image_size))
+        self.input_shape = self.features.input_shape
+        self.input_dtype = np.float32
+
+    def embed(self, batch):
+        """Raw embeddings for a preprocessed batch"""
+        return self.features.predict(batch)
+
+    def predict(self, batch):
+        """Class probabilities for a preprocessed batch"""
+        return self.classifier.predict_embeddings(self.features.predict(batch))
+
+    def predict_frame(self, fill):
+        """Class probabilities for one frame written by fill(out, scale, offset)"""
+        return self.classifier.predict_embeddings(self.features.predict_frame(fill))
+
+
+def create_few_shot_backend(model_dir="models", model_path=None):
+    """Load a saved few-shot classifier; returns (backend, class_mapping) like create_backend"""
+    model_path = model_path or os.path.join(model_dir, os.path.basename(DEFAULT_FEW_SHOT_PATH))
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Few-shot classifier not found: {model_path} (add classes with few_shot.py add)")
+
+    classifier = FewShotClassifier.load(model_path)
+    logger.info(f"Loaded few-shot classifier ({classifier.method}) with classes {classifier.class_names}")
+    return FewShotBackend(classifier), classifier.class_mapping
+
+
+def image_paths(sources):
+    """Image files from a list of files and directories"""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths.extend(sorted(p for p in glob.glob(os.path.join(source, "*"))
+                                if p.lower().endswith(IMAGE_EXTENSIONS)))
+        else:
+            paths.append(source)
+    return paths
+
+
+def embed_images(engine, paths, batch_size=32):
+    """Embeddings of image files through the engine's preprocessing"""
+    import cv2
+
+    frames = [frame for frame in (cv2.imread(path) for path in paths) if frame is not None]
+    if not frames:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.concatenate([engine.predict_frames(frames[i:i + batch_size], bgr=True)
+                           for i in range(0, len(frames), batch_size)])
+
+
+def main():
+    """Manage the few-shot classes from the command line"""
+    parser = argparse.ArgumentParser(description='Few-shot classifier on frozen MobileNetV2 features')
+    parser.add_argument('--path', type=str, default=DEFAULT_FEW_SHOT_PATH, help='Classifier file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help='Add labelled examples (creates the class if new)')
+    add_parser.add_argument('class_name', type=str,
+                            help='Class name; names containing "can" or "recycling" sort into those categories')
+    add_parser.add_argument('images', type=str, nargs='+', help='Image files or directories')
+    add_parser.add_argument('--method', type=str, default=None, choices=FEW_SHOT_METHODS,
+                            help='Classification method (centroid for a new classifier; '
+                                 'changes the method of an existing one)')
+    add_parser.add_argument('--k', type=int, default=None,
+                            help='Neighbours for the knn method (5 for a new classifier; changes an existing one)')
+    add_parser.add_argument('--feature_model', type=str, default=None,
+                            help='Trained .h5 model whose pooled features are used (ImageNet by default); '
+                                 'only when creating a classifier')
+
+    remove_parser = subparsers.add_parser('remove', help='Remove a class')
+    remove_parser.add_argument('class_name', type=str)
+
+    subparsers.add_parser('list', help='List classes and example counts')
+
+    evaluate_parser = subparsers.add_parser('evaluate', help='Accuracy on a folder with one subfolder per class')
+    evaluate_parser.add_argument('data_dir', type=str)
+    args = parser.parse_args()
+
+    if args.command == 'list' or args.command == 'remove':
+        classifier = FewShotClassifier.load(args.path)
+        if args.command == 'remove':
+            classifier.remove_class(args.class_name)
+            classifier.save(args.path)
+        for name, count in classifier.get_stats().items():
+            print(f"{name:<20} {count} examples")
+        return
+
+    from classifier_engine import ClassifierEngine
+
+    if os.path.exists(args.path):
+        classifier = FewShotClassifier.load(args.path)
+        # Embeddings from another extractor live in a different feature space
+        if args.command == 'add' and args.feature_model is not None and (
+                classifier.feature_model_path is None
+                or os.path.abspath(args.feature_model) != os.path.abspath(classifier.feature_model_path)):
+            parser.error(f"{args.path} uses features from {classifier.feature_model_path or 'ImageNet MobileNetV2'}, "
+                         f"not {args.feature_model}; use another --path for a classifier on other features")
+        # The stored embeddings do not depend on the method, so it can change at any time
+        if args.command == 'add' and args.method is not None and args.method != classifier.method:
+            print(f"Method changed from {classifier.method} to {args.method}")
+            classifier.method = args.method
+        if args.command == 'add' and args.k is not None and args.k != classifier.k:
+            print(f"k changed from {classifier.k} to {args.k}")
+            classifier.k = args.k
+    elif args.command == 'add':
+        classifier = FewShotClassifier(args.method or 'centroid', args.k or 5, feature_model_path=args.feature_model)
+    else:
+        print(f"Few-shot classifier not found: {args.path}")
+        return
+
+    backend = FewShotBackend(classifier)
+
+    if args.command == 'add':
+        # Embeddings only, through the same preprocessing as live frames
+        start = time.perf_counter()
+        feature_engine = ClassifierEngine(backend.features)
+        paths = image_paths(args.images)
+        embeddings = embed_images(feature_engine, paths)
+        if not len(embeddings):
+            print("No readable images")
+            return
+        classifier.add_embeddings(args.class_name, embeddings)
+        classifier.save(args.path)
+        print(f"Added {len(embeddings)} examples to '{args.class_name}' in {time.perf_counter() - start:.1f}s")
+        for name, count in classifier.get_stats().items():
+            print(f"{name:<20} {count} examples")
+
+    elif args.command == 'evaluate':
+        engine = ClassifierEngine(backend, classifier.class_mapping)
+        correct = 0
+        total = 0
+        for label, name in enumerate(classifier.class_names):
+            paths = image_paths([os.path.join(args.data_dir, name)])
+            if not paths:
+                continue
+            predictions = embed_images(engine, paths)
+            hits = int(np.count_nonzero(predictions.argmax(axis=1) == label))
+            print(f"{name:<20} {hits}/{len(predictions)} correct")
+            correct += hits
+            total += len(predictions)
+        if total:
+            print(f"Accuracy: {correct / total:.4f} on {total} images")
+
+
+if __name__ == "__main__":
+    main()
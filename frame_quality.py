@@ -0,0 +1,141 @@
+# frame_quality.py - Rejects blurred, badly exposed or motion-smeared frames before inference
+import logging
+import cv2
+import numpy as np
+
+logger = logging.getLogger("WasteSorter")
+
+# Reasons a frame can be rejected
+BLUR = "blur"
+UNDEREXPOSED = "underexposed"
+OVEREXPOSED = "overexposed"
+MOTION = "motion"
+REJECT_REASONS = [BLUR, UNDEREXPOSED, OVEREXPOSED, MOTION]
+
+
+class FrameQualityGate:
+    """Cheap image quality checks run on the model frame before it is classified
+
+    - sharpness: variance of the Laplacian of a downscaled grayscale frame
+    - exposure: fraction of clipped dark or bright pixels
+    - motion: fraction of pixels that changed since the previous frame,
+      taken from the presence detector when it already computed it
+
+    Frames captured while an item is dropped onto the platform are smeared
+    and tend to produce confident but wrong classifications; skipping them
+    saves the inference and keeps the decision policy's evidence clean.
+    """
+
+    def __init__(self,
+                 width=320,
+                 min_sharpness=60.0,
+                 dark_level=16,
+                 bright_level=240,
+                 max_clipped_fraction=0.35,
+                 motion_threshold=25,
+                 max_motion_fraction=0.02):
+        """Initialize the gate"""
+        self.width = width
+        self.min_sharpness = min_sharpness
+        self.dark_level = dark_level
+        self.bright_level = bright_level
+        self.max_clipped_fraction = max_clipped_fraction
+        self.motion_threshold = motion_threshold
+        self.max_motion_fraction = max_motion_fraction
+
+        self.previous_gray = None
+        self.last_reason = None
+        self.sharpness = 0.0
+        self.dark_fraction = 0.0
+        self.bright_fraction = 0.0
+        self.motion_fraction = 0.0
+
+        # Statistics
+        self.frames_checked = 0
+        self.frames_passed = 0
+        self.rejected = {reason: 0 for reason in REJECT_REASONS}
+
+    def _prepare(self, frame):
+        """Downscale and convert a frame to grayscale"""
+        h, w = frame.shape[:2]
+        if w > self.width:
+            frame = cv2.resize(frame, (self.width, max(1, int(h * self.width / w))),
+                               interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def check(self, frame, motion_ratio=None):
+        """Return True if the frame is good enough to classify
+
+        motion_ratio is the fraction of moving pixels if the caller already
+        knows it (e.g. PresenceDetector.motion_ratio); otherwise motion is
+        measured against the previous frame passed to this gate.
+        """
+        gray = self._prepare(frame)
+        self.frames_checked += 1
+
+        # Sharpness
+        self.sharpness = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+        # Exposure
+        self.dark_fraction = np.count_nonzero(gray < self.dark_level) / gray.size
+        self.bright_fraction = np.count_nonzero(gray >= self.bright_level) / gray.size
+
+        # Motion
+        if motion_ratio is not None:
+            self.motion_fraction = motion_ratio
+        elif self.previous_gray is not None and self.previous_gray.shape == gray.shape:
+            diff = cv2.absdiff(gray, self.previous_gray)
+            self.motion_fraction = np.count_nonzero(diff > self.motion_threshold) / diff.size
+        else:
+            self.motion_fraction = 0.0
+        self.previous_gray = gray
+
+        if self.motion_fraction > self.max_motion_fraction:
+            reason = MOTION
+        elif self.sharpness < self.min_sharpness:
+            reason = BLUR
+        elif self.dark_fraction > self.max_clipped_fraction:
+            reason = UNDEREXPOSED
+        elif self.bright_fraction > self.max_clipped_fraction:
+            reason = OVEREXPOSED
+        else:
+            reason = None
+
+        self.last_reason = reason
+        if reason is None:
+            self.frames_passed += 1
+            return True
+
+        self.rejected[reason] += 1
+        logger.debug(f"Skipped frame ({reason}): sharpness {self.sharpness:.0f}, "
+                     f"dark {self.dark_fraction:.1%}, bright {self.bright_fraction:.1%}, "
+                     f"motion {self.motion_fraction:.1%}")
+        return False
+
+    @property
+    def skipped_frames(self):
+        """Number of frames rejected for any reason"""
+        return self.frames_checked - self.frames_passed
+
+    @property
+    def skipped_fraction(self):
+        """Fraction of checked frames that were rejected"""
+        return self.skipped_frames / self.frames_checked if self.frames_checked else 0.0
+
+    def reset_stats(self):
+        """Reset the statistics"""
+        self.frames_checked = 0
+        self.frames_passed = 0
+        self.rejected = {reason: 0 for reason in REJECT_REASONS}
+
+    def get_stats(self):
+        """Get frame quality statistics"""
+        return {
+            "frames_checked": self.frames_checked,
+            "frames_passed": self.frames_passed,
+            "skipped_frames": self.skipped_frames,
+            "skipped_fraction": self.skipped_fraction,
+            "rejected": dict(self.rejected),
+            "last_reason": self.last_reason,
+            "sharpness": self.sharpness
+        }
@@ -0,0 +1,297 @@
+# inference_server.py - Out-of-process inference with a shared-memory frame ring
+import time
+import threading
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+from classifier_engine import ClassifierEngine, FramePreprocessor
+from calibration import Calibration
+from model_backends import default_model_path
+
+logger = logging.getLogger("WasteSorter")
+
+
+class SharedFrameRing:
+    """Fixed-size ring of uint8 RGB image slots in shared memory
+
+    The client writes preprocessed (resized, RGB) frames straight into a
+    slot and only sends the slot number to the server, so image data is
+    never pickled or copied through a pipe.
+    """
+
+    def __init__(self, frame_shape, slots=4, name=None):
+        """Create a new ring, or attach to an existing one when name is given"""
+        self.frame_shape = tuple(frame_shape)
+        self.slots = slots
+        self.frame_size = int(np.prod(self.frame_shape))
+        self.owner = name is None
+
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.frame_size * slots)
+        else:
+            self.shm = _attach_shared_memory(name)
+
+        self.name = self.shm.name
+        self.frames = np.ndarray((slots, *self.frame_shape), dtype=np.uint8, buffer=self.shm.buf)
+
+    def slot(self, index):
+        """Writable view of a slot"""
+        return self.frames[index % self.slots]
+
+    def close(self):
+        """Detach from the ring (and free it if this process created it)"""
+        self.frames = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+        except Exception as e:
+            logger.debug(f"Error closing frame ring: {str(e)}")
+
+
+def _attach_shared_memory(name):
+    """Attach to shared memory without letting this process's resource tracker unlink it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+def serve(conn, backend, model_dir, model_path, num_threads, use_cache=False):
+    """Inference server process: load the model, then classify frames from the ring"""
+    ring = None
+    try:
+        engine = ClassifierEngine.load(backend, model_dir=model_dir, model_path=model_path,
+                                       num_threads=num_threads, use_cache=use_cache)
+        conn.send(("ready", engine.image_size, engine.class_mapping))
+
+        preprocessor = FramePreprocessor(engine.image_size)
+        while True:
+            message = conn.recv()
+            command = message[0]
+
+            if command == "ring":
+                _, name, frame_shape, slots = message
+                if ring is not None:
+                    ring.close()
+                ring = SharedFrameRing(frame_shape, slots, name=name)
+
+            elif command == "frame":
+                _, slot, seq = message
+                image = ring.slot(slot)
+
+                # The slot already holds a resized RGB frame; scale it into the input buffer
+                def fill(out, scale, offset):
+                    preprocessor.process(image, out, bgr=False, scale=scale, offset=offset)
+
+                predictions = engine.backend.predict_frame(fill)
+                conn.send(("result", seq, predictions))
+
+            elif command == "stop":
+                break
+
+    except (EOFError, KeyboardInterrupt):
+        pass
+    except Exception as e:
+        try:
+            conn.send(("error", str(e)))
+        except Exception:
+            pass
+    finally:
+        if ring is not None:
+            ring.close()
+        conn.close()
+
+
+class RemoteBackend:
+    """Backend that forwards frames to an inference server process
+
+    Used through ClassifierEngine like any other backend. Frames are
+    written into a SharedFrameRing and results come back over a pipe. If
+    the server process dies it is restarted on a background thread, and
+    frames fail straight away until the new server has loaded its model,
+    so a caller on the GUI thread is never blocked by the restart.
+    """
+
+    name = "remote"
+
+    def __init__(self, backend="keras", model_dir="models", model_path=None, num_threads=None,
+                 use_cache=False, slots=4, startup_timeout=180.0, frame_timeout=5.0):
+        """Start the server process and wait for the model to load"""
+        self.backend = backend
+        self.model_dir = model_dir
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.use_cache = use_cache
+        self.slots = slots
+        self.startup_timeout = startup_timeout
+        self.frame_timeout = frame_timeout
+
+        self.input_dtype = np.uint8
+        self.class_mapping = None
+        self.process = None
+        self.conn = None
+        self.ring = None
+        self.seq = 0
+        self.restarts = 0
+        self._restarting = False
+        self._closed = False
+        self._lock = threading.Lock()
+
+        self._start_server()
+
+    def _start_server(self):
+        """Start the server process, wait for it to load, then share the frame ring"""
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=serve,
+            args=(child_conn, self.backend, self.model_dir, self.model_path, self.num_threads,
+                  self.use_cache),
+            name="InferenceServer",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+        if not self.conn.poll(self.startup_timeout):
+            self._stop_server()
+            raise RuntimeError("Inference server did not start in time")
+
+        message = self.conn.recv()
+        if message[0] != "ready":
+            self._stop_server()
+            raise RuntimeError(f"Inference server failed to start: {message[1]}")
+
+        _, image_size, self.class_mapping = message
+        self.input_shape = (*image_size, 3)
+
+        # (Re)create the ring for the model's input size
+        if self.ring is None or self.ring.frame_shape != self.input_shape:
+            if self.ring is not None:
+                self.ring.close()
+            self.ring = SharedFrameRing(self.input_shape, self.slots)
+        self.conn.send(("ring", self.ring.name, self.input_shape, self.slots))
+
+        logger.info(f"Inference server started (pid {self.process.pid}, backend {self.backend})")
+
+    def _stop_server(self):
+        """Stop the server process"""
+        if self.conn is not None:
+            try:
+                self.conn.send(("stop",))
+            except Exception:
+                pass
+
+        if self.process is not None:
+            self.process.join(timeout=2)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(timeout=2)
+
+        if self.conn is not None:
+            self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def _restart(self, reason):
+        """Restart a crashed or hung server in the background"""
+        self.restarts += 1
+        self._restarting = True
+        logger.error(f"Inference server failure ({reason}), restarting (restart {self.restarts})")
+        threading.Thread(target=self._restart_server, name="InferenceServerRestart", daemon=True).start()
+
+    def _restart_server(self):
+        """Replace the server process (runs on the restart thread while frames fail fast)"""
+        try:
+            self._stop_server()
+            self._start_server()
+        except Exception as e:
+            logger.error(f"Inference server restart failed: {str(e)}")
+        finally:
+            self._restarting = False
+
+        # close() was called during the restart
+        if self._closed:
+            self.close()
+
+    def _check_ready(self):
+        """Fail fast while the server is restarting"""
+        if self._restarting:
+            raise RuntimeError("Inference server is restarting")
+
+    def _run_slot(self, slot):
+        """Ask the server to classify a slot and wait for the result"""
+        self.seq += 1
+        seq = self.seq
+
+        try:
+            if self.process is None or not self.process.is_alive():
+                raise RuntimeError("server process is not running")
+
+            self.conn.send(("frame", slot, seq))
+            deadline = time.time() + self.frame_timeout
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self.conn.poll(remaining):
+                    raise RuntimeError("timed out waiting for result")
+
+                message = self.conn.recv()
+                if message[0] == "error":
+                    raise RuntimeError(message[1])
+                if message[0] == "result" and message[1] == seq:
+                    return message[2]
+                # Late result for an earlier frame, keep waiting
+        except (EOFError, OSError, RuntimeError) as e:
+            self._restart(str(e))
+            raise RuntimeError(f"Inference server error: {str(e)}")
+
+    def predict_frame(self, fill):
+        """Write one frame into the ring with fill(out, scale, offset) and classify it"""
+        with self._lock:
+            self._check_ready()
+            slot = self.seq % self.slots
+            fill(self.ring.slot(slot), 1.0, 0.0)
+            return self._run_slot(slot)
+
+    def predict(self, batch):
+        """Classify a float batch in [0, 1] one image at a time"""
+        outputs = []
+        with self._lock:
+            self._check_ready()
+            for image in batch:
+                slot = self.seq % self.slots
+                self.ring.slot(slot)[...] = np.clip(np.rint(image * 255.0), 0, 255)
+                outputs.append(self._run_slot(slot)[0])
+        return np.stack(outputs)
+
+    def close(self):
+        """Stop the server and free the ring (after a restart in progress has finished)"""
+        self._closed = True
+        with self._lock:
+            if self._restarting:
+                return
+            self._stop_server()
+            if self.ring is not None:
+                self.ring.close()
+                self.ring = None
+
+
+def create_remote_engine(backend="keras", model_dir="models", model_path=None, num_threads=None,
+                         use_cache=False):
+    """Start an inference server process and wrap it in a ClassifierEngine"""
+    remote = RemoteBackend(backend, model_dir=model_dir, model_path=model_path, num_threads=num_threads,
+                           use_cache=use_cache)
+    calibration = None
+    if remote.class_mapping is not None and backend != "few_shot":
+        calibration = Calibration.load(model_dir, model_path or default_model_path(backend, model_dir))
+    return ClassifierEngine(remote, remote.class_mapping, calibration)
@@ -0,0 +1,169 @@
+# inference_worker.py - Background inference worker for the waste sorting system
+import threading
+import time
+import logging
+
+logger = logging.getLogger("WasteSorter")
+
+
+class InferenceWorker:
+    """Runs the classifier on the newest camera frame in a dedicated thread
+
+    Frames are handed over through a one-slot mailbox: submitting a frame
+    while the previous one is still waiting replaces it, so the model always
+    works on the most recent image and never falls behind the camera.
+    """
+
+    def __init__(self, predict_fn, result_callback, name="InferenceWorker"):
+        """Initialize the worker
+
+        predict_fn is called with a frame on the worker thread and returns a
+        result; result_callback is called with that result on the same thread
+        and is responsible for handing it back to the UI.
+        """
+        self.predict_fn = predict_fn
+        self.result_callback = result_callback
+        self.name = name
+
+        # One-slot mailbox guarded by a condition variable
+        self._condition = threading.Condition()
+        self._pending_frame = None
+        self._running = False
+        self._thread = None
+
+        # Counters
+        self.frames_submitted = 0
+        self.frames_dropped = 0
+        self.frames_processed = 0
+        self.errors = 0
+        self.inference_fps = 0.0
+        self.last_latency_ms = 0.0
+        self._fps_window_start = None
+        self._fps_window_count = 0
+
+    def start(self):
+        """Start the worker thread"""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._pending_frame = None
+
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info(f"{self.name} started")
+
+    def stop(self, timeout=1.0):
+        """Stop the worker thread and discard any pending frame"""
+        with self._condition:
+            self._running = False
+            self._pending_frame = None
+            self._condition.notify_all()
+
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+        logger.info(f"{self.name} stopped")
+
+    @property
+    def is_running(self):
+        """Whether the worker thread is accepting frames"""
+        return self._running
+
+    def submit(self, frame):
+        """Put a frame in the mailbox, replacing any frame not yet processed"""
+        with self._condition:
+            if not self._running:
+                return False
+
+            if self._pending_frame is not None:
+                self.frames_dropped += 1
+
+            self._pending_frame = frame
+            self.frames_submitted += 1
+            self._condition.notify()
+        return True
+
+    def get_stats(self):
+        """Get a snapshot of the worker counters"""
+        with self._condition:
+            submitted = self.frames_submitted
+            return {
+                "submitted": submitted,
+                "processed": self.frames_processed,
+                "dropped": self.frames_dropped,
+                "errors": self.errors,
+                "drop_rate": self.frames_dropped / submitted if submitted else 0.0,
+                "inference_fps": self.inference_fps,
+                "latency_ms": self.last_latency_ms
+            }
+
+    def reset_stats(self):
+        """Reset all counters to zero"""
+        with self._condition:
+            self.frames_submitted = 0
+            self.frames_dropped = 0
+            self.frames_processed = 0
+            self.errors = 0
+            self.inference_fps = 0.0
+            self.last_latency_ms = 0.0
+            self._fps_window_start = None
+            self._fps_window_count = 0
+
+    def _take_frame(self):
+        """Wait for the next frame; returns None when the worker is stopped"""
+        with self._condition:
+            while self._running and self._pending_frame is None:
+                self._condition.wait()
+
+            if not self._running:
+                return None
+
+            frame = self._pending_frame
+            self._pending_frame = None
+            return frame
+
+    def _update_rate(self, latency):
+        """Update latency and the rolling inference rate"""
+        now = time.perf_counter()
+        with self._condition:
+            self.frames_processed += 1
+            self.last_latency_ms = latency * 1000
+
+            if self._fps_window_start is None:
+                self._fps_window_start = now
+                self._fps_window_count = 0
+
+            self._fps_window_count += 1
+            elapsed = now - self._fps_window_start
+
+            # Recompute the rate roughly once per second
+            if elapsed >= 1.0:
+                self.inference_fps = self._fps_window_count / elapsed
+                self._fps_window_start = now
+                self._fps_window_count = 0
+
+    def _run(self):
+        """Worker loop"""
+        while True:
+            frame = self._take_frame()
+            if frame is None:
+                break
+
+            try:
+                start = time.perf_counter()
+                result = self.predict_fn(frame)
+                self._update_rate(time.perf_counter() - start)
+            except Exception as e:
+                with self._condition:
+                    self.errors += 1
+                logger.error(f"{self.name} inference error: {str(e)}")
+                continue
+
+            if result is None:
+                continue
+
+            try:
+                self.result_callback(result)
+            except Exception as e:
+                logger.error(f"{self.name} result callback error: {str(e)}")
@@ -0,0 +1,487 @@
+# item_tracker.py - Conveyor mode: track several items at once and sort each one as it arrives
+import time
+import logging
+import cv2
+import numpy as np
+
+from classifier_engine import SORT_CATEGORIES
+from multi_station import SortingStation
+
+logger = logging.getLogger("WasteSorter")
+
+# Directions the conveyor can move items across the camera image
+DIRECTIONS = ["right", "left", "down", "up"]
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise intersection over union of two lists of (x, y, w, h) boxes"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+
+    x0 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y0 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x1 = np.minimum(a[:, None, 0] + a[:, None, 2], b[None, :, 0] + b[None, :, 2])
+    y1 = np.minimum(a[:, None, 1] + a[:, None, 3], b[None, :, 1] + b[None, :, 3])
+    intersection = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+
+    union = (a[:, None, 2] * a[:, None, 3]) + (b[None, :, 2] * b[None, :, 3]) - intersection
+    return intersection / np.maximum(union, 1e-6)
+
+
+class ItemDetector:
+    """Finds the separate items on the belt with background subtraction
+
+    The empty belt is learnt as background (MOG2) on a downscaled copy of
+    the belt region. Items keep moving, so the background can keep
+    learning slowly without absorbing them. Every foreground blob larger
+    than min_area_fraction of the belt is reported as one item.
+    """
+
+    def __init__(self, width=320, min_area_fraction=0.004, history=500, var_threshold=32,
+                 learning_rate=0.002, warmup_frames=30):
+        """Initialize the detector"""
+        self.width = width
+        self.min_area_fraction = min_area_fraction
+        self.learning_rate = learning_rate
+        self.warmup_frames = warmup_frames
+
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(
+            history=history,
+            varThreshold=var_threshold,
+            detectShadows=False
+        )
+        self.foreground_mask = None
+        self.frames_seen = 0
+
+    def detect(self, frame, region=None):
+        """Bounding boxes (x, y, w, h) of the items in a frame, in frame pixels"""
+        rx, ry, rw, rh = region if region is not None else (0, 0, frame.shape[1], frame.shape[0])
+        belt = frame[ry:ry + rh, rx:rx + rw]
+
+        scale = min(1.0, self.width / rw)
+        small = cv2.resize(belt, (max(1, int(rw * scale)), max(1, int(rh * scale))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        self.frames_seen += 1
+        learning_rate = -1 if self.frames_seen <= self.warmup_frames else self.learning_rate
+        mask = self.subtractor.apply(gray, learningRate=learning_rate)
+        if self.frames_seen <= self.warmup_frames:
+            return []
+
+        # Remove speckle, then join the fragments of one item
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+        mask = cv2.dilate(mask, np.ones((7, 7), np.uint8))
+        self.foreground_mask = mask
+
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        min_area = self.min_area_fraction * mask.shape[0] * mask.shape[1]
+        boxes = []
+        for contour in contours:
+            if cv2.contourArea(contour) < min_area:
+                continue
+            bx, by, bw, bh = cv2.boundingRect(contour)
+            boxes.append((rx + int(bx / scale), ry + int(by / scale), int(bw / scale), int(bh / scale)))
+        return boxes
+
+
+class Track:
+    """One item followed across frames, with its classifications and decision"""
+
+    def __init__(self, track_id, box, timestamp):
+        """Start a track at a detection"""
+        self.track_id = track_id
+        self.box = box
+        self.velocity = (0.0, 0.0)  # Pixels per second
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.hits = 1
+        self.misses = 0
+        self.lost = False
+
+        self.results = []
+        self.last_classified = 0.0
+        self.crop = None
+        self.decision = None
+
+    def predicted_box(self, timestamp):
+        """Box moved along the track's velocity to a point in time"""
+        dt = timestamp - self.last_seen
+        x, y, w, h = self.box
+        return (x + self.velocity[0] * dt, y + self.velocity[1] * dt, w, h)
+
+    def update(self, box, timestamp, smoothing=0.5):
+        """Move the track to a matched detection and update its velocity"""
+        dt = timestamp - self.last_seen
+        if dt > 0:
+            vx = ((box[0] + box[2] / 2) - (self.box[0] + self.box[2] / 2)) / dt
+            vy = ((box[1] + box[3] / 2) - (self.box[1] + self.box[3] / 2)) / dt
+            if self.hits > 1:
+                vx = smoothing * vx + (1 - smoothing) * self.velocity[0]
+                vy = smoothing * vy + (1 - smoothing) * self.velocity[1]
+            self.velocity = (vx, vy)
+
+        self.box = box
+        self.last_seen = timestamp
+        self.hits += 1
+        self.misses = 0
+
+
+class ItemTracker:
+    """Associates detections with tracks so every item keeps one id
+
+    Each track's box is first moved along its velocity, then tracks and
+    detections are matched greedily by IoU; what is left is matched by
+    centre distance, which catches fast items whose boxes no longer
+    overlap. A track without a match for max_misses frames is marked lost
+    (its owner decides when to remove it); unconfirmed tracks (fewer than
+    min_hits detections) are dropped straight away as noise. Detections
+    left over are matched against the lost tracks before new tracks are
+    started, so an item that was hidden for a moment keeps its id and is
+    not sorted twice.
+    """
+
+    def __init__(self, iou_threshold=0.2, max_distance=0.75, max_misses=5, min_hits=3):
+        """Initialize the tracker"""
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+
+        self.tracks = {}
+        self.next_id = 1
+        self.items_seen = 0
+
+    def confirmed(self, track):
+        """Whether a track has been seen often enough to be a real item"""
+        return track.hits >= self.min_hits
+
+    def _match(self, active, boxes, timestamp):
+        """Greedy matching; returns {track index: detection index}"""
+        matches = {}
+        if not active or not boxes:
+            return matches
+
+        predicted = np.array([track.predicted_box(timestamp) for track in active], dtype=np.float32)
+        detections = np.asarray(boxes, dtype=np.float32)
+
+        iou = box_iou(predicted, detections)
+        for flat in np.argsort(-iou, axis=None):
+            ti, di = divmod(int(flat), len(boxes))
+            if iou[ti, di] < self.iou_threshold:
+                break
+            if ti not in matches and di not in matches.values():
+                matches[ti] = di
+
+        # Centre distance relative to the track's size for what is left
+        centres_t = predicted[:, :2] + predicted[:, 2:] / 2
+        centres_d = detections[:, :2] + detections[:, 2:] / 2
+        distance = np.linalg.norm(centres_t[:, None] - centres_d[None], axis=2)
+        distance /= np.maximum(predicted[:, 2:].max(axis=1, keepdims=True), 1.0)
+        for flat in np.argsort(distance, axis=None):
+            ti, di = divmod(int(flat), len(boxes))
+            if distance[ti, di] > self.max_distance:
+                break
+            if ti not in matches and di not in matches.values():
+                matches[ti] = di
+
+        return matches
+
+    def update(self, boxes, timestamp):
+        """Update the tracks with one frame's detections"""
+        active = [track for track in self.tracks.values() if not track.lost]
+        matches = self._match(active, boxes, timestamp)
+
+        for ti, track in enumerate(active):
+            if ti in matches:
+                was_confirmed = self.confirmed(track)
+                track.update(boxes[matches[ti]], timestamp)
+                if not was_confirmed and self.confirmed(track):
+                    self.items_seen += 1
+                continue
+
+            track.misses += 1
+            if track.misses > self.max_misses:
+                if self.confirmed(track):
+                    track.lost = True
+                else:
+                    del self.tracks[track.track_id]
+
+        # Continue lost tracks whose predicted position the leftover detections match
+        matched = set(matches.values())
+        unmatched = [di for di in range(len(boxes)) if di not in matched]
+        lost = [track for track in self.tracks.values() if track.lost]
+        recovered = self._match(lost, [boxes[di] for di in unmatched], timestamp)
+        for ti, ui in recovered.items():
+            track = lost[ti]
+            track.lost = False
+            track.update(boxes[unmatched[ui]], timestamp)
+            matched.add(unmatched[ui])
+            logger.debug(f"Recovered lost track {track.track_id}")
+
+        for di, box in enumerate(boxes):
+            if di not in matched:
+                self.tracks[self.next_id] = Track(self.next_id, box, timestamp)
+                self.next_id += 1
+
+    def remove(self, track_id):
+        """Forget a track"""
+        self.tracks.pop(track_id, None)
+
+    @property
+    def active_count(self):
+        """Number of confirmed items currently in view"""
+        return sum(1 for track in self.tracks.values() if not track.lost and self.confirmed(track))
+
+
+class ConveyorStation(SortingStation):
+    """Sorting station fed by a conveyor, with several items in view at once
+
+    The capture thread detects and tracks items on every frame. Each
+    confirmed item is classified a few times at most (max_classifications,
+    at least classify_interval apart, only while it is fully inside the
+    belt region), and the mean of its category probabilities decides where
+    it goes, as soon as that mean reaches `confidence`. The sort command is
+    sent when the item's predicted leading edge reaches gate_position (a
+    fraction of the frame along the travel direction), actuation_lead
+    seconds early so the platform is in place when the item arrives.
+
+    Items that reach the gate without a decision are sorted on the
+    evidence they have, or as undecided_sort if they were never classified.
+    """
+
+    def __init__(self, station_id, camera, port, direction="right", gate_position=0.95, actuation_lead=0.3,
+                 max_classifications=3, classify_interval=0.2, confidence=0.8, max_lost_time=5.0,
+                 undecided_sort="Garbage", frame_interval=0.03, roi_mode="full", roi_config=None, **kwargs):
+        """Initialize the station (call connect() to open the camera and serial port)"""
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown conveyor direction: {direction}")
+
+        super().__init__(station_id, camera, port, presence_gate=False, roi_mode=roi_mode,
+                         roi_config=roi_config, min_sort_interval=0.0, **kwargs)
+        self.direction = direction
+        self.gate_position = gate_position
+        self.actuation_lead = actuation_lead
+        self.max_classifications = max_classifications
+        self.classify_interval = classify_interval
+        self.confidence = confidence
+        self.max_lost_time = max_lost_time
+        self.undecided_sort = undecided_sort
+        self.frame_interval = frame_interval
+
+        self.detector = ItemDetector()
+        self.tracker = ItemTracker()
+        self.frame_shape = None
+        self.region = None
+
+        # Item statistics
+        self.items_sorted = 0
+        self.items_unclassified = 0
+        self.items_missed = 0
+        self.item_classifications = 0
+        self.overlapping_sorts = 0
+
+    def capture_frames(self):
+        """Keep the latest camera frame and track the items on it"""
+        while self.is_connected:
+            try:
+                ret, frame = self.camera.read()
+                if ret:
+                    timestamp = time.time()
+                    region = None
+                    if self.platform_roi.mode != "full":
+                        region = self.platform_roi.platform_rect(frame.shape)
+                    boxes = self.detector.detect(frame, region)
+
+                    with self._frame_lock:
+                        self.current_frame = frame
+                        self.frame_id += 1
+                        self.frame_shape = frame.shape
+                        self.region = region or (0, 0, frame.shape[1], frame.shape[0])
+                        self.tracker.update(boxes, timestamp)
+                        self._keep_crops(frame, timestamp)
+            except Exception as e:
+                logger.error(f"Station {self.station_id} camera error: {str(e)}")
+                time.sleep(0.1)
+
+            time.sleep(self.frame_interval)
+
+    def _progress(self, box):
+        """Position of a box's leading edge along the travel direction (0 to 1 across the frame)"""
+        height, width = self.frame_shape[:2]
+        x, y, w, h = box
+        if self.direction == "right":
+            return (x + w) / width
+        if self.direction == "left":
+            return 1.0 - x / width
+        if self.direction == "down":
+            return (y + h) / height
+        return 1.0 - y / height
+
+    def _speed(self, track):
+        """Speed of a track along the travel direction in frame fractions per second"""
+        height, width = self.frame_shape[:2]
+        vx, vy = track.velocity
+        return {"right": vx / width, "left": -vx / width, "down": vy / height, "up": -vy / height}[self.direction]
+
+    def _fully_visible(self, box):
+        """Whether a box lies inside the belt region, clear of its edges"""
+        rx, ry, rw, rh = self.region
+        x, y, w, h = box
+        mx, my = 0.01 * rw, 0.01 * rh
+        return x > rx + mx and y > ry + my and x + w < rx + rw - mx and y + h < ry + rh - my
+
+    def _crop(self, frame, box, margin=0.15):
+        """Square crop around a box with a margin, clipped to the frame (a view)"""
+        height, width = frame.shape[:2]
+        x, y, w, h = box
+        side = int(max(w, h) * (1 + 2 * margin))
+        cx, cy = x + w / 2, y + h / 2
+        x0 = int(max(0, min(width - side, cx - side / 2)))
+        y0 = int(max(0, min(height - side, cy - side / 2)))
+        return frame[y0:y0 + min(side, height - y0), x0:x0 + min(side, width - x0)]
+
+    def _keep_crops(self, frame, timestamp):
+        """Keep the latest crop of every confirmed item seen on this frame, for its sort record
+
+        A crop taken while the item is fully inside the belt region is only
+        replaced by another fully visible one. Crops are copied so a track
+        does not keep the whole camera frame alive.
+        """
+        for track in self.tracker.tracks.values():
+            if track.last_seen != timestamp or not self.tracker.confirmed(track):
+                continue
+            if track.crop is None or self._fully_visible(track.box):
+                track.crop = self._crop(frame, track.box).copy()
+
+    def take_model_frames(self):
+        """Crops of the tracked items that are due for a classification this tick"""
+        if not self.is_connected:
+            return []
+
+        now = time.time()
+        taken = []
+        with self._frame_lock:
+            frame = self.current_frame
+            if frame is None or self.frame_id == self.last_classified_id:
+                return []
+            self.last_classified_id = self.frame_id
+
+            for track in self.tracker.tracks.values():
+                if (track.lost or track.misses or track.decision is not None
+                        or not self.tracker.confirmed(track)
+                        or len(track.results) >= self.max_classifications
+                        or now - track.last_classified < self.classify_interval
+                        or not self._fully_visible(track.box)):
+                    continue
+
+                crop = self._crop(frame, track.box)
+                track.last_classified = now
+                taken.append((track.track_id, crop, crop))
+
+        self.inference_frames += len(taken)
+        return taken
+
+    def _decide(self, track, timestamp, final=False):
+        """Decision from the mean category probabilities of an item's classifications"""
+        if not track.results:
+            return None
+
+        mean = {category: float(np.mean([result[category] for result in track.results]))
+                for category in SORT_CATEGORIES}
+        sort_as = max(mean, key=mean.get)
+        if mean[sort_as] < self.confidence and not final:
+            return None
+
+        return {
+            "sort_as": sort_as,
+            "confidence": mean[sort_as],
+            "policy": "conveyor",
+            "frames": len(track.results),
+            "time_to_decision": timestamp - track.first_seen,
+            "track_id": track.track_id
+        }
+
+    def handle_result(self, key, frame, result, timestamp):
+        """Add a classification to its item; conveyor sorts happen in dispatch_due"""
+        with self._frame_lock:
+            track = self.tracker.tracks.get(key)
+            if track is None or track.decision is not None:
+                return []
+
+            track.results.append(result["category_probabilities"])
+            self.item_classifications += 1
+            final = len(track.results) >= self.max_classifications
+            track.decision = self._decide(track, timestamp, final=final)
+            if track.decision is not None:
+                logger.debug(f"Station {self.station_id}: item {track.track_id} is {track.decision['sort_as']} "
+                             f"({track.decision['confidence']:.2%}) after {len(track.results)} classifications")
+        return []
+
+    def dispatch_due(self, timestamp):
+        """Send the sort commands of items that are arriving at the platform"""
+        if self.frame_shape is None:
+            return []
+
+        due = []
+        with self._frame_lock:
+            for track in list(self.tracker.tracks.values()):
+                if not self.tracker.confirmed(track):
+                    continue
+
+                if track.lost and timestamp - track.last_seen > self.max_lost_time:
+                    # Lost track that never reached the gate
+                    self.tracker.remove(track.track_id)
+                    self.items_missed += 1
+                    continue
+
+                progress = self._progress(track.predicted_box(timestamp))
+                speed = self._speed(track)
+                arrival = (self.gate_position - progress) / speed if speed > 1e-3 else float('inf')
+                if progress < self.gate_position and arrival > self.actuation_lead:
+                    continue
+
+                decision = track.decision or self._decide(track, timestamp, final=True)
+                if decision is None:
+                    self.items_unclassified += 1
+                    decision = {
+                        "sort_as": self.undecided_sort,
+                        "confidence": 0.0,
+                        "policy": "conveyor",
+                        "frames": 0,
+                        "time_to_decision": timestamp - track.first_seen,
+                        "track_id": track.track_id
+                    }
+                    logger.warning(f"Station {self.station_id}: item {track.track_id} reached the platform "
+                                   f"unclassified, sorting as {self.undecided_sort}")
+
+                self.tracker.remove(track.track_id)
+                due.append((track.crop, decision))
+
+        for _, decision in due:
+            self.sort(decision)
+        self.items_sorted += len(due)
+        return due
+
+    def sort(self, decision):
+        """Send the sort command for an item, even if the previous one has not finished"""
+        if self.is_sorting:
+            self.overlapping_sorts += 1
+            logger.warning(f"Station {self.station_id}: item {decision.get('track_id')} arrived before "
+                           f"the previous sort completed")
+        super().sort(decision)
+
+    def get_stats(self):
+        """Get station and tracking statistics"""
+        stats = super().get_stats()
+        stats.update({
+            "mode": "conveyor",
+            "items_tracked": self.tracker.items_seen,
+            "items_in_view": self.tracker.active_count,
+            "items_sorted": self.items_sorted,
+            "items_unclassified": self.items_unclassified,
+            "items_missed": self.items_missed,
+            "classifications_per_item": self.item_classifications / self.items_sorted if self.items_sorted else 0.0,
+            "overlapping_sorts": self.overlapping_sorts
+        })
+        return stats
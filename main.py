@@ -4,9 +4,6 @@ import sys
 import time
 import threading
 import cv2
-import numpy as np
-import tensorflow as tf
-from tensorflow import keras
 import serial
 from serial.tools import list_ports
 import tkinter as tk
@@ -20,7 +17,17 @@ from datetime import datetime
 
 # Import our modules
 from database import SortingDatabase
-from train_model import WasteClassifierTrainer
+from inference_worker import InferenceWorker
+from model_backends import BACKENDS
+from classifier_engine import ClassifierEngine
+from inference_server import create_remote_engine
+from decision_engine import DECISION_POLICIES, create_decision_policy
+from presence_detector import PresenceDetector, EMPTY
+from platform_roi import ROI_MODES, PlatformROI
+from cascade import CASCADE_GATES, CascadeClassifier, load_gate
+from frame_quality import FrameQualityGate
+from shadow_evaluator import ShadowEvaluator
+from model_registry import ModelRegistry
 
 # Configure logging
 logging.basicConfig(
@@ -36,7 +43,11 @@ logger = logging.getLogger("WasteSorter")
 class WasteSorterApp:
     """Main application for the waste sorting system"""
     
-    def __init__(self, root):
+    def __init__(self, root, backend=None, model_path=None, num_threads=None,
+                 decision_policy="timer", decision_error=None, presence_gate=True,
+                 roi_mode="full", inference_process=False, use_model_cache=True, cascade_gate=None,
+                 cascade_margin=0.5, gate_model_path=None, quality_gate=True, shadow_model_path=None,
+                 shadow_sample_rate=0.25, shadow_cpu_budget=0.2, model_version=None):
         """Initialize the application"""
         self.root = root
         self.root.title("Waste Sorting System")
@@ -50,7 +61,25 @@ class WasteSorterApp:
             pass  # Icon not found, continue without it
         
         # Initialize variables
-        self.model = None
+        self.engine = None
+        self.backend = backend
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.inference_process = inference_process
+        self.use_model_cache = use_model_cache
+        self.cascade_gate = cascade_gate
+        self.cascade_margin = cascade_margin
+        self.gate_model_path = gate_model_path
+        self.cascade = None
+        self.shadow_model_path = shadow_model_path
+        self.shadow_sample_rate = shadow_sample_rate
+        self.shadow_cpu_budget = shadow_cpu_budget
+        self.shadow = None
+        
+        # Versioned models; the version in use is recorded with every sort event
+        self.registry = ModelRegistry()
+        self.requested_version = model_version
+        self.model_version = None
         self.camera = None
         self.arduino = None
         self.is_connected = False
@@ -58,9 +87,10 @@ class WasteSorterApp:
         self.current_frame = None
         self.confidence = 0.0
 
-        self.last_high_confidence_time = None  # Store the time when confidence is ≥90%
         self.current_classification = None  # Store the current classification
-        self.min_confidence_time = 4  # Seconds to maintain confidence before sorting
+        
+        # Auto-sort decision policy (timer = 90% confidence held for 4 seconds)
+        self.decision_policy = create_decision_policy(decision_policy, error_rate=decision_error)
         
         # Item counters
         self.can_count = 0
@@ -77,6 +107,19 @@ class WasteSorterApp:
         self.auto_sort_min_interval = 5000  # Minimum ms between auto-sorts
         self.dashboard_process = None
         
+        # Presence detector that wakes the classifier only when an item has settled
+        self.presence_detector = PresenceDetector() if presence_gate else None
+        self.platform_state = EMPTY
+        
+        # Image quality checks that drop blurred or smeared frames before inference
+        self.quality_gate = FrameQualityGate() if quality_gate else None
+        
+        # Platform region the model looks at
+        self.platform_roi = PlatformROI(roi_mode)
+        
+        # Inference worker for auto-sort (started when connected)
+        self.inference_worker = InferenceWorker(self.auto_analyze_and_sort, self.post_inference_result)
+        
         # Create UI elements
         self.create_ui()
         
@@ -183,6 +226,10 @@ class WasteSorterApp:
         self.sort_label = ttk.Label(class_frame, text="N/A")
         self.sort_label.grid(row=2, column=1, sticky=tk.W, pady=5)
         
+        ttk.Label(class_frame, text="Inference:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        self.inference_label = ttk.Label(class_frame, text="Idle")
+        self.inference_label.grid(row=3, column=1, sticky=tk.W, pady=5)
+        
         # Control buttons
         btn_frame = ttk.Frame(control_frame, padding="10")
         btn_frame.pack(fill=tk.X, pady=10)
@@ -257,9 +304,15 @@ class WasteSorterApp:
                  command=lambda: self.set_platform_position(135)).pack(side=tk.LEFT, padx=2)
         
         # Status bar
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        
         self.status_var = tk.StringVar(value="System ready. Please connect to Arduino.")
-        status_bar = ttk.Label(self.root, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
-        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        status_bar = ttk.Label(status_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
+        status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        # Model loading indicator (shown while the model loads)
+        self.model_progress = ttk.Progressbar(status_frame, mode='indeterminate', length=150)
     
     def create_menu(self):
         """Create the application menu"""
@@ -276,8 +329,10 @@ class WasteSorterApp:
         # Tools menu
         tools_menu = tk.Menu(menubar, tearoff=0)
         tools_menu.add_command(label="Model Training", command=self.open_training_dialog)
+        tools_menu.add_command(label="Model Versions", command=self.open_model_versions_dialog)
         tools_menu.add_command(label="Test Camera", command=self.test_camera)
         tools_menu.add_command(label="Test Arduino", command=self.test_arduino)
+        tools_menu.add_command(label="Calibrate Platform Region", command=self.calibrate_platform_roi)
         tools_menu.add_separator()
         tools_menu.add_command(label="Start Analytics Dashboard", command=self.start_dashboard)
         tools_menu.add_command(label="Open Analytics in Browser", command=self.open_dashboard_browser)
@@ -360,38 +415,223 @@ class WasteSorterApp:
     
     def initialize_system(self):
         """Initialize the system components"""
-        # Load TensorFlow model
+        # Load the model in the background so the window is usable right away
         self.status_var.set("Loading machine learning model...")
+        self.model_progress.pack(side=tk.RIGHT, padx=5)
+        self.model_progress.start(10)
         
+        loader_thread = threading.Thread(target=self.load_model, name="ModelLoader", daemon=True)
+        loader_thread.start()
+    
+    def load_model(self):
+        """Load and warm up the classifier (runs on a background thread)"""
         try:
-            # Check if we have a custom model first
-            custom_model_path = os.path.join("models", "latest_model.h5")
-            if os.path.exists(custom_model_path):
-                self.model = tf.keras.models.load_model(custom_model_path)
-                logger.info(f"Loaded custom model: {custom_model_path}")
-                
-                # Load class mapping
-                mapping_path = os.path.join("models", "class_mapping.json")
-                import json
-                if os.path.exists(mapping_path):
-                    with open(mapping_path, 'r') as f:
-                        self.class_mapping = json.load(f)
-                    logger.info(f"Loaded class mapping: {self.class_mapping}")
+            start = time.time()
+            
+            # A registry version is used when requested, or when one is active and neither
+            # a model file nor a different backend was given on the command line
+            version = self.registry.select_version(self.requested_version, self.model_path, self.backend)
+            backend = self.backend or "keras"
+            
+            # Load the selected backend (Keras .h5 or TFLite), its class mapping and warm it up,
+            # either in this process or in a separate inference server process
+            if version is not None:
+                engine = self.registry.load_engine(
+                    version,
+                    num_threads=self.num_threads,
+                    use_cache=self.use_model_cache,
+                    inference_process=self.inference_process
+                )
+                logger.info(f"Loaded model version {version}")
+            elif self.inference_process:
+                engine = create_remote_engine(
+                    backend,
+                    model_dir="models",
+                    model_path=self.model_path,
+                    num_threads=self.num_threads,
+                    use_cache=self.use_model_cache
+                )
             else:
-                # Use the pre-trained model
-                self.model = tf.keras.applications.MobileNetV2(
-                    input_shape=(224, 224, 3),
-                    include_top=True,
-                    weights='imagenet'
+                engine = ClassifierEngine.load(
+                    backend,
+                    model_dir="models",
+                    model_path=self.model_path,
+                    num_threads=self.num_threads,
+                    use_cache=self.use_model_cache
                 )
-                logger.info("Loaded pre-trained MobileNetV2 model")
             
-            self.status_var.set("Model loaded successfully.")
+            # Optional cheap first stage that only defers uncertain frames to the model
+            cascade = None
+            if self.cascade_gate:
+                gate = load_gate(self.cascade_gate, self.gate_model_path, num_threads=self.num_threads)
+                cascade = CascadeClassifier(gate, engine, margin_threshold=self.cascade_margin)
+                logger.info(f"Cascade enabled ({self.cascade_gate} gate, margin {self.cascade_margin})")
+            
+            # Optional candidate model evaluated on a sample of live frames
+            shadow = None
+            if self.shadow_model_path:
+                production_name = version or os.path.basename(getattr(engine.backend, 'model_path', None)
+                                                              or 'imagenet')
+                shadow = ShadowEvaluator.load(
+                    self.shadow_model_path,
+                    production_name,
+                    sample_rate=self.shadow_sample_rate,
+                    cpu_budget=self.shadow_cpu_budget
+                )
+                logger.info(f"Shadow evaluation of {self.shadow_model_path} against {production_name}")
+            
+            logger.info(f"Model ready in {time.time() - start:.1f}s ({engine.backend.name} backend)")
+            self.root.after(0, self.on_model_loaded, engine, None, cascade, shadow, version)
         except Exception as e:
-            error_msg = f"Error loading model: {str(e)}"
+            self.root.after(0, self.on_model_loaded, None, e)
+    
+    def on_model_loaded(self, engine, error, cascade=None, shadow=None, version=None):
+        """Finish model loading on the main thread"""
+        self.model_progress.stop()
+        self.model_progress.pack_forget()
+        
+        if error is not None:
+            error_msg = f"Error loading model: {str(error)}"
             logger.error(error_msg)
             self.status_var.set(error_msg)
             messagebox.showerror("Model Error", error_msg)
+            return
+        
+        self.engine = engine
+        self.cascade = cascade
+        self.model_version = version
+        if shadow is not None:
+            self.shadow = shadow
+            self.shadow.start()
+            self.root.after(60000, self.flush_shadow_stats)
+        self.status_var.set("Model loaded successfully.")
+        
+        # Analysis is possible once both the model and the camera are ready
+        if self.is_connected:
+            self.analyze_btn.state(['!disabled'])
+    
+    def switch_model_version(self, version, rollback=False):
+        """Preload a registry version in the background, then swap it in between frames"""
+        if version is None:
+            self.status_var.set("No model version to switch to")
+            return
+        
+        self.status_var.set(f"Loading model version {version}...")
+        self.model_progress.pack(side=tk.RIGHT, padx=5)
+        self.model_progress.start(10)
+        
+        def preload():
+            try:
+                engine = self.registry.load_engine(
+                    version,
+                    num_threads=self.num_threads,
+                    use_cache=self.use_model_cache,
+                    inference_process=self.inference_process
+                )
+                self.root.after(0, self.swap_engine, engine, version, None, rollback)
+            except Exception as e:
+                self.root.after(0, self.swap_engine, None, version, e)
+        
+        threading.Thread(target=preload, name="ModelPreloader", daemon=True).start()
+    
+    def swap_engine(self, engine, version, error, rollback=False):
+        """Replace the running engine with a preloaded, warmed-up one (main thread)
+        
+        The inference worker reads self.engine once per frame, so the frame
+        in flight finishes on the old engine and the next one uses the new.
+        """
+        self.model_progress.stop()
+        self.model_progress.pack_forget()
+        
+        if error is not None:
+            error_msg = f"Error loading model version {version}: {str(error)}"
+            logger.error(error_msg)
+            self.status_var.set(error_msg)
+            messagebox.showerror("Model Error", error_msg)
+            return
+        
+        old_engine = self.engine
+        
+        # Rebuild the cascade around the new model, if its classes still match the gate
+        cascade = None
+        if self.cascade is not None:
+            try:
+                cascade = CascadeClassifier(self.cascade.gate, engine, self.cascade.margin_threshold)
+            except ValueError as e:
+                logger.warning(f"Cascade disabled after model swap: {str(e)}")
+        
+        self.engine = engine
+        self.cascade = cascade
+        self.model_version = version
+        if rollback:
+            # Pop the registry's rollback stack so the next rollback goes further back
+            self.registry.rollback()
+        else:
+            self.registry.set_active(version)
+        
+        # Evidence gathered with the old model does not carry over
+        self.decision_policy.reset()
+        if self.shadow is not None:
+            self.shadow.production_name = version
+            self.shadow.reset_item()
+        
+        # Stop a replaced inference server once the frame in flight has finished with it
+        if old_engine is not None and old_engine is not engine and hasattr(old_engine.backend, 'close'):
+            self.root.after(2000, old_engine.backend.close)
+        
+        if self.is_connected:
+            self.analyze_btn.state(['!disabled'])
+        self.status_var.set(f"Switched to model version {version}")
+        logger.info(f"Swapped in model version {version} ({engine.backend.name} backend)")
+    
+    def rollback_model(self):
+        """Swap back to the previously active registry version"""
+        self.switch_model_version(self.registry.previous_version(), rollback=True)
+    
+    def open_model_versions_dialog(self):
+        """Show registered model versions and switch between them"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Model Versions")
+        dialog.geometry("700x350")
+        dialog.transient(self.root)
+        
+        frame = ttk.Frame(dialog, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+        
+        columns = ("version", "backend", "created", "accuracy", "artifact")
+        tree = ttk.Treeview(frame, columns=columns, show="headings", height=10)
+        for column, width in zip(columns, (80, 80, 160, 80, 260)):
+            tree.heading(column, text=column.capitalize())
+            tree.column(column, width=width)
+        tree.pack(fill=tk.BOTH, expand=True)
+        
+        active = self.registry.active_version
+        for metadata in reversed(self.registry.list_versions()):
+            accuracy = metadata["metrics"].get("accuracy")
+            label = metadata["version"] + (" (active)" if metadata["version"] == active else "")
+            tree.insert("", tk.END, iid=metadata["version"], values=(
+                label,
+                metadata["backend"],
+                metadata["created"][:19].replace("T", " "),
+                f"{accuracy:.2%}" if accuracy is not None else "-",
+                metadata["artifact"]
+            ))
+        
+        def activate():
+            selection = tree.selection()
+            if selection:
+                dialog.destroy()
+                self.switch_model_version(selection[0])
+        
+        def rollback():
+            dialog.destroy()
+            self.rollback_model()
+        
+        button_frame = ttk.Frame(frame)
+        button_frame.pack(fill=tk.X, pady=10)
+        ttk.Button(button_frame, text="Activate Selected", command=activate).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Roll Back", command=rollback).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Close", command=dialog.destroy).pack(side=tk.RIGHT, padx=5)
     
     def toggle_connection(self):
         """Connect or disconnect from Arduino"""
@@ -442,8 +682,14 @@ class WasteSorterApp:
                         logger.info(f"Camera resolution set to {actual_width}x{actual_height}")
                         break
                 
+                # Learn the empty platform from scratch for this camera
+                if self.presence_detector is not None:
+                    self.presence_detector.reset_background()
+                    self.platform_state = EMPTY
+                
                 # Start camera thread
                 self.is_connected = True
+                self.inference_worker.start()
                 self.camera_thread = threading.Thread(target=self.update_camera)
                 self.camera_thread.daemon = True
                 self.camera_thread.start()
@@ -455,7 +701,8 @@ class WasteSorterApp:
                 
                 # Update UI
                 self.connect_btn.configure(text="Disconnect")
-                self.analyze_btn.state(['!disabled'])
+                if self.engine is not None:
+                    self.analyze_btn.state(['!disabled'])
                 self.status_var.set(f"Connected to Arduino on {port} and camera {camera_idx}")
             
             except Exception as e:
@@ -481,6 +728,8 @@ class WasteSorterApp:
         else:
             # Disconnect
             self.is_connected = False
+            self.inference_worker.stop()
+            self.inference_label.configure(text="Idle")
             
             if self.camera is not None:
                 time.sleep(0.5)  # Allow threads to exit
@@ -546,6 +795,18 @@ class WasteSorterApp:
             self.status_var.set("Auto-sort mode enabled. Items will be sorted automatically.")
         else:
             self.status_var.set("Auto-sort mode disabled. Manual sorting required.")
+            stats = self.inference_worker.get_stats()
+            logger.info(f"Inference stats: {stats['processed']} processed, "
+                        f"{stats['dropped']} dropped ({stats['drop_rate']:.1%}), "
+                        f"{stats['inference_fps']:.1f} fps")
+            if self.presence_detector is not None:
+                presence_stats = self.presence_detector.get_stats()
+                logger.info(f"Presence gate: {presence_stats['skipped_frames']} of "
+                            f"{presence_stats['skipped_frames'] + presence_stats['inference_frames']} "
+                            f"frames skipped ({presence_stats['skipped_fraction']:.1%})")
+            decision_stats = self.decision_policy.get_stats()
+            logger.info(f"Decision stats ({decision_stats['policy']}): {decision_stats['decisions']} items, "
+                        f"mean time-to-decision {decision_stats['mean_time_to_decision']:.2f}s")
     
     def update_camera(self):
         """Update camera feed continuously"""
@@ -576,6 +837,17 @@ class WasteSorterApp:
                     # Store current frame for analysis
                     self.current_frame = frame
                     
+                    # Track whether an item is on the platform
+                    if self.presence_detector is not None:
+                        state = self.presence_detector.update(frame)
+                        if state != self.platform_state:
+                            if state == EMPTY:
+                                # Item left the platform, forget its evidence
+                                self.root.after(0, self.decision_policy.reset)
+                                if self.shadow is not None:
+                                    self.shadow.reset_item()
+                            self.platform_state = state
+                    
                     # Display in UI
                     img = Image.fromarray(display_frame)
                     imgtk = ImageTk.PhotoImage(image=img)
@@ -586,14 +858,43 @@ class WasteSorterApp:
                     if (self.auto_sort_active and 
                         not self.is_sorting and 
                         (time.time() * 1000 - self.last_sorted_time > self.auto_sort_min_interval)):
-                        # Call on main thread to avoid threading issues
-                        self.root.after(0, self.auto_analyze_and_sort)
+                        # Only classify once an item has arrived and settled
+                        if self.presence_detector is None:
+                            self.submit_model_frame(frame)
+                        elif self.presence_detector.should_infer:
+                            self.presence_detector.record_gate(self.submit_model_frame(frame))
+                        else:
+                            self.presence_detector.record_gate(False)
             except Exception as e:
                 logger.error(f"Camera error: {str(e)}")
                 time.sleep(0.1)
             
-            # Slight delay to reduce CPU usage
-            time.sleep(0.03)
+            # Slight delay to reduce CPU usage; longer while the platform is empty
+            if self.presence_detector is not None:
+                time.sleep(self.presence_detector.frame_interval)
+            else:
+                time.sleep(0.03)
+    
+    def submit_model_frame(self, frame):
+        """Send a frame to the inference worker unless it fails the quality gate"""
+        model_frame = self.get_model_frame(frame)
+        
+        if self.quality_gate is not None:
+            motion_ratio = None
+            if self.presence_detector is not None:
+                motion_ratio = self.presence_detector.motion_ratio
+            if not self.quality_gate.check(model_frame, motion_ratio=motion_ratio):
+                return False
+        
+        self.inference_worker.submit(model_frame)
+        return True
+    
+    def get_model_frame(self, frame):
+        """Crop a frame to the platform or item region before classification"""
+        foreground_mask = None
+        if self.presence_detector is not None:
+            foreground_mask = self.presence_detector.foreground_mask
+        return self.platform_roi.crop(frame, foreground_mask)
     
     def monitor_arduino(self):
         """Monitor Arduino serial output for messages"""
@@ -628,103 +929,96 @@ class WasteSorterApp:
             # Slight delay to reduce CPU usage
             time.sleep(0.1)
     
-    def auto_analyze_and_sort(self):
-        """Automatically analyze the current frame and sort if confidence is high"""
-        if self.current_frame is None or self.model is None:
+    def auto_analyze_and_sort(self, frame):
+        """Classify a frame for auto-sort (runs on the inference worker thread)"""
+        if frame is None or self.engine is None:
+            return None
+        
+        # Analyze the frame (through the cascade gate when enabled)
+        classifier = self.cascade if self.cascade is not None else self.engine
+        result = classifier.classify(frame)
+        result["timestamp"] = time.time()
+        
+        # Hand the frame to the shadow model after production is done with it
+        if self.shadow is not None:
+            self.shadow.offer(frame, result)
+        return result
+    
+    def post_inference_result(self, result):
+        """Post an inference result back to the Tk main thread"""
+        self.root.after(0, self.apply_auto_sort_result, result)
+    
+    def apply_auto_sort_result(self, result):
+        """Apply an auto-sort classification and sort if confidence is high (main thread)"""
+        if not self.auto_sort_active or not self.is_connected:
             return
         
         try:
-            # Analyze the current frame
-            processed_img = self.preprocess_image(self.current_frame)
-            predictions = self.model.predict(processed_img)
-            predicted_class = np.argmax(predictions[0])
-            confidence = float(predictions[0][predicted_class])
-            
-            # Get class name from mapping
-            class_name = self.class_mapping.get(str(predicted_class), f"Class {predicted_class}")
-            sort_as = "Can" if "can" in class_name.lower() else "Recycling" if "recycling" in class_name.lower() else "Garbage"
+            predicted_class = result["class_id"]
+            confidence = result["confidence"]
+            sort_as = result["sort_as"]
 
-            # If confidence is ≥ 90% and classification is stable, track time
-            if confidence >= 0.90:
-                if self.current_classification == sort_as:
-                    # Classification is the same as last time, check if 5 seconds have passed
-                    if self.last_high_confidence_time and (time.time() - self.last_high_confidence_time >= self.min_confidence_time):
-                        print(f"Read {predicted_class} for {self.min_confidence_time} seconds")
-                        if not self.is_sorting:  # Only sort once per item
-                            self.sort_item_with_classification(sort_as)
-                            self.is_sorting = True  # Prevent repeated sorting
-                else:
-                    # New classification detected, reset timer
-                    self.current_classification = sort_as
-                    self.last_high_confidence_time = time.time()
-                    self.is_sorting = False  # Allow sorting for a new item
-            else:
-                # Confidence dropped below threshold, reset timer
-                self.last_high_confidence_time = None
-                self.current_classification = None
-                self.is_sorting = False  # Reset sorting flag
+            # Ignore results that arrive while the platform is moving
+            if self.is_sorting:
+                return
 
             # Update UI
             self.class_label.configure(text=f"Class: {predicted_class}")
             self.conf_label.configure(text=f"{confidence:.2%}")
             self.sort_label.configure(text=sort_as)
             self.confidence = confidence
+            self.update_inference_display()
+
+            # Accumulate evidence and sort once the policy commits
+            decision = self.decision_policy.update(result, result["timestamp"])
+            if decision is not None:
+                if self.shadow is not None:
+                    self.shadow.record_decision(decision)
+                self.current_classification = decision["sort_as"]
+                self.confidence = decision["confidence"]
+                self.sort_item_with_classification(decision["sort_as"], decision=decision)
 
         except Exception as e:
             logger.error(f"Auto-sort error: {str(e)}")
     
-    def preprocess_image(self, image):
-        """Preprocess image for the model"""
-        img = cv2.resize(image, (224, 224))
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img = img / 255.0
-        img = np.expand_dims(img, axis=0)
-        return img
+    def flush_shadow_stats(self):
+        """Store shadow model agreement in the database (main thread, once a minute)"""
+        if self.shadow is None:
+            return
+        
+        try:
+            self.shadow.flush(self.db)
+        except Exception as e:
+            logger.error(f"Error storing shadow evaluation: {str(e)}")
+        self.root.after(60000, self.flush_shadow_stats)
+    
+    def update_inference_display(self):
+        """Update the inference rate and dropped frame counters in the UI"""
+        stats = self.inference_worker.get_stats()
+        text = (f"{stats['inference_fps']:.1f} fps, {stats['latency_ms']:.0f} ms, "
+                f"{stats['dropped']} dropped")
+        if self.presence_detector is not None:
+            text += f", {self.presence_detector.skipped_fraction:.0%} skipped"
+        if self.quality_gate is not None:
+            text += f", {self.quality_gate.skipped_frames} low quality"
+        if self.cascade is not None:
+            text += f", {self.cascade.get_stats()['gate_hit_rate']:.0%} gate"
+        self.inference_label.configure(text=text)
     
     def analyze_item(self):
         """Analyze the current item in view"""
-        if self.current_frame is None or self.model is None:
+        if self.current_frame is None or self.engine is None:
             self.status_var.set("Error: No frame available or model not loaded")
             return
         
         try:
             self.status_var.set("Analyzing item...")
             
-            # Preprocess the image
-            processed_img = self.preprocess_image(self.current_frame)
-            
-            # Check if we're using a custom model or the pretrained one
-            if hasattr(self, 'class_mapping'):
-                # Using custom model
-                predictions = self.model.predict(processed_img)
-                predicted_class = np.argmax(predictions[0])
-                confidence = float(predictions[0][predicted_class])
-                
-                # Get class name from mapping
-                class_name = self.class_mapping.get(str(predicted_class), f"Class {predicted_class}")
-                
-                if "can" in class_name.lower():
-                    sort_as = "Can"
-                elif "recycling" in class_name.lower():
-                    sort_as = "Recycling"
-                else:
-                    sort_as = "Garbage"
-            else:
-                # Using pretrained model
-                predictions = self.model.predict(processed_img)
-                predicted_class = np.argmax(predictions[0])
-                confidence = float(predictions[0][predicted_class])
-                
-                # Determine if can, recyclable, or garbage based on ImageNet classes
-                can_classes = [482, 483, 810]  # Can related classes
-                recyclable_classes = [494, 440, 672, 802, 965, 611]  # Recyclable classes
-                
-                if predicted_class in can_classes:
-                    sort_as = "Can"
-                elif predicted_class in recyclable_classes:
-                    sort_as = "Recycling"
-                else:
-                    sort_as = "Garbage"
+            # Classify the frame (custom mapping or ImageNet classes)
+            result = self.engine.classify(self.get_model_frame(self.current_frame))
+            predicted_class = result["class_id"]
+            confidence = result["confidence"]
+            sort_as = result["sort_as"]
             
             # Update UI
             self.class_label.configure(text=f"Class: {predicted_class}")
@@ -756,7 +1050,7 @@ class WasteSorterApp:
         """Send command to sort the current item"""
         self.sort_item_with_classification(self.current_classification)
     
-    def sort_item_with_classification(self, classification, trigger_upload=True):
+    def sort_item_with_classification(self, classification, trigger_upload=True, decision=None):
         """Sort an item with a given classification"""
         if not self.is_connected or self.arduino is None:
             self.status_var.set("Error: Not connected to Arduino")
@@ -796,6 +1090,12 @@ class WasteSorterApp:
                     "timestamp": datetime.now().isoformat()
                 }
                 
+                # Record how the auto-sort decision was reached
+                if decision is not None:
+                    metadata["decision_policy"] = decision["policy"]
+                    metadata["time_to_decision"] = decision["time_to_decision"]
+                    metadata["decision_frames"] = decision["frames"]
+                
                 # Log to database
                 event_id = self.db.add_sort_event(
                     classification.lower(),
@@ -803,7 +1103,8 @@ class WasteSorterApp:
                     "recycling" if classification != "Garbage" else "garbage",
                     self.current_frame,
                     None,  # user_id
-                    metadata
+                    metadata,
+                    model_version=self.model_version
                 )
             
             # Update UI
@@ -922,6 +1223,7 @@ class WasteSorterApp:
     def reset_after_sort(self):
         """Reset UI after sorting complete and trigger data upload"""
         self.is_sorting = False
+        self.decision_policy.reset()
         self.analyze_btn.state(['!disabled'])
         self.status_var.set("Ready for next item")
         
@@ -1194,6 +1496,12 @@ class WasteSorterApp:
                    log_text, progress_var, dialog):
         """Run the model training process in a separate thread"""
         try:
+            # TensorFlow is only needed for training, so it is imported here
+            # rather than slowing down every start of the sorting app
+            import tensorflow as tf
+            from tensorflow import keras
+            from train_model import WasteClassifierTrainer
+            
             # Create a custom logger that writes to the log_text widget
             class TextWidgetHandler(logging.Handler):
                 def __init__(self, text_widget):
@@ -1332,7 +1640,12 @@ class WasteSorterApp:
                 training_logger.info(f"Model saved to {final_model_path}")
                 
                 # Also save as the latest model
-                trainer.model.save(os.path.join(trainer.model_dir, 'latest_model.h5'))
+                latest_model_path = os.path.join(trainer.model_dir, 'latest_model.h5')
+                trainer.model.save(latest_model_path)
+                trainer.model_path = latest_model_path
+                
+                # Refit confidence calibration, since the previous one belongs to the old model
+                trainer.calibrate_model(model_paths=[final_model_path, latest_model_path])
             
             # Replace the train_model method
             trainer.train_model = train_with_callback
@@ -1417,6 +1730,39 @@ class WasteSorterApp:
             logger.error(error_msg)
             messagebox.showerror("Camera Test", error_msg)
     
+    def calibrate_platform_roi(self):
+        """Select the platform region on the current camera frame"""
+        if self.current_frame is None:
+            messagebox.showerror("Platform Calibration", "Connect the camera before calibrating.")
+            return
+        
+        try:
+            # Select on a display-sized copy, then scale back to the frame
+            frame = self.current_frame.copy()
+            h, w = frame.shape[:2]
+            scale = min(1.0, 1280 / w)
+            preview = cv2.resize(frame, (int(w * scale), int(h * scale)))
+            
+            window = "Drag a box around the platform, then press Enter"
+            rect = cv2.selectROI(window, preview, showCrosshair=False)
+            cv2.destroyWindow(window)
+            
+            if rect[2] == 0 or rect[3] == 0:
+                self.status_var.set("Platform calibration cancelled")
+                return
+            
+            rect = tuple(int(v / scale) for v in rect)
+            self.platform_roi.calibrate(frame.shape, rect)
+            if self.platform_roi.mode == "full":
+                self.platform_roi.mode = "fixed"
+            
+            self.status_var.set(f"Platform region saved: {rect}")
+        
+        except Exception as e:
+            error_msg = f"Platform calibration error: {str(e)}"
+            logger.error(error_msg)
+            messagebox.showerror("Platform Calibration", error_msg)
+    
     def test_arduino(self):
         """Test the Arduino connection"""
         if self.arduino is not None:
@@ -1602,6 +1948,22 @@ class WasteSorterApp:
         """Exit the application"""
         if messagebox.askyesno("Exit", "Are you sure you want to exit?"):
             # Cleanup
+            self.inference_worker.stop()
+            
+            # Record how many inferences the gates saved this session
+            if self.quality_gate is not None:
+                logger.info(f"Frame quality gate: {self.quality_gate.get_stats()}")
+            logger.info(f"Decision policy: {self.decision_policy.get_stats()}")
+            
+            # Store the last shadow interval before the database closes
+            if self.shadow is not None:
+                self.shadow.stop()
+                self.shadow.flush(self.db)
+            
+            # Stop the inference server process if one is running
+            if self.engine is not None and hasattr(self.engine.backend, 'close'):
+                self.engine.backend.close()
+            
             if self.arduino:
                 try:
                     self.arduino.write(b'N')  # Reset to neutral position
@@ -1636,12 +1998,65 @@ def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Waste Sorting System')
     parser.add_argument('--debug', action='store_true', help='Enable debug logging')
+    parser.add_argument('--backend', type=str, default=None, choices=BACKENDS,
+                        help='Inference backend for the classifier (defaults to the active model version, '
+                             'else keras)')
+    parser.add_argument('--model_path', type=str, default=None,
+                        help='Model file to load (defaults to latest_model.h5 or waste_classifier.tflite)')
+    parser.add_argument('--num_threads', type=int, default=None,
+                        help='Number of CPU threads for the TFLite interpreter')
+    parser.add_argument('--decision_policy', type=str, default='timer', choices=DECISION_POLICIES,
+                        help='Auto-sort decision policy')
+    parser.add_argument('--decision_error', type=float, default=None,
+                        help='Target error rate for the sprt and ema decision policies')
+    parser.add_argument('--no_presence_gate', action='store_true',
+                        help='Classify every frame in auto-sort mode, even when the platform is empty')
+    parser.add_argument('--roi_mode', type=str, default='full', choices=ROI_MODES,
+                        help='Region fed to the model: full frame, calibrated platform, or detected item')
+    parser.add_argument('--inference_process', action='store_true',
+                        help='Run the model in a separate process fed through shared memory')
+    parser.add_argument('--no_model_cache', action='store_true',
+                        help='Always load the Keras model instead of the cached prepared artifact')
+    parser.add_argument('--no_quality_gate', action='store_true',
+                        help='Classify blurred, badly exposed or motion-smeared frames too')
+    parser.add_argument('--cascade', type=str, default=None, choices=CASCADE_GATES,
+                        help='Classify with a cheap gate first and run the full model only when unsure')
+    parser.add_argument('--cascade_margin', type=float, default=0.5,
+                        help='Minimum gate category margin to accept the gate result')
+    parser.add_argument('--gate_model_path', type=str, default=None,
+                        help='Small model (.h5, .tflite or .onnx) used by the model gate')
+    parser.add_argument('--shadow_model', type=str, default=None,
+                        help='Candidate model (.h5, .tflite or .onnx) to evaluate on live frames')
+    parser.add_argument('--shadow_sample_rate', type=float, default=0.25,
+                        help='Fraction of classified frames offered to the shadow model')
+    parser.add_argument('--shadow_cpu_budget', type=float, default=0.2,
+                        help='Average fraction of one CPU core the shadow model may use')
+    parser.add_argument('--model_version', type=str, default=None,
+                        help='Registry version to load (defaults to the active version, if any)')
+    parser.add_argument('--stations', type=str, default=None,
+                        help='JSON station config; runs several camera/Arduino stations headless')
+    parser.add_argument('--conveyor', action='store_true',
+                        help='With --stations, track several items per camera and sort each as it '
+                             'reaches the platform (stations can also set "mode": "conveyor")')
     args = parser.parse_args()
     
     # Set up logging level
     if args.debug:
         logger.setLevel(logging.DEBUG)
     
+    # Multi-station mode runs without the GUI
+    if args.stations:
+        from multi_station import run_stations
+        run_stations(args.stations, backend=args.backend, model_path=args.model_path,
+                     num_threads=args.num_threads, decision_policy=args.decision_policy,
+                     decision_error=args.decision_error,
+                     presence_gate=not args.no_presence_gate,
+                     roi_mode=args.roi_mode,
+                     use_model_cache=not args.no_model_cache,
+                     model_version=args.model_version,
+                     conveyor=args.conveyor)
+        return
+    
     # Create the Tkinter root
     root = tk.Tk()
     
@@ -1657,7 +2072,21 @@ def main():
         pass  # Icon not found, continue without it
     
     # Create the application
-    app = WasteSorterApp(root)
+    app = WasteSorterApp(root, backend=args.backend, model_path=args.model_path,
+                         num_threads=args.num_threads, decision_policy=args.decision_policy,
+                         decision_error=args.decision_error,
+                         presence_gate=not args.no_presence_gate,
+                         roi_mode=args.roi_mode,
+                         inference_process=args.inference_process,
+                         use_model_cache=not args.no_model_cache,
+                         cascade_gate=args.cascade,
+                         cascade_margin=args.cascade_margin,
+                         gate_model_path=args.gate_model_path,
+                         quality_gate=not args.no_quality_gate,
+                         shadow_model_path=args.shadow_model,
+                         shadow_sample_rate=args.shadow_sample_rate,
+                         shadow_cpu_budget=args.shadow_cpu_budget,
+                         model_version=args.model_version)
     
     # Run the application
     root.mainloop()
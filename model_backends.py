@@ -0,0 +1,366 @@
+# model_backends.py - Inference backends for the waste sorting system
+import os
+import json
+import logging
+import numpy as np
+
+import model_cache
+
+logger = logging.getLogger("WasteSorter")
+
+# Backends selectable from the command line
+BACKENDS = ["keras", "tflite", "opencv", "few_shot"]
+
+# Backend for a model file, by extension
+MODEL_EXTENSIONS = {".h5": "keras", ".tflite": "tflite", ".onnx": "opencv"}
+
+
+def backend_for_path(model_path):
+    """Name of the backend that runs a model file"""
+    backend = MODEL_EXTENSIONS.get(os.path.splitext(model_path)[1].lower())
+    if backend is None:
+        raise ValueError(f"Unsupported model file: {model_path}")
+    return backend
+
+
+# Model file loaded from the model directory when no path is given
+DEFAULT_MODEL_FILES = {"keras": "latest_model.h5", "tflite": "waste_classifier.tflite",
+                       "opencv": "waste_classifier.onnx", "few_shot": "few_shot.npz"}
+
+
+def default_model_path(backend, model_dir="models"):
+    """Path of a backend's default model file in the model directory"""
+    return os.path.join(model_dir, DEFAULT_MODEL_FILES[backend])
+
+
+def load_class_mapping(model_dir="models"):
+    """Load class_mapping.json from the model directory (None if missing)"""
+    mapping_path = os.path.join(model_dir, "class_mapping.json")
+    if not os.path.exists(mapping_path):
+        return None
+
+    with open(mapping_path, 'r') as f:
+        class_mapping = json.load(f)
+    logger.info(f"Loaded class mapping: {class_mapping}")
+    return class_mapping
+
+
+class KerasBackend:
+    """Runs a Keras model (.h5) through TensorFlow
+
+    Inference goes through a tf.function traced once for a fixed input
+    shape instead of model.predict, which builds a new data adapter and
+    dataset on every call.
+    """
+
+    name = "keras"
+
+    def __init__(self, model=None, model_path=None, batch_size=1):
+        """Wrap an existing Keras model or load one from model_path"""
+        import tensorflow as tf
+
+        if model is None:
+            model = tf.keras.models.load_model(model_path)
+            logger.info(f"Loaded custom model: {model_path}")
+
+        self.model = model
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.input_shape = tuple(model.input_shape[1:])
+        self.input_dtype = np.float32
+
+        # Reusable input buffer for single-frame inference
+        self.input_buffer = np.zeros((batch_size, *self.input_shape), dtype=np.float32)
+
+        # Compiled forward pass for the fixed (batch_size, H, W, C) shape, plus
+        # one traced with a dynamic batch dimension for batched callers
+        self._tf = tf
+        self._infer = tf.function(
+            lambda x: self.model(x, training=False),
+            input_signature=[tf.TensorSpec((batch_size, *self.input_shape), tf.float32)]
+        )
+        self._infer_batch = tf.function(
+            lambda x: self.model(x, training=False),
+            input_signature=[tf.TensorSpec((None, *self.input_shape), tf.float32)]
+        )
+
+    @classmethod
+    def imagenet(cls, input_shape=(224, 224, 3)):
+        """Create a backend around the pre-trained ImageNet MobileNetV2"""
+        import tensorflow as tf
+        model = tf.keras.applications.MobileNetV2(
+            input_shape=input_shape,
+            include_top=True,
+            weights='imagenet'
+        )
+        logger.info("Loaded pre-trained MobileNetV2 model")
+        return cls(model=model)
+
+    def predict(self, batch):
+        """Run a forward pass on a preprocessed batch"""
+        tensor = self._tf.convert_to_tensor(batch, dtype=self._tf.float32)
+        if batch.shape[0] == self.batch_size:
+            return self._infer(tensor).numpy()
+        return self._infer_batch(tensor).numpy()
+
+    def predict_frame(self, fill):
+        """Run one frame written by fill(out, scale, offset) into the reusable input buffer"""
+        fill(self.input_buffer[0], 1.0 / 255.0, 0.0)
+        return self._infer(self.input_buffer[:self.batch_size]).numpy()
+
+
+class TFLiteBackend:
+    """Runs an exported .tflite model through the TFLite interpreter
+
+    The interpreter is created from the model path, which makes TFLite
+    memory-map the flatbuffer instead of reading it into the Python heap.
+    The lightweight tflite_runtime package is used when installed, otherwise
+    the interpreter bundled with TensorFlow.
+
+    Batches run on separate interpreters allocated once per power-of-two
+    batch size, with the batch padded up to that size, so a batch size that
+    changes from call to call never reallocates tensors.
+    """
+
+    name = "tflite"
+
+    def __init__(self, model_path, num_threads=None):
+        """Load the model and allocate its tensors"""
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"TFLite model not found: {model_path}")
+
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self._interpreter_class = Interpreter
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+
+        input_details = self.interpreter.get_input_details()[0]
+        output_details = self.interpreter.get_output_details()[0]
+        self.input_index = input_details['index']
+        self.output_index = output_details['index']
+        self.input_shape = tuple(input_details['shape'][1:])
+        self.input_dtype = input_details['dtype']
+        self.input_quantization = input_details['quantization']
+        self.output_dtype = output_details['dtype']
+        self.output_quantization = output_details['quantization']
+        self.batch_size = int(input_details['shape'][0])
+
+        # Interpreters allocated for padded batch sizes, keyed by that size
+        self._batch_interpreters = {}
+        if self.batch_size != 1:
+            self._set_batch_size(self.interpreter, 1)
+            self.batch_size = 1
+
+        logger.info(f"Loaded TFLite model: {model_path} "
+                    f"(threads={num_threads or 'default'}, input={self.input_dtype.__name__})")
+
+    def _quantize_input(self, batch):
+        """Convert a float batch to the interpreter's input type"""
+        if self.input_dtype == np.float32:
+            return batch.astype(np.float32, copy=False)
+
+        scale, zero_point = self.input_quantization
+        info = np.iinfo(self.input_dtype)
+        quantized = np.round(batch / scale + zero_point)
+        return np.clip(quantized, info.min, info.max).astype(self.input_dtype)
+
+    def _dequantize_output(self, output):
+        """Convert the interpreter output back to float probabilities"""
+        if self.output_dtype == np.float32:
+            return output
+
+        scale, zero_point = self.output_quantization
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def _set_batch_size(self, interpreter, batch_size):
+        """Resize an interpreter's input tensor for a batch size (reallocates tensors)"""
+        interpreter.resize_tensor_input(self.input_index, [batch_size, *self.input_shape])
+        interpreter.allocate_tensors()
+
+    def _batch_interpreter(self, batch_size):
+        """Interpreter allocated for the smallest power of two holding batch_size"""
+        padded = 1 << (batch_size - 1).bit_length()
+        interpreter = self._batch_interpreters.get(padded)
+        if interpreter is None:
+            interpreter = self._interpreter_class(model_path=self.model_path, num_threads=self.num_threads)
+            self._set_batch_size(interpreter, padded)
+            self._batch_interpreters[padded] = interpreter
+            logger.debug(f"Allocated TFLite interpreter for batches of {padded}")
+        return interpreter, padded
+
+    def predict_frame(self, fill):
+        """Run one frame written by fill(out, scale, offset) directly into the input tensor"""
+        if self.input_dtype == np.float32:
+            scale, offset = 1.0 / 255.0, 0.0
+        else:
+            # Map pixel values straight to the quantized input range
+            input_scale, zero_point = self.input_quantization
+            scale, offset = 1.0 / (255.0 * input_scale), float(zero_point)
+            if abs(scale - 1.0) < 1e-3 and offset == 0.0:
+                scale = 1.0
+
+        # The view must be released before invoke()
+        input_view = self.interpreter.tensor(self.input_index)()
+        fill(input_view[0], scale, offset)
+        del input_view
+
+        self.interpreter.invoke()
+        return self._dequantize_output(self.interpreter.get_tensor(self.output_index))
+
+    def predict(self, batch):
+        """Run the interpreter on a preprocessed batch in a single invoke"""
+        count = len(batch)
+        if count == 1:
+            interpreter, padded = self.interpreter, 1
+        else:
+            interpreter, padded = self._batch_interpreter(count)
+
+        inputs = self._quantize_input(batch)
+        if padded != count:
+            # Padding rows are zeros; their outputs are dropped
+            inputs = np.concatenate([inputs, np.zeros((padded - count, *inputs.shape[1:]), dtype=inputs.dtype)])
+
+        interpreter.set_tensor(self.input_index, inputs)
+        interpreter.invoke()
+        return self._dequantize_output(interpreter.get_tensor(self.output_index)[:count])
+
+
+class OpenCVDNNBackend:
+    """Runs an ONNX export of the model through OpenCV's DNN module
+
+    Needs neither TensorFlow nor tflite_runtime, so the app can start
+    without importing TensorFlow at all. The model is exported with NCHW
+    input by WasteClassifierTrainer.export_onnx_model; the input size is
+    read from the JSON file written next to it.
+    """
+
+    name = "opencv"
+
+    def __init__(self, model_path, num_threads=None):
+        """Load the network and allocate its input blob"""
+        import cv2
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX model not found: {model_path}")
+
+        self.model_path = model_path
+        self.num_threads = num_threads
+        if num_threads:
+            cv2.setNumThreads(num_threads)
+
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+        self.input_shape = (224, 224, 3)
+        info_path = os.path.splitext(model_path)[0] + ".json"
+        if os.path.exists(info_path):
+            with open(info_path, 'r') as f:
+                self.input_shape = tuple(json.load(f)["input_shape"])
+        self.input_dtype = np.float32
+
+        # NCHW input blob; frames are written through an (H, W, C) view of it
+        height, width, channels = self.input_shape
+        self.input_blob = np.zeros((1, channels, height, width), dtype=np.float32)
+        self.input_view = self.input_blob[0].transpose(1, 2, 0)
+
+        logger.info(f"Loaded ONNX model with OpenCV DNN: {model_path} (threads={num_threads or 'default'})")
+
+    def predict_frame(self, fill):
+        """Run one frame written by fill(out, scale, offset) into the input blob"""
+        fill(self.input_view, 1.0 / 255.0, 0.0)
+        self.net.setInput(self.input_blob)
+        return self.net.forward()
+
+    def predict(self, batch):
+        """Run the network on a preprocessed NHWC batch in one forward pass"""
+        self.net.setInput(np.ascontiguousarray(batch.transpose(0, 3, 1, 2), dtype=np.float32))
+        return self.net.forward()
+
+
+def _cached_backend(model_path, num_threads, cache_dir):
+    """Load the cached TFLite artifact for a Keras model; returns (key, backend or None)"""
+    key, cached_path = model_cache.find_cached_artifact(model_path, cache_dir)
+    if cached_path is None:
+        return key, None
+
+    try:
+        backend = TFLiteBackend(cached_path, num_threads=num_threads)
+        os.utime(cached_path)  # Mark as recently used
+        logger.info(f"Loaded cached prepared model for {model_path or 'ImageNet MobileNetV2'}")
+        return key, backend
+    except Exception as e:
+        logger.error(f"Error loading cached model {cached_path}: {str(e)}")
+        return key, None
+
+
+def create_backend(backend="keras", model_dir="models", model_path=None, num_threads=None, use_cache=False):
+    """Create an inference backend and load its class mapping
+
+    Returns (backend, class_mapping). class_mapping is None when the
+    pre-trained ImageNet model is used.
+
+    When the default latest_model.h5 is missing, the Keras backend falls
+    back to the few-shot classifier if models/few_shot.npz exists, else to
+    the ImageNet model; an explicit model_path that does not exist raises
+    FileNotFoundError.
+
+    With use_cache, a Keras model is served from a TFLite artifact cached
+    under <model_dir>/cache and keyed by the checksum of the .h5 file, which
+    skips HDF5 deserialisation. On a cache miss the Keras model is loaded
+    as usual and the artifact is built in the background for next time.
+    """
+    if backend == "tflite":
+        model_path = model_path or default_model_path("tflite", model_dir)
+        return TFLiteBackend(model_path, num_threads=num_threads), load_class_mapping(model_dir)
+
+    if backend == "opencv":
+        model_path = model_path or default_model_path("opencv", model_dir)
+        return OpenCVDNNBackend(model_path, num_threads=num_threads), load_class_mapping(model_dir)
+
+    if backend == "keras":
+        if model_path is not None and not os.path.exists(model_path):
+            raise FileNotFoundError(f"Keras model not found: {model_path}")
+
+        model_path = model_path or default_model_path("keras", model_dir)
+        if os.path.exists(model_path):
+            class_mapping = load_class_mapping(model_dir)
+        elif os.path.exists(default_model_path("few_shot", model_dir)):
+            # No trained model yet, but few-shot classes have been added
+            logger.info("No trained model found, using the few-shot classifier")
+            from few_shot import create_few_shot_backend
+            return create_few_shot_backend(model_dir)
+        else:
+            # No trained model or few-shot classes: fall back to the pre-trained model
+            model_path = None
+            class_mapping = None
+
+        cache_dir = model_cache.cache_dir_for(model_dir)
+        if use_cache:
+            key, cached = _cached_backend(model_path, num_threads, cache_dir)
+            if cached is not None:
+                return cached, class_mapping
+
+        if model_path is not None:
+            keras_backend = KerasBackend(model_path=model_path)
+        else:
+            keras_backend = KerasBackend.imagenet()
+
+        if use_cache:
+            model_cache.build_cached_artifact_async(keras_backend.model, key, cache_dir)
+
+        return keras_backend, class_mapping
+
+    if backend == "few_shot":
+        # Nearest-centroid classes on frozen MobileNetV2 features (see few_shot.py)
+        from few_shot import create_few_shot_backend
+        return create_few_shot_backend(model_dir, model_path)
+
+    raise ValueError(f"Unknown backend: {backend}")
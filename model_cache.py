@@ -0,0 +1,113 @@
+# model_cache.py - Cache of prepared model artifacts for fast startup
+import os
+import hashlib
+import threading
+import logging
+
+logger = logging.getLogger("WasteSorter")
+
+# Cache directory inside a model directory
+CACHE_DIRNAME = "cache"
+DEFAULT_CACHE_DIR = os.path.join("models", CACHE_DIRNAME)
+
+# Key used for the pre-trained ImageNet model, which has no file to hash
+IMAGENET_KEY = "imagenet_mobilenet_v2"
+
+
+def cache_dir_for(model_dir="models"):
+    """Cache directory of a model directory"""
+    return os.path.join(model_dir, CACHE_DIRNAME)
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """SHA-256 checksum of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(model_path):
+    """Cache key for a model file (its checksum), or the ImageNet key when model_path is None"""
+    if model_path is None:
+        return IMAGENET_KEY
+    return file_checksum(model_path)
+
+
+def cached_artifact_path(key, cache_dir=DEFAULT_CACHE_DIR):
+    """Path of the cached TFLite artifact for a key"""
+    return os.path.join(cache_dir, f"{key}.tflite")
+
+
+def find_cached_artifact(model_path, cache_dir=DEFAULT_CACHE_DIR):
+    """Return (key, path) of a cached artifact for the model; path is None if not cached yet"""
+    key = cache_key(model_path)
+    path = cached_artifact_path(key, cache_dir)
+    return key, (path if os.path.exists(path) else None)
+
+
+def build_cached_artifact(keras_model, key, cache_dir=DEFAULT_CACHE_DIR, keep=3):
+    """Convert a loaded Keras model to a float TFLite file in the cache
+
+    The file is written under a temporary name and renamed into place, so
+    a crash during conversion never leaves a truncated artifact behind.
+    """
+    import tensorflow as tf
+
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cached_artifact_path(key, cache_dir)
+    temp_path = path + ".tmp"
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    tflite_model = converter.convert()
+
+    with open(temp_path, 'wb') as f:
+        f.write(tflite_model)
+    os.replace(temp_path, path)
+    logger.info(f"Cached prepared model at {path}")
+
+    prune_cache(cache_dir, keep=keep, protect=path)
+    return path
+
+
+def ensure_cached_artifact(model_path, cache_dir=DEFAULT_CACHE_DIR):
+    """Path of the cached TFLite artifact for a .h5 file, converting it now if it is not cached yet"""
+    key, path = find_cached_artifact(model_path, cache_dir)
+    if path is not None:
+        os.utime(path)  # Mark as recently used
+        return path
+
+    import tensorflow as tf
+    return build_cached_artifact(tf.keras.models.load_model(model_path), key, cache_dir)
+
+
+def build_cached_artifact_async(keras_model, key, cache_dir=DEFAULT_CACHE_DIR):
+    """Build the cached artifact in a background thread"""
+    def run():
+        try:
+            build_cached_artifact(keras_model, key, cache_dir)
+        except Exception as e:
+            logger.error(f"Error caching prepared model: {str(e)}")
+
+    thread = threading.Thread(target=run, name="ModelCache", daemon=True)
+    thread.start()
+    return thread
+
+
+def prune_cache(cache_dir=DEFAULT_CACHE_DIR, keep=3, protect=None):
+    """Delete all but the most recently used cached artifacts"""
+    if not os.path.isdir(cache_dir):
+        return
+
+    artifacts = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith(".tflite")]
+    artifacts.sort(key=os.path.getmtime, reverse=True)
+
+    for path in artifacts[keep:]:
+        if path == protect:
+            continue
+        try:
+            os.remove(path)
+            logger.debug(f"Removed old cached model {path}")
+        except OSError:
+            pass
@@ -0,0 +1,274 @@
+# model_registry.py - Versioned store of deployable models
+import os
+import json
+import shutil
+import argparse
+import logging
+from datetime import datetime
+
+from model_cache import file_checksum
+from model_backends import MODEL_EXTENSIONS, backend_for_path
+
+logger = logging.getLogger("WasteSorter")
+
+DEFAULT_REGISTRY_DIR = os.path.join("models", "registry")
+
+
+class ModelRegistry:
+    """Versioned model artifacts under models/registry
+
+    Each version is a directory holding the model file, its
+    class_mapping.json and a metadata.json with the checksum, metrics and
+    creation time:
+
+        models/registry/index.json
+        models/registry/v3/waste_classifier.tflite
+        models/registry/v3/class_mapping.json
+        models/registry/v3/metadata.json
+
+    index.json records the active version, the activation history and a
+    stack of activations that rollback pops, so repeated rollbacks walk
+    further back (v3 -> v2 -> v1) instead of toggling between two versions.
+    """
+
+    def __init__(self, root=DEFAULT_REGISTRY_DIR):
+        """Open (or create) a registry directory"""
+        self.root = root
+        self.index_path = os.path.join(root, "index.json")
+        os.makedirs(root, exist_ok=True)
+
+    def _load_index(self):
+        """Read index.json"""
+        if not os.path.exists(self.index_path):
+            return {"active": None, "history": [], "stack": []}
+        with open(self.index_path, 'r') as f:
+            index = json.load(f)
+        if "stack" not in index:
+            # Index written before the rollback stack: rebuild it from the history
+            index["stack"] = [entry["version"] for entry in index["history"]]
+        return index
+
+    def _save_index(self, index):
+        """Write index.json atomically"""
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(index, f, indent=4)
+        os.replace(temp_path, self.index_path)
+
+    def version_dir(self, version):
+        """Directory of a version"""
+        return os.path.join(self.root, version)
+
+    def list_versions(self):
+        """Metadata of all versions, oldest first"""
+        versions = []
+        for name in os.listdir(self.root):
+            metadata_path = os.path.join(self.root, name, "metadata.json")
+            if os.path.exists(metadata_path):
+                with open(metadata_path, 'r') as f:
+                    versions.append(json.load(f))
+        versions.sort(key=lambda m: m["created"])
+        return versions
+
+    def get(self, version):
+        """Metadata of a version"""
+        metadata_path = os.path.join(self.version_dir(version), "metadata.json")
+        if not os.path.exists(metadata_path):
+            raise KeyError(f"Unknown model version: {version}")
+        with open(metadata_path, 'r') as f:
+            return json.load(f)
+
+    def _next_version(self):
+        """Next free version name (v1, v2, ...)"""
+        numbers = [int(name[1:]) for name in os.listdir(self.root)
+                   if name.startswith("v") and name[1:].isdigit()]
+        return f"v{max(numbers, default=0) + 1}"
+
+    def register(self, model_path, class_mapping_path=None, metrics=None, notes=None, version=None):
+        """Copy a model file and its class mapping into a new version; returns the version name"""
+        backend = backend_for_path(model_path)
+        if class_mapping_path is None:
+            class_mapping_path = os.path.join(os.path.dirname(model_path) or ".", "class_mapping.json")
+        if not os.path.exists(class_mapping_path):
+            raise FileNotFoundError(f"Class mapping not found: {class_mapping_path}")
+
+        version = version or self._next_version()
+        target_dir = self.version_dir(version)
+        if os.path.exists(target_dir):
+            raise ValueError(f"Model version already exists: {version}")
+
+        # Build the version in a temporary directory so a half-copied version never appears
+        temp_dir = target_dir + ".tmp"
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+
+        artifact = os.path.basename(model_path)
+        shutil.copy2(model_path, os.path.join(temp_dir, artifact))
+        shutil.copy2(class_mapping_path, os.path.join(temp_dir, "class_mapping.json"))
+
+        # Keep calibration parameters with the model they were fitted on
+        calibration_path = os.path.join(os.path.dirname(class_mapping_path), "calibration.json")
+        if os.path.exists(calibration_path):
+            shutil.copy2(calibration_path, os.path.join(temp_dir, "calibration.json"))
+
+        # ONNX exports keep their input shape in a JSON file next to the model
+        info_path = os.path.splitext(model_path)[0] + ".json"
+        if backend == "opencv" and os.path.exists(info_path):
+            shutil.copy2(info_path, os.path.join(temp_dir, os.path.basename(info_path)))
+
+        metadata = {
+            "version": version,
+            "artifact": artifact,
+            "backend": backend,
+            "checksum": file_checksum(model_path),
+            "source": os.path.abspath(model_path),
+            "created": datetime.now().isoformat(),
+            "metrics": metrics or {},
+            "notes": notes
+        }
+        with open(os.path.join(temp_dir, "metadata.json"), 'w') as f:
+            json.dump(metadata, f, indent=4)
+
+        os.replace(temp_dir, target_dir)
+        logger.info(f"Registered model version {version} from {model_path}")
+        return version
+
+    def artifact_path(self, version):
+        """Path of a version's model file"""
+        return os.path.join(self.version_dir(version), self.get(version)["artifact"])
+
+    def verify(self, version):
+        """Check a version's model file against its recorded checksum"""
+        return file_checksum(self.artifact_path(version)) == self.get(version)["checksum"]
+
+    @property
+    def active_version(self):
+        """Version currently marked active, or None"""
+        return self._load_index()["active"]
+
+    def set_active(self, version):
+        """Mark a version active and record it in the history"""
+        self.get(version)
+        index = self._load_index()
+        if index["active"] == version:
+            return
+        index["active"] = version
+        index["history"].append({"version": version, "activated": datetime.now().isoformat()})
+        index["stack"].append(version)
+        self._save_index(index)
+        logger.info(f"Active model version: {version}")
+
+    def select_version(self, requested_version=None, model_path=None, backend=None):
+        """Version to load at startup, or None to load the model files instead
+
+        A requested version always wins. Otherwise the active version is
+        used, unless a model file was given or an explicitly chosen backend
+        differs from the version's backend.
+        """
+        if requested_version is not None:
+            return requested_version
+
+        active = self.active_version
+        if active is None or model_path is not None:
+            return None
+
+        active_backend = self.get(active)["backend"]
+        if backend is not None and backend != active_backend:
+            logger.info(f"Backend {backend} requested: not loading active model version {active} "
+                        f"({active_backend} backend)")
+            return None
+        return active
+
+    def previous_version(self):
+        """Version a rollback would reactivate, or None"""
+        stack = self._load_index()["stack"]
+        return stack[-2] if len(stack) >= 2 else None
+
+    def rollback(self):
+        """Reactivate the version that was active before the current one; returns it (None if there is none)
+
+        The current activation is popped from the stack, so the next
+        rollback goes one version further back.
+        """
+        index = self._load_index()
+        if len(index["stack"]) < 2:
+            return None
+
+        index["stack"].pop()
+        version = index["stack"][-1]
+        index["active"] = version
+        index["history"].append({"version": version, "activated": datetime.now().isoformat(), "rollback": True})
+        self._save_index(index)
+        logger.info(f"Rolled back to model version {version}")
+        return version
+
+    def load_engine(self, version, num_threads=None, use_cache=False, inference_process=False):
+        """Load and warm up a ClassifierEngine for a version"""
+        if not self.verify(version):
+            raise ValueError(f"Checksum mismatch for model version {version}")
+
+        metadata = self.get(version)
+        model_path = self.artifact_path(version)
+        model_dir = self.version_dir(version)
+
+        if inference_process:
+            from inference_server import create_remote_engine
+            return create_remote_engine(metadata["backend"], model_dir=model_dir, model_path=model_path,
+                                        num_threads=num_threads, use_cache=use_cache)
+
+        from classifier_engine import ClassifierEngine
+        return ClassifierEngine.load(metadata["backend"], model_dir=model_dir, model_path=model_path,
+                                     num_threads=num_threads, use_cache=use_cache)
+
+
+def main():
+    """Command-line management of the registry"""
+    parser = argparse.ArgumentParser(description='Manage versioned models')
+    parser.add_argument('--registry', type=str, default=DEFAULT_REGISTRY_DIR, help='Registry directory')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    register_parser = subparsers.add_parser('register', help='Add a model file as a new version')
+    register_parser.add_argument('model_path', type=str,
+                                 help=f"Model file ({', '.join(MODEL_EXTENSIONS)})")
+    register_parser.add_argument('--class_mapping', type=str, default=None,
+                                 help='class_mapping.json (defaults to the one next to the model)')
+    register_parser.add_argument('--metrics', type=str, default=None, help='JSON file of evaluation metrics')
+    register_parser.add_argument('--notes', type=str, default=None, help='Free-form description')
+    register_parser.add_argument('--activate', action='store_true', help='Make the new version active')
+
+    subparsers.add_parser('list', help='List versions')
+    activate_parser = subparsers.add_parser('activate', help='Make a version active')
+    activate_parser.add_argument('version', type=str)
+    subparsers.add_parser('rollback', help='Reactivate the previous version')
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.registry)
+
+    if args.command == 'register':
+        metrics = None
+        if args.metrics:
+            with open(args.metrics, 'r') as f:
+                metrics = json.load(f)
+        version = registry.register(args.model_path, args.class_mapping, metrics=metrics, notes=args.notes)
+        if args.activate:
+            registry.set_active(version)
+        print(f"Registered {version}")
+
+    elif args.command == 'list':
+        active = registry.active_version
+        for metadata in registry.list_versions():
+            marker = '*' if metadata["version"] == active else ' '
+            print(f"{marker} {metadata['version']:<6} {metadata['backend']:<7} {metadata['created'][:19]}  "
+                  f"{metadata['artifact']}  {json.dumps(metadata['metrics'])}")
+
+    elif args.command == 'activate':
+        registry.set_active(args.version)
+        print(f"Active version: {args.version}")
+
+    elif args.command == 'rollback':
+        version = registry.rollback()
+        print(f"Active version: {version}" if version else "No previous version to roll back to")
+
+
+if __name__ == "__main__":
+    main()
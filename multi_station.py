@@ -0,0 +1,487 @@
+# multi_station.py - Drive several camera/Arduino sorting stations from one process
+import json
+import time
+import threading
+import logging
+from datetime import datetime
+import cv2
+import serial
+
+from database import SortingDatabase
+from classifier_engine import ClassifierEngine
+from decision_engine import create_decision_policy
+from presence_detector import PresenceDetector, EMPTY
+from platform_roi import PlatformROI
+from model_registry import ModelRegistry
+
+logger = logging.getLogger("WasteSorter")
+
+# Sort commands understood by the Arduino firmware
+SORT_COMMANDS = {"Can": 'C', "Recycling": 'R', "Garbage": 'G'}
+
+
+def load_station_config(path):
+    """Load station definitions from a JSON file
+
+    The file holds a list of stations, for example:
+    [{"id": "A", "camera": 0, "port": "COM3"},
+     {"id": "B", "camera": 1, "port": "COM4", "roi_config": "data/platform_roi_b.json"},
+     {"id": "C", "camera": 2, "port": "COM5", "mode": "conveyor",
+      "conveyor": {"direction": "right", "gate_position": 0.95}}]
+
+    Conveyor stations track several items at once (see item_tracker);
+    the "conveyor" options are passed to ConveyorStation.
+    """
+    with open(path, 'r') as f:
+        stations = json.load(f)
+
+    if not isinstance(stations, list) or not stations:
+        raise ValueError("Station config must be a non-empty list")
+
+    ids = [str(station["id"]) for station in stations]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Station ids must be unique")
+    return stations
+
+
+class SortingStation:
+    """One camera and Arduino pair with its own decision state and counters
+
+    A capture thread keeps only the latest frame, so the sorter always
+    classifies what is on the platform now. Platform state, decision
+    evidence and counters are never shared between stations.
+    """
+
+    def __init__(self, station_id, camera, port, decision_policy="timer", decision_error=None,
+                 presence_gate=True, roi_mode="full", roi_config=None, min_sort_interval=5.0):
+        """Initialize the station (call connect() to open the camera and serial port)"""
+        self.station_id = str(station_id)
+        self.camera_index = int(camera)
+        self.port = port
+        self.min_sort_interval = min_sort_interval
+
+        self.camera = None
+        self.arduino = None
+        self.is_connected = False
+        self.is_sorting = False
+        self.last_sorted_time = 0.0
+
+        self.decision_policy = create_decision_policy(decision_policy, error_rate=decision_error)
+        self.presence_detector = PresenceDetector() if presence_gate else None
+        self.platform_state = EMPTY
+        if roi_config:
+            self.platform_roi = PlatformROI(roi_mode, config_path=roi_config)
+        else:
+            self.platform_roi = PlatformROI(roi_mode)
+
+        # Latest frame from the capture thread; frame_id changes with every new frame
+        self._frame_lock = threading.Lock()
+        self.current_frame = None
+        self.frame_id = 0
+        self.last_classified_id = 0
+
+        # Counters
+        self.can_count = 0
+        self.recycling_count = 0
+        self.garbage_count = 0
+        self.inference_frames = 0
+
+        self._threads = []
+
+    @property
+    def total_count(self):
+        """Total number of items sorted at this station"""
+        return self.can_count + self.recycling_count + self.garbage_count
+
+    def connect(self):
+        """Open the serial port and camera and start the station threads"""
+        self.arduino = serial.Serial(self.port, 9600, timeout=1)
+        time.sleep(2)  # Allow time for connection to establish
+
+        # Check if Arduino is responding
+        self.arduino.write(b'V')  # Request version info
+        time.sleep(0.5)
+        response = self.arduino.readline().decode('utf-8', errors='ignore').strip()
+
+        if not response or not ('Waste Sorter' in response or 'READY' in response):
+            self.arduino.close()
+            self.arduino = None
+            raise Exception(f"Station {self.station_id}: Arduino not responding or wrong firmware. "
+                            f"Got: {response}")
+
+        self.camera = cv2.VideoCapture(self.camera_index)
+        if not self.camera.isOpened():
+            self.arduino.close()
+            self.arduino = None
+            raise Exception(f"Station {self.station_id}: could not open camera {self.camera_index}")
+
+        # Try to set high resolution, but fall back if not supported
+        resolutions = [(3840, 2160), (1920, 1080), (1280, 720), (640, 480)]
+        for width, height in resolutions:
+            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            actual_width = self.camera.get(cv2.CAP_PROP_FRAME_WIDTH)
+            actual_height = self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT)
+
+            if abs(actual_width - width) < 100 and abs(actual_height - height) < 100:
+                logger.info(f"Station {self.station_id}: camera resolution set to "
+                            f"{actual_width}x{actual_height}")
+                break
+
+        self.is_connected = True
+        for target, name in [(self.capture_frames, "Camera"), (self.monitor_arduino, "Arduino")]:
+            thread = threading.Thread(target=target, name=f"{name}-{self.station_id}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        logger.info(f"Station {self.station_id} connected (camera {self.camera_index}, port {self.port})")
+
+    def disconnect(self):
+        """Stop the threads, park the platform and release the devices"""
+        self.is_connected = False
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+
+        if self.camera is not None:
+            self.camera.release()
+            self.camera = None
+
+        if self.arduino is not None:
+            try:
+                self.arduino.write(b'N')  # Reset to neutral position
+                time.sleep(0.5)
+                self.arduino.close()
+            except Exception:
+                pass
+            self.arduino = None
+
+    def capture_frames(self):
+        """Keep the latest camera frame and track the platform state"""
+        while self.is_connected:
+            try:
+                ret, frame = self.camera.read()
+                if ret:
+                    with self._frame_lock:
+                        self.current_frame = frame
+                        self.frame_id += 1
+
+                    if self.presence_detector is not None:
+                        state = self.presence_detector.update(frame)
+                        if state != self.platform_state:
+                            self.platform_state = state
+            except Exception as e:
+                logger.error(f"Station {self.station_id} camera error: {str(e)}")
+                time.sleep(0.1)
+
+            # Longer delay while the platform is empty
+            if self.presence_detector is not None:
+                time.sleep(self.presence_detector.frame_interval)
+            else:
+                time.sleep(0.03)
+
+    def monitor_arduino(self):
+        """Monitor the station's serial output for messages"""
+        while self.is_connected and self.arduino is not None:
+            try:
+                if self.arduino.in_waiting > 0:
+                    line = self.arduino.readline().decode('utf-8', errors='ignore').strip()
+                    logger.debug(f"Arduino {self.station_id}: {line}")
+
+                    if line.startswith("ERROR:"):
+                        error_msg = line.split("ERROR:", 1)[1].strip()
+                        logger.error(f"Station {self.station_id} Arduino error: {error_msg}")
+                    elif line.startswith("WARNING:"):
+                        warning_msg = line.split("WARNING:", 1)[1].strip()
+                        logger.warning(f"Station {self.station_id} Arduino warning: {warning_msg}")
+                    elif "SORT_COMPLETE" in line:
+                        self.is_sorting = False
+
+                        # Acknowledge receipt
+                        self.arduino.write(b'A')
+            except Exception as e:
+                logger.error(f"Station {self.station_id} Arduino monitoring error: {str(e)}")
+
+            time.sleep(0.1)
+
+    def take_model_frame(self):
+        """Return the cropped latest frame if it should be classified this tick, else None"""
+        if not self.is_connected or self.is_sorting:
+            return None
+        if time.time() - self.last_sorted_time < self.min_sort_interval:
+            return None
+
+        with self._frame_lock:
+            frame = self.current_frame
+            frame_id = self.frame_id
+        if frame is None or frame_id == self.last_classified_id:
+            return None
+
+        if self.presence_detector is not None:
+            if self.platform_state == EMPTY:
+                # Item left the platform, forget its evidence
+                self.decision_policy.reset()
+            if not self.presence_detector.should_infer:
+                self.presence_detector.record_gate(False)
+                return None
+            self.presence_detector.record_gate(True)
+            foreground_mask = self.presence_detector.foreground_mask
+        else:
+            foreground_mask = None
+
+        self.last_classified_id = frame_id
+        self.inference_frames += 1
+        return frame, self.platform_roi.crop(frame, foreground_mask)
+
+    def take_model_frames(self):
+        """Frames to classify this tick as (key, frame, crop) tuples"""
+        taken = self.take_model_frame()
+        return [] if taken is None else [(None, taken[0], taken[1])]
+
+    def handle_result(self, key, frame, result, timestamp):
+        """Feed a classification to the decision policy; returns the (frame, decision) pairs sorted now"""
+        decision = self.decision_policy.update(result, timestamp)
+        if decision is None:
+            return []
+        self.sort(decision)
+        return [(frame, decision)]
+
+    def dispatch_due(self, timestamp):
+        """Send sort commands scheduled for later; a single-item platform sorts immediately"""
+        return []
+
+    def sort(self, decision):
+        """Send the sort command for a decision and update the counters"""
+        classification = decision["sort_as"]
+        command = SORT_COMMANDS.get(classification, 'G')
+        if classification == "Can":
+            self.can_count += 1
+        elif classification == "Recycling":
+            self.recycling_count += 1
+        else:
+            self.garbage_count += 1
+
+        self.arduino.write(command.encode())
+        self.is_sorting = True
+        # The policy is only touched from the sorting loop, so reset it here
+        # rather than when the Arduino reports SORT_COMPLETE
+        self.decision_policy.reset()
+        self.last_sorted_time = time.time()
+        logger.info(f"Station {self.station_id}: sorting as {classification} "
+                    f"({decision['confidence']:.2%})")
+
+    def get_stats(self):
+        """Get station statistics"""
+        stats = {
+            "station_id": self.station_id,
+            "can_count": self.can_count,
+            "recycling_count": self.recycling_count,
+            "garbage_count": self.garbage_count,
+            "total_count": self.total_count,
+            "inference_frames": self.inference_frames,
+            "platform_state": self.platform_state,
+            "decision": self.decision_policy.get_stats()
+        }
+        if self.presence_detector is not None:
+            stats["skipped_fraction"] = self.presence_detector.skipped_fraction
+        return stats
+
+
+class MultiStationSorter:
+    """Headless sorter that batches inference across several stations
+
+    Every tick the latest eligible frame from each station is preprocessed
+    into one batch buffer and classified with a single forward pass, so N
+    cameras cost one model call instead of N. Results are then handed to
+    each station's own decision policy, and sort events are written to the
+    database from this loop's thread.
+    """
+
+    def __init__(self, stations, engine, db=None, tick_interval=0.03, stats_interval=60.0, model_version=None):
+        """Initialize the sorter with its stations and a loaded engine"""
+        self.stations = stations
+        self.engine = engine
+        self.model_version = model_version
+        self.tick_interval = tick_interval
+        self.stats_interval = stats_interval
+        self.db_path = db
+        self.db = None
+        self.running = False
+
+        # Batch statistics
+        self.batches = 0
+        self.batched_frames = 0
+
+    def run(self):
+        """Connect the stations and run the sorting loop until stopped"""
+        # SQLite connections belong to the thread that created them
+        self.db = SortingDatabase(self.db_path) if self.db_path else SortingDatabase()
+
+        self.running = True
+        last_stats = time.time()
+        try:
+            # A station whose camera or Arduino fails to open is skipped; the others still sort
+            connected = []
+            for station in self.stations:
+                try:
+                    station.connect()
+                    connected.append(station)
+                except Exception as e:
+                    logger.error(f"Station {station.station_id} not started: {str(e)}")
+                    station.disconnect()
+            if not connected:
+                raise RuntimeError("No station could be connected")
+            if len(connected) < len(self.stations):
+                logger.warning(f"Running {len(connected)} of {len(self.stations)} stations")
+
+            while self.running:
+                start = time.time()
+                self.tick()
+
+                if time.time() - last_stats > self.stats_interval:
+                    self.log_stats()
+                    last_stats = time.time()
+
+                time.sleep(max(0.0, self.tick_interval - (time.time() - start)))
+        finally:
+            for station in self.stations:
+                station.disconnect()
+            self.db.close()
+
+    def stop(self):
+        """Stop the sorting loop"""
+        self.running = False
+
+    def tick(self):
+        """Classify the latest frames from all eligible stations in one batch"""
+        pending = []
+        for station in self.stations:
+            for key, frame, crop in station.take_model_frames():
+                pending.append((station, key, frame, crop))
+
+        results = []
+        if pending:
+            try:
+                results = self.engine.classify_frames([crop for _, _, _, crop in pending])
+                self.batches += 1
+                self.batched_frames += len(pending)
+            except Exception as e:
+                logger.error(f"Batched inference error: {str(e)}")
+
+        timestamp = time.time()
+        for (station, key, frame, _), result in zip(pending, results):
+            try:
+                for sorted_frame, decision in station.handle_result(key, frame, result, timestamp):
+                    self.record_sort(station, sorted_frame, decision)
+            except Exception as e:
+                logger.error(f"Station {station.station_id} auto-sort error: {str(e)}")
+
+        # Conveyor stations sort each item when it reaches the platform
+        for station in self.stations:
+            try:
+                for sorted_frame, decision in station.dispatch_due(timestamp):
+                    self.record_sort(station, sorted_frame, decision)
+            except Exception as e:
+                logger.error(f"Station {station.station_id} dispatch error: {str(e)}")
+
+        return len(results)
+
+    def record_sort(self, station, frame, decision):
+        """Log a sort event tagged with its station"""
+        classification = decision["sort_as"]
+        metadata = {
+            "classification": classification,
+            "confidence": float(decision["confidence"]),
+            "timestamp": datetime.now().isoformat(),
+            "decision_policy": decision["policy"],
+            "time_to_decision": decision["time_to_decision"],
+            "decision_frames": decision["frames"]
+        }
+        if "track_id" in decision:
+            metadata["track_id"] = decision["track_id"]
+        self.db.add_sort_event(
+            classification.lower(),
+            decision["confidence"],
+            "recycling" if classification != "Garbage" else "garbage",
+            frame,
+            None,  # user_id
+            metadata,
+            station_id=station.station_id,
+            model_version=self.model_version
+        )
+
+    def get_stats(self):
+        """Get sorter and per-station statistics"""
+        return {
+            "batches": self.batches,
+            "batched_frames": self.batched_frames,
+            "mean_batch_size": self.batched_frames / self.batches if self.batches else 0.0,
+            "engine": self.engine.get_stats(),
+            "stations": [station.get_stats() for station in self.stations]
+        }
+
+    def log_stats(self):
+        """Log a one-line summary per station"""
+        stats = self.get_stats()
+        logger.info(f"Batches: {stats['batches']}, mean batch size {stats['mean_batch_size']:.2f}")
+        for station in stats["stations"]:
+            logger.info(f"Station {station['station_id']}: {station['total_count']} sorted "
+                        f"(can {station['can_count']}, recycling {station['recycling_count']}, "
+                        f"garbage {station['garbage_count']}), {station['inference_frames']} frames classified")
+
+
+def create_station(config, decision_policy="timer", decision_error=None, presence_gate=True, roi_mode="full",
+                   conveyor=False):
+    """Create a platform or conveyor station from one entry of the station config"""
+    if config.get("mode", "conveyor" if conveyor else "platform") == "conveyor":
+        from item_tracker import ConveyorStation
+
+        return ConveyorStation(
+            config["id"],
+            config["camera"],
+            config["port"],
+            roi_mode=roi_mode,
+            roi_config=config.get("roi_config"),
+            **config.get("conveyor", {})
+        )
+
+    return SortingStation(
+        config["id"],
+        config["camera"],
+        config["port"],
+        decision_policy=decision_policy,
+        decision_error=decision_error,
+        presence_gate=presence_gate,
+        roi_mode=roi_mode,
+        roi_config=config.get("roi_config")
+    )
+
+
+def run_stations(config_path, backend=None, model_path=None, num_threads=None, decision_policy="timer",
+                 decision_error=None, presence_gate=True, roi_mode="full", use_model_cache=True,
+                 model_version=None, conveyor=False):
+    """Load the model once and run all stations from a config file until interrupted"""
+    config = load_station_config(config_path)
+    stations = [
+        create_station(station, decision_policy, decision_error, presence_gate, roi_mode, conveyor)
+        for station in config
+    ]
+
+    # Same model selection as the GUI: a requested or active registry version, else the model files
+    registry = ModelRegistry()
+    model_version = registry.select_version(model_version, model_path, backend)
+
+    if model_version is not None:
+        engine = registry.load_engine(model_version, num_threads=num_threads, use_cache=use_model_cache)
+    else:
+        engine = ClassifierEngine.load(backend or "keras", model_dir="models", model_path=model_path,
+                                       num_threads=num_threads, use_cache=use_model_cache)
+
+    sorter = MultiStationSorter(stations, engine, model_version=model_version)
+    logger.info(f"Running {len(stations)} stations with {engine.backend.name} backend")
+    try:
+        sorter.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sorter.log_stats()
@@ -0,0 +1,263 @@
+# pareto_sweep.py - Accuracy/latency sweep over input size and MobileNetV2 width
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+DEFAULT_SWEEP_DIR = os.path.join("models", "sweep")
+
+# Input sizes and widths with ImageNet weights for MobileNetV2
+DEFAULT_IMAGE_SIZES = [224, 192, 160, 128, 96]
+DEFAULT_ALPHAS = [1.0, 0.75, 0.5, 0.35]
+
+
+def variant_name(image_size, alpha):
+    """Name of a sweep variant, also its directory under the sweep directory"""
+    return f"s{image_size}_a{alpha:g}"
+
+
+def run_trial(image_size, alpha, data_dir, sweep_dir, epochs, batch_size, learning_rate, threads):
+    """Train one variant and measure its accuracy (runs in a worker process)
+
+    Latency is not measured here: trials run side by side, so timings
+    would depend on what the other workers are doing.
+    """
+    import tensorflow as tf
+
+    # Keep parallel trials from oversubscribing the CPU
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    from train_model import WasteClassifierTrainer, count_flops
+
+    name = variant_name(image_size, alpha)
+    model_dir = os.path.join(sweep_dir, name)
+    start = time.time()
+
+    trainer = WasteClassifierTrainer(
+        data_dir=data_dir,
+        model_dir=model_dir,
+        image_size=(image_size, image_size),
+        batch_size=batch_size,
+        epochs=epochs,
+        learning_rate=learning_rate,
+        alpha=alpha
+    )
+    trainer.create_data_generators()
+    trainer.train_model()
+
+    # Accuracy on the test split for the Keras model and its TFLite export
+    evaluation = trainer.model.evaluate(trainer.get_test_generator(), verbose=0)
+    tflite_path = trainer.export_tflite_model(mode='dynamic')
+    tflite = trainer.evaluate_tflite_model(tflite_path, num_threads=threads, latency_runs=1)
+
+    trial = {
+        "name": name,
+        "image_size": image_size,
+        "alpha": alpha,
+        "keras_path": os.path.join(model_dir, 'latest_model.h5'),
+        "tflite_path": tflite_path,
+        "params": int(trainer.model.count_params()),
+        "flops": count_flops(trainer.model),
+        "tflite_size_kb": tflite["size_kb"],
+        "keras_accuracy": float(evaluation[1]),
+        "tflite_accuracy": tflite["accuracy"],
+        "train_time_s": time.time() - start
+    }
+    with open(os.path.join(model_dir, 'trial.json'), 'w') as f:
+        json.dump(trial, f, indent=4)
+    return trial
+
+
+def measure_latency(backend, model_path, num_threads=None, runs=50):
+    """Median single-frame latency through ClassifierEngine, preprocessing included"""
+    import numpy as np
+    from classifier_engine import ClassifierEngine
+
+    engine = ClassifierEngine.load(backend, model_dir=os.path.dirname(model_path), model_path=model_path,
+                                   num_threads=num_threads)
+    frame = np.random.default_rng(0).integers(0, 256, (720, 1280, 3), dtype=np.uint8)
+    latencies = []
+    for _ in range(runs):
+        engine.classify(frame)
+        latencies.append(engine.last_latency_ms)
+    latencies.sort()
+    return latencies[len(latencies) // 2]
+
+
+def pareto_front(trials, latency_key, accuracy_key):
+    """Names of the trials no other trial beats on both accuracy and latency"""
+    front = set()
+    for trial in trials:
+        dominated = any(
+            other is not trial
+            and other[accuracy_key] >= trial[accuracy_key]
+            and other[latency_key] <= trial[latency_key]
+            and (other[accuracy_key] > trial[accuracy_key] or other[latency_key] < trial[latency_key])
+            for other in trials
+        )
+        if not dominated:
+            front.add(trial["name"])
+    return front
+
+
+def choose_variant(trials, front, latency_key, accuracy_key, max_latency_ms=None):
+    """Most accurate Pareto variant within the latency budget (None if nothing fits)"""
+    candidates = [t for t in trials if t["name"] in front
+                  and (max_latency_ms is None or t[latency_key] <= max_latency_ms)]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda t: (t[accuracy_key], -t[latency_key]))
+
+
+def print_table(trials, front, latency_key):
+    """Print every variant sorted by latency, marking the Pareto front"""
+    print(f"\n  {'Variant':<12}{'MFLOPs':>9}{'Params':>11}{'Size (KB)':>11}{'Keras acc':>11}"
+          f"{'TFLite acc':>12}{'Keras (ms)':>12}{'TFLite (ms)':>13}")
+    for t in sorted(trials, key=lambda t: t[latency_key]):
+        marker = '*' if t["name"] in front else ' '
+        print(f"{marker} {t['name']:<12}{t['flops'] / 1e6:>9.1f}{t['params']:>11,}{t['tflite_size_kb']:>11.1f}"
+              f"{t['keras_accuracy']:>11.4f}{t['tflite_accuracy']:>12.4f}"
+              f"{t['keras_latency_ms']:>12.2f}{t['tflite_latency_ms']:>13.2f}")
+    print("* = on the Pareto front")
+
+
+def deploy(trial, backend, sweep_dir, registry_dir, activate=True):
+    """Register a variant in the model registry and optionally make it active"""
+    from model_registry import ModelRegistry
+
+    model_path = trial["tflite_path"] if backend == "tflite" else trial["keras_path"]
+    metrics = {
+        "accuracy": trial[f"{backend}_accuracy"],
+        "latency_ms": trial[f"{backend}_latency_ms"],
+        "image_size": trial["image_size"],
+        "alpha": trial["alpha"]
+    }
+    registry = ModelRegistry(registry_dir)
+    version = registry.register(model_path, os.path.join(sweep_dir, trial["name"], 'class_mapping.json'),
+                                metrics=metrics, notes=f"Pareto sweep variant {trial['name']}")
+    if activate:
+        registry.set_active(version)
+    print(f"Registered {trial['name']} ({backend}) as {version}" + (" and activated it" if activate else ""))
+    return version
+
+
+def main():
+    """Run the sweep"""
+    parser = argparse.ArgumentParser(description='Sweep input size and model width for accuracy vs latency')
+    parser.add_argument('--data_dir', type=str, default='./training_data',
+                        help='Directory containing training data')
+    parser.add_argument('--sweep_dir', type=str, default=DEFAULT_SWEEP_DIR,
+                        help='Directory for the variants and the report')
+    parser.add_argument('--image_sizes', type=int, nargs='+', default=DEFAULT_IMAGE_SIZES,
+                        help='Input sizes to try (square)')
+    parser.add_argument('--alphas', type=float, nargs='+', default=DEFAULT_ALPHAS,
+                        help='MobileNetV2 width multipliers to try')
+    parser.add_argument('--epochs', type=int, default=10, help='Training epochs per variant')
+    parser.add_argument('--batch_size', type=int, default=32, help='Batch size for training')
+    parser.add_argument('--learning_rate', type=float, default=0.0001, help='Learning rate for training')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Variants trained in parallel (each in its own process)')
+    parser.add_argument('--retrain', action='store_true',
+                        help='Train variants again even if a previous sweep already trained them')
+    parser.add_argument('--num_threads', type=int, default=None,
+                        help='CPU threads for the latency measurement (as in the app)')
+    parser.add_argument('--latency_runs', type=int, default=50, help='Frames timed per variant and backend')
+    parser.add_argument('--latency_backend', type=str, default='tflite', choices=['keras', 'tflite'],
+                        help='Latency used for the Pareto front and deployment')
+    parser.add_argument('--max_latency_ms', type=float, default=None,
+                        help='Latency budget when choosing the variant to deploy')
+    parser.add_argument('--deploy', type=str, default=None,
+                        help="Variant to deploy (e.g. s160_a0.75), or 'best' for the most accurate "
+                             "Pareto variant within --max_latency_ms")
+    parser.add_argument('--no_activate', action='store_true',
+                        help='Register the deployed variant without making it active')
+    parser.add_argument('--registry', type=str, default=os.path.join("models", "registry"),
+                        help='Model registry directory')
+    args = parser.parse_args()
+
+    os.makedirs(args.sweep_dir, exist_ok=True)
+    grid = [(size, alpha) for size in args.image_sizes for alpha in args.alphas]
+
+    # Reuse variants trained by an earlier sweep
+    trials = []
+    pending = []
+    for size, alpha in grid:
+        trial_path = os.path.join(args.sweep_dir, variant_name(size, alpha), 'trial.json')
+        if os.path.exists(trial_path) and not args.retrain:
+            with open(trial_path, 'r') as f:
+                trials.append(json.load(f))
+        else:
+            pending.append((size, alpha))
+
+    if pending:
+        print(f"Training {len(pending)} variants with {args.workers} workers "
+              f"({len(trials)} reused from an earlier sweep)")
+        cpu_count = os.cpu_count() or 1
+        threads = max(1, cpu_count // args.workers)
+
+        # TensorFlow does not survive fork, so every worker starts a fresh interpreter
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as executor:
+            futures = {
+                executor.submit(run_trial, size, alpha, args.data_dir, args.sweep_dir, args.epochs,
+                                args.batch_size, args.learning_rate, threads): variant_name(size, alpha)
+                for size, alpha in pending
+            }
+            for future in as_completed(futures):
+                try:
+                    trial = future.result()
+                except Exception as e:
+                    print(f"{futures[future]}: failed ({e})")
+                    continue
+                trials.append(trial)
+                print(f"{trial['name']}: accuracy {trial['keras_accuracy']:.4f} "
+                      f"(TFLite {trial['tflite_accuracy']:.4f}) in {trial['train_time_s']:.0f}s")
+
+    if not trials:
+        print("No variants were trained")
+        sys.exit(1)
+
+    # Time every variant one after another so the measurements do not disturb each other
+    print("Measuring single-frame latency...")
+    for trial in trials:
+        trial["keras_latency_ms"] = measure_latency('keras', trial["keras_path"], args.num_threads,
+                                                    args.latency_runs)
+        trial["tflite_latency_ms"] = measure_latency('tflite', trial["tflite_path"], args.num_threads,
+                                                     args.latency_runs)
+
+    latency_key = f"{args.latency_backend}_latency_ms"
+    accuracy_key = f"{args.latency_backend}_accuracy"
+    front = pareto_front(trials, latency_key, accuracy_key)
+    print_table(trials, front, latency_key)
+
+    report_path = os.path.join(args.sweep_dir, 'pareto_report.json')
+    with open(report_path, 'w') as f:
+        json.dump({
+            "latency_backend": args.latency_backend,
+            "num_threads": args.num_threads,
+            "pareto_front": sorted(front),
+            "variants": sorted(trials, key=lambda t: t[latency_key])
+        }, f, indent=4)
+    print(f"Report saved to {report_path}")
+
+    if args.deploy:
+        if args.deploy == 'best':
+            chosen = choose_variant(trials, front, latency_key, accuracy_key, args.max_latency_ms)
+            if chosen is None:
+                print(f"No Pareto variant within {args.max_latency_ms} ms")
+                sys.exit(1)
+        else:
+            chosen = next((t for t in trials if t["name"] == args.deploy), None)
+            if chosen is None:
+                print(f"Unknown variant: {args.deploy}")
+                sys.exit(1)
+        deploy(chosen, args.latency_backend, args.sweep_dir, args.registry, activate=not args.no_activate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# platform_roi.py - Platform region of interest and item localisation
+import os
+import json
+import logging
+import cv2
+import numpy as np
+
+logger = logging.getLogger("WasteSorter")
+
+# Region modes selectable from the command line
+ROI_MODES = ["full", "fixed", "contour"]
+
+DEFAULT_ROI_PATH = os.path.join("data", "platform_roi.json")
+
+
+def mask_bbox(mask, min_area_fraction=0.002):
+    """Bounding box (x, y, w, h) around the foreground blobs of a binary mask, or None"""
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_area = min_area_fraction * mask.shape[0] * mask.shape[1]
+    contours = [c for c in contours if cv2.contourArea(c) >= min_area]
+    if not contours:
+        return None
+
+    return cv2.boundingRect(np.concatenate(contours))
+
+
+class PlatformROI:
+    """Crops camera frames to the platform (and optionally the item) before resizing
+
+    Modes:
+    - full: use the whole frame (previous behaviour)
+    - fixed: use a platform rectangle calibrated once and stored in
+      data/platform_roi.json as fractions of the frame size
+    - contour: inside the platform rectangle, crop to the bounding box of the
+      item, taken from the presence detector's foreground mask when
+      available or from edge contours otherwise
+
+    Crops are numpy views, so they cost nothing until the model resizes them.
+    """
+
+    def __init__(self, mode="full", config_path=DEFAULT_ROI_PATH, margin=0.15, detect_width=320):
+        """Initialize the region and load a saved calibration"""
+        if mode not in ROI_MODES:
+            raise ValueError(f"Unknown ROI mode: {mode}")
+
+        self.mode = mode
+        self.config_path = config_path
+        self.margin = margin
+        self.detect_width = detect_width
+
+        # Platform rectangle as fractions of the frame (x, y, w, h)
+        self.region = (0.0, 0.0, 1.0, 1.0)
+        self.load()
+
+    def load(self):
+        """Load the calibrated platform rectangle if one was saved"""
+        if not os.path.exists(self.config_path):
+            return False
+
+        try:
+            with open(self.config_path, 'r') as f:
+                data = json.load(f)
+            self.region = (data["x"], data["y"], data["w"], data["h"])
+            logger.info(f"Loaded platform region: {self.region}")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading platform region: {str(e)}")
+            return False
+
+    def save(self):
+        """Save the platform rectangle"""
+        os.makedirs(os.path.dirname(self.config_path) or ".", exist_ok=True)
+        x, y, w, h = self.region
+        with open(self.config_path, 'w') as f:
+            json.dump({"x": x, "y": y, "w": w, "h": h}, f, indent=4)
+        logger.info(f"Saved platform region to {self.config_path}")
+
+    def calibrate(self, frame_shape, rect):
+        """Set the platform rectangle from pixel coordinates (x, y, w, h) in a frame"""
+        height, width = frame_shape[:2]
+        x, y, w, h = rect
+        if w <= 0 or h <= 0:
+            raise ValueError("Platform region must have a positive size")
+
+        self.region = (x / width, y / height, w / width, h / height)
+        self.save()
+
+    def platform_rect(self, frame_shape):
+        """Platform rectangle in pixel coordinates for a frame"""
+        height, width = frame_shape[:2]
+        x, y, w, h = self.region
+        x0 = int(round(x * width))
+        y0 = int(round(y * height))
+        x1 = min(width, int(round((x + w) * width)))
+        y1 = min(height, int(round((y + h) * height)))
+        return x0, y0, max(1, x1 - x0), max(1, y1 - y0)
+
+    def _detect_item(self, platform):
+        """Bounding box of the item inside a platform crop using edge contours"""
+        h, w = platform.shape[:2]
+        scale = min(1.0, self.detect_width / w)
+        small = cv2.resize(platform, (max(1, int(w * scale)), max(1, int(h * scale))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+        edges = cv2.dilate(edges, np.ones((5, 5), np.uint8))
+
+        bbox = mask_bbox(edges)
+        if bbox is None:
+            return None
+
+        bx, by, bw, bh = bbox
+        return (int(bx / scale), int(by / scale), int(bw / scale), int(bh / scale))
+
+    def _expand(self, bbox, bounds):
+        """Add a margin around a box and make it square, clipped to bounds"""
+        x, y, w, h = bbox
+        bound_w, bound_h = bounds
+        side = int(max(w, h) * (1 + 2 * self.margin))
+        cx, cy = x + w / 2, y + h / 2
+
+        x0 = int(max(0, min(bound_w - side, cx - side / 2)))
+        y0 = int(max(0, min(bound_h - side, cy - side / 2)))
+        return x0, y0, min(side, bound_w - x0), min(side, bound_h - y0)
+
+    def item_rect(self, frame, foreground_mask=None):
+        """Rectangle to feed to the model, in frame pixel coordinates"""
+        if self.mode == "full":
+            return 0, 0, frame.shape[1], frame.shape[0]
+
+        px, py, pw, ph = self.platform_rect(frame.shape)
+        if self.mode == "fixed":
+            return px, py, pw, ph
+
+        # Contour mode: locate the item inside the platform
+        bbox = None
+        if foreground_mask is not None:
+            # Scale the (downscaled) mask to the frame, then restrict it to the platform
+            mask_h, mask_w = foreground_mask.shape[:2]
+            sx, sy = frame.shape[1] / mask_w, frame.shape[0] / mask_h
+            mx0, my0 = int(px / sx), int(py / sy)
+            platform_mask = foreground_mask[my0:my0 + max(1, int(ph / sy)), mx0:mx0 + max(1, int(pw / sx))]
+            found = mask_bbox(platform_mask)
+            if found is not None:
+                bx, by, bw, bh = found
+                bbox = (int(bx * sx), int(by * sy), int(bw * sx), int(bh * sy))
+        else:
+            bbox = self._detect_item(frame[py:py + ph, px:px + pw])
+
+        if bbox is None:
+            return px, py, pw, ph
+
+        x, y, w, h = self._expand(bbox, (pw, ph))
+        return px + x, py + y, w, h
+
+    def crop(self, frame, foreground_mask=None):
+        """Crop a frame to the platform or item region (returns a view)"""
+        if self.mode == "full":
+            return frame
+
+        x, y, w, h = self.item_rect(frame, foreground_mask)
+        return frame[y:y + h, x:x + w]
@@ -0,0 +1,181 @@
+# presence_detector.py - Detects items on the sorting platform using background subtraction
+import time
+import logging
+import cv2
+import numpy as np
+
+logger = logging.getLogger("WasteSorter")
+
+# Platform states
+EMPTY = "empty"
+MOVING = "moving"
+SETTLED = "settled"
+
+
+class PresenceDetector:
+    """Cheap presence detector that decides when the classifier is worth running
+
+    Each frame is downscaled to a small grayscale image and compared against
+    a background model (MOG2) of the empty platform. The platform is EMPTY
+    when too few pixels differ from the background, MOVING while an item is
+    being placed, and SETTLED once the item has stayed still for a few
+    frames. Only SETTLED frames need to be classified.
+
+    While the platform is empty the suggested capture interval ramps up from
+    active_interval to idle_interval, so an idle station uses very little CPU.
+    """
+
+    def __init__(self,
+                 width=160,
+                 occupied_fraction=0.02,
+                 motion_fraction=0.01,
+                 settle_frames=4,
+                 history=300,
+                 var_threshold=32,
+                 active_interval=0.03,
+                 idle_interval=0.25,
+                 idle_ramp_time=5.0,
+                 warmup_frames=30,
+                 absorb_time=120.0):
+        """Initialize the detector"""
+        self.width = width
+        self.occupied_fraction = occupied_fraction
+        self.motion_fraction = motion_fraction
+        self.settle_frames = settle_frames
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.idle_ramp_time = idle_ramp_time
+        self.warmup_frames = warmup_frames
+        self.absorb_time = absorb_time
+
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(
+            history=history,
+            varThreshold=var_threshold,
+            detectShadows=False
+        )
+
+        self.state = EMPTY
+        self.previous_gray = None
+        self.foreground_mask = None
+        self.still_frames = 0
+        self.empty_since = time.time()
+        self.occupied_since = None
+        self.foreground_ratio = 0.0
+        self.motion_ratio = 0.0
+
+        # Statistics
+        self.frames_seen = 0
+        self.inference_frames = 0
+        self.skipped_frames = 0
+
+    def _prepare(self, frame):
+        """Downscale and convert a frame to blurred grayscale"""
+        h, w = frame.shape[:2]
+        height = max(1, int(h * self.width / w))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def update(self, frame):
+        """Process a frame and return the new platform state"""
+        gray = self._prepare(frame)
+        self.frames_seen += 1
+
+        # Only learn the background while the platform is empty (or while the
+        # model is still warming up), so an item left on the platform is not
+        # absorbed into the background. If the platform has looked occupied
+        # for a very long time the scene has probably changed, so learn slowly.
+        if self.state == EMPTY or self.frames_seen <= self.warmup_frames:
+            learning_rate = -1
+        elif self.occupied_since and time.time() - self.occupied_since > self.absorb_time:
+            learning_rate = 0.005
+        else:
+            learning_rate = 0
+        mask = self.subtractor.apply(gray, learningRate=learning_rate)
+        self.foreground_mask = mask
+        self.foreground_ratio = np.count_nonzero(mask) / mask.size
+
+        # Inter-frame motion
+        if self.previous_gray is not None and self.previous_gray.shape == gray.shape:
+            diff = cv2.absdiff(gray, self.previous_gray)
+            self.motion_ratio = np.count_nonzero(diff > 25) / diff.size
+        else:
+            self.motion_ratio = 1.0
+        self.previous_gray = gray
+
+        previous_state = self.state
+        if self.foreground_ratio < self.occupied_fraction:
+            self.state = EMPTY
+            self.still_frames = 0
+        elif self.motion_ratio > self.motion_fraction:
+            self.state = MOVING
+            self.still_frames = 0
+        else:
+            self.still_frames += 1
+            if self.still_frames >= self.settle_frames:
+                self.state = SETTLED
+            elif self.state != SETTLED:
+                self.state = MOVING
+
+        if self.state == EMPTY and previous_state != EMPTY:
+            self.empty_since = time.time()
+            self.occupied_since = None
+        elif self.state != EMPTY and previous_state == EMPTY:
+            self.occupied_since = time.time()
+
+        if self.state != previous_state:
+            logger.debug(f"Platform state: {previous_state} -> {self.state} "
+                         f"(foreground {self.foreground_ratio:.1%}, motion {self.motion_ratio:.1%})")
+
+        return self.state
+
+    @property
+    def should_infer(self):
+        """Whether the current frame should be sent to the classifier"""
+        return self.state == SETTLED
+
+    def record_gate(self, inferred):
+        """Record whether a frame eligible for auto-sort was classified or skipped"""
+        if inferred:
+            self.inference_frames += 1
+        else:
+            self.skipped_frames += 1
+
+    @property
+    def frame_interval(self):
+        """Suggested delay in seconds before capturing the next frame"""
+        if self.state != EMPTY:
+            return self.active_interval
+
+        # Ramp linearly from the active to the idle interval while empty
+        idle_time = time.time() - self.empty_since
+        ramp = min(1.0, idle_time / self.idle_ramp_time) if self.idle_ramp_time > 0 else 1.0
+        return self.active_interval + ramp * (self.idle_interval - self.active_interval)
+
+    @property
+    def skipped_fraction(self):
+        """Fraction of auto-sort frames that skipped inference"""
+        total = self.inference_frames + self.skipped_frames
+        return self.skipped_frames / total if total else 0.0
+
+    def reset_background(self):
+        """Discard the background model, e.g. after the camera moved"""
+        self.subtractor.clear()
+        self.state = EMPTY
+        self.previous_gray = None
+        self.foreground_mask = None
+        self.still_frames = 0
+        self.empty_since = time.time()
+        self.occupied_since = None
+        self.frames_seen = 0
+
+    def get_stats(self):
+        """Get presence detector statistics"""
+        return {
+            "state": self.state,
+            "frames_seen": self.frames_seen,
+            "inference_frames": self.inference_frames,
+            "skipped_frames": self.skipped_frames,
+            "skipped_fraction": self.skipped_fraction,
+            "frame_interval": self.frame_interval
+        }
@@ -0,0 +1,201 @@
+# reclassify_archive.py - Re-score the images archived in sorting_data.db with another model
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from database import SortingDatabase
+from model_backends import BACKENDS, backend_for_path
+
+
+def init_worker():
+    """Keep each decode worker on one OpenCV thread"""
+    cv2.setNumThreads(1)
+
+
+def decode_chunk(blobs, image_size):
+    """Decode PNG blobs and resize them to the model input (runs in a worker process)
+
+    Frames are resized with the same interpolation as FramePreprocessor
+    and stay BGR, so the engine's preprocessing treats them exactly like
+    live camera frames. Returning model-sized frames also keeps the data
+    sent back to the parent small. ok marks the blobs that decoded.
+    """
+    frames = np.empty((len(blobs), *image_size, 3), dtype=np.uint8)
+    ok = np.zeros(len(blobs), dtype=bool)
+    for i, blob in enumerate(blobs):
+        image = cv2.imdecode(np.frombuffer(blob, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        cv2.resize(image, (image_size[1], image_size[0]), dst=frames[i])
+        ok[i] = True
+    return frames, ok
+
+
+def load_engine(args):
+    """Load the model to evaluate; returns (engine, model_name)"""
+    if args.model_version:
+        from model_registry import ModelRegistry
+
+        engine = ModelRegistry(args.registry).load_engine(args.model_version, num_threads=args.num_threads)
+        return engine, args.model_name or args.model_version
+
+    from classifier_engine import ClassifierEngine
+
+    backend = args.backend
+    model_dir = args.model_dir
+    if args.model_path:
+        backend = backend_for_path(args.model_path)
+        model_dir = os.path.dirname(args.model_path) or "."
+    engine = ClassifierEngine.load(backend, model_dir=model_dir, model_path=args.model_path,
+                                   num_threads=args.num_threads)
+    model_name = args.model_name or (os.path.basename(args.model_path) if args.model_path else backend)
+    return engine, model_name
+
+
+def reclassify(db, engine, model_name, chunk_size=256, batch_size=64, workers=None, rescore=False, limit=None):
+    """Stream the archive through the model and store its predictions
+
+    The main process reads chunks of blobs from SQLite while a process pool
+    decodes the next few chunks; decoded frames go through the model in
+    batches and each chunk's results are written in one transaction.
+    """
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    skip_model = None if rescore else model_name
+
+    processed = 0
+    failed = 0
+    queued = 0
+    last_rowid = 0
+    exhausted = False
+    pending = deque()
+    start = time.perf_counter()
+
+    # Spawned workers do not inherit the parent's model or TensorFlow state
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker) as executor:
+        while True:
+            # Keep a few chunks decoding ahead of inference
+            while not exhausted and len(pending) < workers * 2:
+                size = chunk_size if limit is None else min(chunk_size, limit - queued)
+                rows = db.get_image_blobs(last_rowid, size, skip_model) if size > 0 else []
+                if not rows:
+                    exhausted = True
+                    break
+                last_rowid = rows[-1][0]
+                queued += len(rows)
+                image_ids = [row[1] for row in rows]
+                originals = [row[3] for row in rows]
+                blobs = [row[2] for row in rows]
+                pending.append((image_ids, originals, executor.submit(decode_chunk, blobs, engine.image_size)))
+
+            if not pending:
+                break
+
+            image_ids, originals, future = pending.popleft()
+            frames, ok = future.result()
+            valid = np.flatnonzero(ok)
+            failed += len(image_ids) - len(valid)
+
+            results = []
+            for batch_start in range(0, len(valid), batch_size):
+                indices = valid[batch_start:batch_start + batch_size]
+                predictions = engine.predict_frames(frames[indices], bgr=True)
+                for index, row in zip(indices, predictions):
+                    result = engine.interpret(row)
+                    results.append({
+                        "image_id": image_ids[index],
+                        "class_name": result["class_name"],
+                        "sort_as": result["sort_as"],
+                        "confidence": result["confidence"],
+                        "metadata": {
+                            "class_id": result["class_id"],
+                            "original": originals[index],
+                            "category_probabilities": {category: float(p) for category, p in
+                                                       result["category_probabilities"].items()}
+                        }
+                    })
+
+            db.add_reclassification_results(model_name, results)
+            processed += len(results)
+
+            elapsed = time.perf_counter() - start
+            print(f"{processed} images scored ({processed / elapsed:.0f}/s), {failed} undecodable")
+
+    elapsed = time.perf_counter() - start
+    return {
+        "model_name": model_name,
+        "images": processed,
+        "undecodable": failed,
+        "elapsed_s": elapsed,
+        "images_per_second": processed / elapsed if elapsed > 0 else 0.0,
+        "inference": engine.get_stats()
+    }
+
+
+def main():
+    """Run the batch job"""
+    parser = argparse.ArgumentParser(description='Re-classify the image archive with another model')
+    parser.add_argument('--db', type=str, default='./data/sorting_data.db', help='Sorting database')
+    parser.add_argument('--model_path', type=str, default=None,
+                        help='Model file to evaluate (.h5, .tflite or .onnx)')
+    parser.add_argument('--model_version', type=str, default=None,
+                        help='Evaluate a version from the model registry instead')
+    parser.add_argument('--registry', type=str, default=os.path.join('models', 'registry'),
+                        help='Model registry directory')
+    parser.add_argument('--backend', type=str, default='keras', choices=BACKENDS,
+                        help='Backend for the default model when no model file is given')
+    parser.add_argument('--model_dir', type=str, default='models',
+                        help='Directory of the default model and its class mapping')
+    parser.add_argument('--model_name', type=str, default=None,
+                        help='Name stored with the results (defaults to the version or file name)')
+    parser.add_argument('--num_threads', type=int, default=None, help='CPU threads for inference')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Decode processes (defaults to one less than the CPU count)')
+    parser.add_argument('--chunk_size', type=int, default=256, help='Images read from the database at a time')
+    parser.add_argument('--batch_size', type=int, default=64, help='Images per inference batch')
+    parser.add_argument('--limit', type=int, default=None, help='Stop after this many images')
+    parser.add_argument('--rescore', action='store_true',
+                        help='Score images this model already has results for again')
+    parser.add_argument('--compare', type=str, default=None,
+                        help='Model name to list sort differences against')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"Database not found: {args.db}")
+        sys.exit(1)
+
+    db = SortingDatabase(args.db)
+    try:
+        engine, model_name = load_engine(args)
+        print(f"Scoring {db.count_images()} archived images with {model_name} ({engine.backend.name})")
+
+        stats = reclassify(db, engine, model_name, chunk_size=args.chunk_size, batch_size=args.batch_size,
+                           workers=args.workers, rescore=args.rescore, limit=args.limit)
+        print(f"Scored {stats['images']} images in {stats['elapsed_s']:.1f}s "
+              f"({stats['images_per_second']:.0f}/s, mean batch inference "
+              f"{stats['inference']['mean_latency_ms']:.1f} ms)")
+
+        for summary in db.get_reclassification_summary(model_name):
+            print(f"{summary['model_name']}: {summary['images']} images, "
+                  f"{summary['agreement']:.1%} agree with the original sort ({summary['sorted_images']} sorted), "
+                  f"Can {summary['can_count']}, Recycling {summary['recycling_count']}, "
+                  f"Garbage {summary['garbage_count']}")
+
+        if args.compare:
+            differences = db.get_reclassification_differences(model_name, args.compare)
+            print(f"{len(differences)} images sorted differently from {args.compare}")
+            for image_id, sort_as, other_sort_as, confidence in differences[:20]:
+                print(f"  {image_id}: {sort_as} ({confidence:.2f}) vs {other_sort_as}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# shadow_evaluator.py - Runs a candidate model on sampled live frames next to the production model
+import os
+import time
+import random
+import threading
+import logging
+from collections import Counter
+
+import model_cache
+from inference_worker import InferenceWorker
+from classifier_engine import ClassifierEngine
+from calibration import Calibration
+from model_backends import TFLiteBackend, backend_for_path, load_class_mapping
+
+logger = logging.getLogger("WasteSorter")
+
+
+def lower_thread_priority(increment=10):
+    """Lower the scheduling priority of the calling thread where the OS allows it"""
+    try:
+        # On Linux the priority of a thread id only affects that thread
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), increment)
+        return True
+    except (AttributeError, OSError):
+        return False
+
+
+class ShadowEvaluator:
+    """Compares a candidate model with the production model on live traffic
+
+    Production results are offered to the evaluator after they have been
+    produced; a sampled subset of their frames is classified again by the
+    candidate in its own low-priority InferenceWorker. Offering a frame
+    never blocks: frames are dropped when the sample, the CPU budget or the
+    production latency budget says so.
+
+    - cpu_budget: fraction of one core the candidate may use on average
+      (a token bucket refilled at that rate and charged with the thread
+      CPU time of each candidate inference, which is why the candidate runs
+      on a single-threaded backend; see load)
+    - max_production_latency_ms: skip shadowing while production inference
+      is slower than this, i.e. when the machine is already busy
+
+    Agreement is counted per frame (same class, same sort category) and
+    per item (the candidate's majority sort category against the committed
+    production decision). Counters are written to the database by flush(),
+    which must be called from the thread that owns the database.
+    """
+
+    def __init__(self, engine, model_name, production_name, sample_rate=0.25, cpu_budget=0.2,
+                 max_production_latency_ms=None, burst=1.0):
+        """Initialize the evaluator around a loaded candidate engine"""
+        self.engine = engine
+        self.model_name = model_name
+        self.production_name = production_name
+        self.sample_rate = sample_rate
+        self.cpu_budget = cpu_budget
+        self.max_production_latency_ms = max_production_latency_ms
+        self.burst = burst
+
+        self._lock = threading.Lock()
+        self._allowance = burst
+        self._last_refill = time.monotonic()
+        self._priority_lowered = False
+        self._item_votes = Counter()
+
+        self.worker = InferenceWorker(self._evaluate, self._record, name="ShadowWorker")
+        self._reset_counters()
+
+    @classmethod
+    def load(cls, model_path, production_name, model_dir="models", num_threads=1, **kwargs):
+        """Load a candidate model file (.h5, .tflite or .onnx) and build an evaluator
+
+        TensorFlow would run a Keras candidate's forward pass on its own
+        thread pools, whose CPU time is not charged to the budget and whose
+        priority is not lowered. A .h5 candidate is therefore converted to
+        a float TFLite artifact (cached under <model_dir>/cache by checksum)
+        and run by a single-threaded interpreter on the shadow worker thread.
+        The .h5 file's calibration still applies.
+        """
+        if backend_for_path(model_path) == "keras":
+            tflite_path = model_cache.ensure_cached_artifact(model_path, model_cache.cache_dir_for(model_dir))
+            class_mapping = load_class_mapping(model_dir)
+            calibration = Calibration.load(model_dir, model_path) if class_mapping is not None else None
+            engine = ClassifierEngine(TFLiteBackend(tflite_path, num_threads=1), class_mapping, calibration)
+            engine.warmup()
+        else:
+            engine = ClassifierEngine.load(backend_for_path(model_path), model_dir=model_dir,
+                                           model_path=model_path, num_threads=num_threads)
+        return cls(engine, os.path.basename(model_path), production_name, **kwargs)
+
+    def _reset_counters(self):
+        """Reset the counters of the current reporting interval"""
+        self.interval_start = time.time()
+        self.frames_offered = 0
+        self.frames_evaluated = 0
+        self.skipped_sample = 0
+        self.skipped_budget = 0
+        self.skipped_latency = 0
+        self.class_agreements = 0
+        self.sort_agreements = 0
+        self.decisions = 0
+        self.decision_agreements = 0
+        self.total_latency = 0.0
+        self.total_cpu_time = 0.0
+
+    def start(self):
+        """Start the shadow worker"""
+        self.worker.start()
+
+    def stop(self):
+        """Stop the shadow worker"""
+        self.worker.stop()
+
+    def _has_budget(self):
+        """Refill the CPU token bucket and check whether a run is allowed"""
+        now = time.monotonic()
+        self._allowance = min(self.burst, self._allowance + (now - self._last_refill) * self.cpu_budget)
+        self._last_refill = now
+        return self._allowance > 0
+
+    def offer(self, frame, production_result):
+        """Offer a frame the production model has classified; never blocks"""
+        with self._lock:
+            self.frames_offered += 1
+
+            if random.random() >= self.sample_rate:
+                self.skipped_sample += 1
+                return False
+
+            latency = production_result.get("latency_ms")
+            if (self.max_production_latency_ms is not None and latency is not None
+                    and latency > self.max_production_latency_ms):
+                self.skipped_latency += 1
+                return False
+
+            if not self._has_budget():
+                self.skipped_budget += 1
+                return False
+
+        production = {"class_id": production_result["class_id"], "sort_as": production_result["sort_as"]}
+        return self.worker.submit((frame, production))
+
+    def _evaluate(self, item):
+        """Classify a frame with the candidate (runs on the shadow worker thread)"""
+        if not self._priority_lowered:
+            self._priority_lowered = lower_thread_priority()
+
+        frame, production = item
+        cpu_start = time.thread_time()
+        start = time.perf_counter()
+        result = self.engine.classify(frame)
+        latency = time.perf_counter() - start
+        cpu_time = time.thread_time() - cpu_start
+
+        with self._lock:
+            self._allowance -= cpu_time
+            self.total_cpu_time += cpu_time
+            self.total_latency += latency
+
+        return result, production
+
+    def _record(self, evaluated):
+        """Count agreement between the candidate and production results"""
+        result, production = evaluated
+        with self._lock:
+            self.frames_evaluated += 1
+            if result["class_id"] == production["class_id"]:
+                self.class_agreements += 1
+            if result["sort_as"] == production["sort_as"]:
+                self.sort_agreements += 1
+            self._item_votes[result["sort_as"]] += 1
+
+    def record_decision(self, decision):
+        """Compare the candidate's view of the item with the committed production decision"""
+        with self._lock:
+            if self._item_votes:
+                self.decisions += 1
+                candidate_sort = self._item_votes.most_common(1)[0][0]
+                if candidate_sort == decision["sort_as"]:
+                    self.decision_agreements += 1
+            self._item_votes.clear()
+
+    def reset_item(self):
+        """Forget the candidate's votes, e.g. when the item left the platform unsorted"""
+        with self._lock:
+            self._item_votes.clear()
+
+    def get_stats(self):
+        """Get agreement and budget statistics for the current interval"""
+        with self._lock:
+            evaluated = self.frames_evaluated
+            elapsed = max(time.time() - self.interval_start, 1e-6)
+            return {
+                "candidate_model": self.model_name,
+                "production_model": self.production_name,
+                "frames_offered": self.frames_offered,
+                "frames_evaluated": evaluated,
+                "skipped_sample": self.skipped_sample,
+                "skipped_budget": self.skipped_budget,
+                "skipped_latency": self.skipped_latency,
+                "class_agreements": self.class_agreements,
+                "sort_agreements": self.sort_agreements,
+                "class_agreement": self.class_agreements / evaluated if evaluated else 0.0,
+                "sort_agreement": self.sort_agreements / evaluated if evaluated else 0.0,
+                "decisions": self.decisions,
+                "decision_agreements": self.decision_agreements,
+                "decision_agreement": self.decision_agreements / self.decisions if self.decisions else 0.0,
+                "mean_latency_ms": self.total_latency / evaluated * 1000 if evaluated else 0.0,
+                "cpu_fraction": self.total_cpu_time / elapsed
+            }
+
+    def flush(self, db):
+        """Store the current interval's statistics in the database and start a new interval"""
+        stats = self.get_stats()
+        if stats["frames_evaluated"] or stats["decisions"]:
+            db.add_shadow_evaluation(stats)
+            logger.info(f"Shadow {self.model_name}: {stats['sort_agreement']:.1%} frame agreement, "
+                        f"{stats['decision_agreement']:.1%} decision agreement over "
+                        f"{stats['frames_evaluated']} frames, {stats['cpu_fraction']:.1%} CPU")
+
+        with self._lock:
+            self._reset_counters()
+        return stats
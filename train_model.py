@@ -19,10 +19,109 @@ ImageDataGenerator = keras.preprocessing.image.ImageDataGenerator
 import matplotlib.pyplot as plt
 import cv2
 import shutil
+import time
 from datetime import datetime
 import argparse
 import json
 
+from classifier_engine import ClassifierEngine, preprocess_frame
+from model_backends import TFLiteBackend
+from cascade import DEFAULT_GATE_PATH, HistogramGateClassifier, histogram_features
+from calibration import Calibration
+
+# TFLite export modes
+TFLITE_MODES = ['float', 'dynamic', 'int8']
+
+# Student architectures for knowledge distillation
+STUDENT_ARCHITECTURES = ['mobilenet', 'tiny_cnn']
+
+
+def count_flops(model):
+    """Multiply-accumulate count of the convolution and dense layers, times two"""
+    macs = 0
+    for layer in model.layers:
+        if isinstance(layer, keras.layers.DepthwiseConv2D):
+            _, h, w, c = layer.output.shape
+            kh, kw = layer.kernel_size
+            macs += h * w * kh * kw * c
+        elif isinstance(layer, keras.layers.Conv2D):
+            _, h, w, c_out = layer.output.shape
+            kh, kw = layer.kernel_size
+            macs += h * w * kh * kw * layer.input.shape[-1] * c_out
+        elif isinstance(layer, keras.layers.Dense):
+            macs += layer.input.shape[-1] * layer.units
+    return 2 * int(macs)
+
+
+class Distiller(keras.Model):
+    """Trains a student model on a teacher's softened predictions
+    
+    The loss mixes the usual cross-entropy on the hard labels with the KL
+    divergence between teacher and student distributions softened by a
+    temperature. The student outputs logits; the teacher outputs softmax
+    probabilities, whose logarithm serves as its logits.
+    """
+    
+    def __init__(self, student, teacher, temperature=4.0, distill_weight=0.7):
+        """Initialize the distiller"""
+        super().__init__()
+        self.student = student
+        self.teacher = teacher
+        self.teacher.trainable = False
+        self.temperature = temperature
+        self.distill_weight = distill_weight
+        self.teacher_size = tuple(teacher.input_shape[1:3])
+        
+        self.hard_loss_fn = keras.losses.CategoricalCrossentropy(from_logits=True)
+        self.soft_loss_fn = keras.losses.KLDivergence()
+        self.loss_tracker = keras.metrics.Mean(name="loss")
+        self.accuracy_tracker = keras.metrics.CategoricalAccuracy(name="accuracy")
+    
+    @property
+    def metrics(self):
+        """Metrics reset at the start of each epoch"""
+        return [self.loss_tracker, self.accuracy_tracker]
+    
+    def teacher_logits(self, x):
+        """Teacher logits for a batch (resized if the teacher uses another input size)"""
+        if tuple(x.shape[1:3]) != self.teacher_size:
+            x = tf.image.resize(x, self.teacher_size)
+        probabilities = self.teacher(x, training=False)
+        return tf.math.log(probabilities + 1e-7)
+    
+    def train_step(self, data):
+        """One distillation step"""
+        x, y = data
+        teacher_logits = self.teacher_logits(x)
+        
+        with tf.GradientTape() as tape:
+            student_logits = self.student(x, training=True)
+            hard_loss = self.hard_loss_fn(y, student_logits)
+            soft_loss = self.soft_loss_fn(
+                tf.nn.softmax(teacher_logits / self.temperature),
+                tf.nn.softmax(student_logits / self.temperature)
+            ) * (self.temperature ** 2)
+            loss = (1 - self.distill_weight) * hard_loss + self.distill_weight * soft_loss
+        
+        gradients = tape.gradient(loss, self.student.trainable_variables)
+        self.optimizer.apply_gradients(zip(gradients, self.student.trainable_variables))
+        
+        self.loss_tracker.update_state(loss)
+        self.accuracy_tracker.update_state(y, student_logits)
+        return {m.name: m.result() for m in self.metrics}
+    
+    def test_step(self, data):
+        """Validation step on the student alone"""
+        x, y = data
+        student_logits = self.student(x, training=False)
+        self.loss_tracker.update_state(self.hard_loss_fn(y, student_logits))
+        self.accuracy_tracker.update_state(y, student_logits)
+        return {m.name: m.result() for m in self.metrics}
+    
+    def call(self, x):
+        """Forward pass through the student"""
+        return self.student(x)
+
 
 class WasteClassifierTrainer:
     """Trainer for waste classification model"""
@@ -34,7 +133,8 @@ class WasteClassifierTrainer:
                  batch_size=32,
                  epochs=50,
                  learning_rate=0.0001,
-                 fine_tune_layers=20):
+                 fine_tune_layers=20,
+                 alpha=1.0):
         """Initialize the trainer"""
         self.data_dir = data_dir
         self.model_dir = model_dir
@@ -43,6 +143,7 @@ class WasteClassifierTrainer:
         self.epochs = epochs
         self.learning_rate = learning_rate
         self.fine_tune_layers = fine_tune_layers
+        self.alpha = alpha
         
         # Create directories if they don't exist
         os.makedirs(data_dir, exist_ok=True)
@@ -63,6 +164,14 @@ class WasteClassifierTrainer:
         # Model
         self.model = None
         self.history = None
+        self.engine = None
+        
+        # File the current model was loaded from or last saved to
+        self.model_path = None
+        
+        # Calibration fitted for the current model, extended to its exports
+        self.calibration = None
+        self.calibrated_model = None
     
     def prepare_directories(self):
         """Prepare the directory structure for training data"""
@@ -152,6 +261,7 @@ class WasteClassifierTrainer:
         # Use MobileNetV2 as the base model
         base_model = MobileNetV2(
             input_shape=(*self.image_size, 3),
+            alpha=self.alpha,
             include_top=False,
             weights='imagenet'
         )
@@ -178,8 +288,8 @@ class WasteClassifierTrainer:
         # Print model summary
         self.model.summary()
     
-    def train_model(self):
-        """Train the model"""
+    def train_model(self, qat_epochs=0, num_calibration_samples=200):
+        """Train the model, optionally followed by quantization-aware fine-tuning"""
         if self.model is None:
             self.create_model()
         
@@ -231,7 +341,416 @@ class WasteClassifierTrainer:
         print(f"Model saved to {final_model_path}")
         
         # Also save as the latest model
-        self.model.save(os.path.join(self.model_dir, 'latest_model.h5'))
+        latest_model_path = os.path.join(self.model_dir, 'latest_model.h5')
+        self.model.save(latest_model_path)
+        self.model_path = latest_model_path
+        
+        # Fit confidence calibration for the new model on the validation split
+        self.calibrate_model(model_paths=[final_model_path, latest_model_path])
+        
+        if qat_epochs > 0:
+            self.quantization_aware_finetune(epochs=qat_epochs, num_calibration_samples=num_calibration_samples)
+    
+    def calibrate_model(self, target_precision=0.90, model_paths=None):
+        """Fit temperature scaling and per-class thresholds on the validation split
+        
+        The parameters are added to calibration.json next to
+        class_mapping.json as an entry for the checksums of model_paths,
+        the files holding the current model (the file it was loaded from or
+        last saved to by default); entries of other models are kept.
+        ClassifierEngine applies the entry to those files only. Later
+        TFLite and ONNX exports of the same model are added to the entry.
+        """
+        if self.model is None:
+            print("No model available. Please train or load a model first.")
+            return None
+        
+        if self.validation_generator is None:
+            self.create_data_generators()
+        
+        # Index batches directly so predictions and labels stay aligned
+        engine = self.get_engine()
+        probabilities, labels = [], []
+        for batch_index in range(len(self.validation_generator)):
+            images, batch_labels = self.validation_generator[batch_index]
+            probabilities.append(engine.predict(images.astype(np.float32)))
+            labels.append(np.argmax(batch_labels, axis=1))
+        
+        calibration = Calibration.fit(np.concatenate(probabilities), np.concatenate(labels),
+                                      target_precision=target_precision)
+        for model_path in model_paths or [self.model_path or os.path.join(self.model_dir, 'latest_model.h5')]:
+            calibration.add_model(model_path)
+        calibration.save(self.model_dir)
+        self.calibration = calibration
+        self.calibrated_model = self.model
+        
+        metrics = calibration.metrics
+        print(f"Calibration temperature: {calibration.temperature:.3f}")
+        print(f"NLL {metrics['nll_before']:.4f} -> {metrics['nll_after']:.4f}, "
+              f"ECE {metrics['ece_before']:.4f} -> {metrics['ece_after']:.4f}")
+        for class_id, threshold in calibration.class_thresholds.items():
+            class_name = self.class_mapping.get(int(class_id), self.class_mapping.get(class_id, class_id))
+            print(f"Threshold for {class_name}: {threshold:.3f} "
+                  f"({target_precision:.0%} precision on validation)")
+        
+        # The trainer's engine keeps working on raw model outputs
+        return calibration
+    
+    def _add_export_to_calibration(self, export_path):
+        """Extend the current model's calibration to an export of it"""
+        if self.calibration is not None and self.calibrated_model is self.model:
+            self.calibration.add_model(export_path)
+            self.calibration.save(self.model_dir)
+    
+    def quantization_aware_finetune(self, epochs=5, learning_rate=None, num_calibration_samples=200,
+                                    num_threads=None):
+        """Fine-tune the current model with fake-quant ops, then export it as an INT8 TFLite model
+        
+        Requires the tensorflow_model_optimization package. The float model
+        is kept as the baseline; both it (float and post-training INT8) and
+        the quantization-aware model are exported and evaluated on the same
+        test generator, and the comparison is saved to models/qat_report.json.
+        latest_model.h5 stays the float model, since the fake-quant layers
+        need tfmot to load.
+        """
+        if self.model is None:
+            print("No model available. Please train or load a model first.")
+            return None
+        
+        try:
+            import tensorflow_model_optimization as tfmot
+        except ImportError:
+            print("Quantization-aware training requires tensorflow-model-optimization "
+                  "(pip install tensorflow-model-optimization)")
+            return None
+        
+        if self.train_generator is None or self.validation_generator is None:
+            self.create_data_generators()
+        
+        float_model = self.model
+        
+        # Insert fake-quant ops that simulate INT8 rounding in the forward pass
+        qat_model = tfmot.quantization.keras.quantize_model(float_model)
+        qat_model.compile(
+            optimizer=Adam(learning_rate=learning_rate or self.learning_rate / 10),
+            loss='categorical_crossentropy',
+            metrics=['accuracy']
+        )
+        
+        early_stopping = EarlyStopping(
+            monitor='val_accuracy',
+            patience=3,
+            mode='max',
+            restore_best_weights=True,
+            verbose=1
+        )
+        
+        print(f"Starting quantization-aware fine-tuning for {epochs} epochs")
+        qat_model.fit(
+            self.train_generator,
+            steps_per_epoch=self.train_generator.samples // self.batch_size,
+            epochs=epochs,
+            validation_data=self.validation_generator,
+            validation_steps=self.validation_generator.samples // self.batch_size,
+            callbacks=[early_stopping]
+        )
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        qat_model_path = os.path.join(self.model_dir, f'waste_classifier_qat_{timestamp}.h5')
+        qat_model.save(qat_model_path)
+        print(f"Quantization-aware model saved to {qat_model_path}")
+        
+        # Float baseline and post-training INT8 from the float model
+        report = {}
+        for mode in ['float', 'int8']:
+            tflite_path = self.export_tflite_model(
+                mode=mode,
+                filename=f'waste_classifier_{mode}.tflite',
+                num_calibration_samples=num_calibration_samples
+            )
+            report[f'{mode} (post-training)' if mode == 'int8' else mode] = \
+                self.evaluate_tflite_model(tflite_path, num_threads=num_threads)
+        
+        # Integer model from the quantization-aware weights; the float model stays
+        # the trainer's model for evaluation, pruning, calibration and export
+        self.model = qat_model
+        try:
+            qat_path = self.export_tflite_model(
+                mode='int8',
+                filename='waste_classifier_qat_int8.tflite',
+                num_calibration_samples=num_calibration_samples
+            )
+        finally:
+            self.model = float_model
+        report['int8 (QAT)'] = self.evaluate_tflite_model(qat_path, num_threads=num_threads)
+        
+        print("\nQuantization-aware training report")
+        print(f"{'Model':<22}{'Size (KB)':>12}{'Accuracy':>12}{'Latency (ms)':>15}")
+        for name, result in report.items():
+            print(f"{name:<22}{result['size_kb']:>12.1f}{result['accuracy']:>12.4f}{result['latency_ms']:>15.2f}")
+        
+        report_path = os.path.join(self.model_dir, 'qat_report.json')
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Report saved to {report_path}")
+        
+        return qat_path
+    
+    def _channels_to_keep(self, importance, ratio, multiple=8):
+        """Indices of the most important channels after removing a fraction (a multiple of 8 kept)"""
+        keep = int(round(len(importance) * (1 - ratio) / multiple)) * multiple
+        keep = min(len(importance), max(multiple, keep))
+        return np.sort(np.argsort(-importance)[:keep])
+    
+    def prune_model(self, ratio=0.3, fine_tune_epochs=5, num_threads=None):
+        """Remove low-importance channels, fine-tune, and compare the model before and after
+        
+        In every MobileNetV2 inverted residual block the expansion channels
+        are internal to the block, so they can be removed without touching
+        the residual connections: the expand convolution loses output
+        filters, the depthwise convolution loses channels and the project
+        convolution loses inputs. Channels are ranked by the absolute BN
+        scale of the depthwise output (network slimming). The hidden units
+        of the dense head are pruned the same way by weight magnitude.
+        
+        The pruned network is rebuilt with fewer filters, so it is
+        physically smaller and cheaper, not just sparse. FLOPs, parameters,
+        file size, accuracy and CPU latency before and after are saved to
+        models/pruning_report.json.
+        """
+        if self.model is None:
+            print("No model available. Please train or load a model first.")
+            return None
+        
+        original = self.model
+        layers = {layer.name: layer for layer in original.layers}
+        blocks = sorted({int(name.split('_')[1]) for name in layers
+                         if name.startswith('block_') and name.endswith('_expand')})
+        if not blocks:
+            raise ValueError("Pruning needs a fine-tuned MobileNetV2 built by create_model")
+        
+        # Channels to keep per block and in the dense head
+        keep = {}
+        for block in blocks:
+            gamma = layers[f'block_{block}_depthwise_BN'].get_weights()[0]
+            keep[block] = self._channels_to_keep(np.abs(gamma), ratio)
+        
+        dense_layers = [layer for layer in original.layers if isinstance(layer, keras.layers.Dense)]
+        head, output_layer = (dense_layers[-2], dense_layers[-1]) if len(dense_layers) >= 2 else (None, None)
+        if head is not None:
+            head_kernel = head.get_weights()[0]
+            importance = np.abs(head_kernel).sum(axis=0) * np.abs(output_layer.get_weights()[0]).sum(axis=1)
+            head_keep = self._channels_to_keep(importance, ratio)
+        
+        # Rebuild the network with fewer filters
+        config = original.get_config()
+        for layer_config in config['layers']:
+            name = layer_config['config']['name']
+            if name.startswith('block_') and name.endswith('_expand'):
+                layer_config['config']['filters'] = len(keep[int(name.split('_')[1])])
+            elif head is not None and name == head.name:
+                layer_config['config']['units'] = len(head_keep)
+        pruned = Model.from_config(config)
+        
+        # Copy the surviving weights
+        for layer in pruned.layers:
+            weights = layers[layer.name].get_weights()
+            parts = layer.name.split('_')
+            if layer.name.startswith('block_') and parts[1].isdigit() and int(parts[1]) in keep:
+                idx = keep[int(parts[1])]
+                suffix = '_'.join(parts[2:])
+                if suffix == 'expand':
+                    weights = [weights[0][..., idx]] + [w[idx] for w in weights[1:]]
+                elif suffix in ('expand_BN', 'depthwise_BN'):
+                    weights = [w[idx] for w in weights]
+                elif suffix == 'depthwise':
+                    weights = [weights[0][:, :, idx, :]] + [w[idx] for w in weights[1:]]
+                elif suffix == 'project':
+                    weights = [weights[0][:, :, idx, :]] + weights[1:]
+            elif head is not None and layer.name == head.name:
+                weights = [weights[0][:, head_keep], weights[1][head_keep]]
+            elif head is not None and layer.name == output_layer.name:
+                weights = [weights[0][head_keep, :], weights[1]]
+            layer.set_weights(weights)
+        
+        print(f"Pruned {ratio:.0%} of the expansion channels in {len(blocks)} blocks "
+              f"({original.count_params():,} -> {pruned.count_params():,} parameters)")
+        
+        # Fine-tune to recover accuracy
+        if fine_tune_epochs > 0:
+            if self.train_generator is None or self.validation_generator is None:
+                self.create_data_generators()
+            
+            pruned.compile(
+                optimizer=Adam(learning_rate=self.learning_rate),
+                loss='categorical_crossentropy',
+                metrics=['accuracy']
+            )
+            pruned.fit(
+                self.train_generator,
+                steps_per_epoch=self.train_generator.samples // self.batch_size,
+                epochs=fine_tune_epochs,
+                validation_data=self.validation_generator,
+                validation_steps=self.validation_generator.samples // self.batch_size,
+                callbacks=[EarlyStopping(monitor='val_accuracy', patience=3, mode='max',
+                                         restore_best_weights=True, verbose=1)]
+            )
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        pruned_path = os.path.join(self.model_dir, f'waste_classifier_pruned_{timestamp}.h5')
+        pruned.save(pruned_path)
+        print(f"Pruned model saved to {pruned_path}")
+        
+        # Compare both models with the same measurements
+        report = {}
+        for label, model, h5_path in [('original', original, None), ('pruned', pruned, pruned_path)]:
+            if h5_path is None:
+                h5_path = os.path.join(self.model_dir, f'waste_classifier_{label}_{timestamp}.h5')
+                model.save(h5_path)
+            
+            self.model = model
+            keras_latency = self.measure_keras_latency()
+            tflite_path = self.export_tflite_model(mode='float', filename=f'waste_classifier_{label}.tflite')
+            tflite = self.evaluate_tflite_model(tflite_path, num_threads=num_threads)
+            if model is pruned:
+                pruned_tflite_path = tflite_path
+            report[label] = {
+                "flops": count_flops(model),
+                "params": int(model.count_params()),
+                "h5_size_kb": os.path.getsize(h5_path) / 1024,
+                "tflite_size_kb": tflite["size_kb"],
+                "accuracy": tflite["accuracy"],
+                "keras_latency_ms": keras_latency,
+                "tflite_latency_ms": tflite["latency_ms"]
+            }
+        
+        print("\nPruning report")
+        print(f"{'Model':<10}{'MFLOPs':>10}{'Params':>12}{'Size (KB)':>12}{'Accuracy':>10}"
+              f"{'Keras (ms)':>12}{'TFLite (ms)':>13}")
+        for label, result in report.items():
+            print(f"{label:<10}{result['flops'] / 1e6:>10.1f}{result['params']:>12,}{result['tflite_size_kb']:>12.1f}"
+                  f"{result['accuracy']:>10.4f}{result['keras_latency_ms']:>12.2f}{result['tflite_latency_ms']:>13.2f}")
+        
+        report_path = os.path.join(self.model_dir, 'pruning_report.json')
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Report saved to {report_path}")
+        
+        # Keep the pruned model as the trainer's current model, calibrated for its files
+        self.model = pruned
+        self.model_path = pruned_path
+        self.calibrate_model(model_paths=[pruned_path, pruned_tflite_path])
+        return pruned_path
+    
+    def measure_keras_latency(self, runs=50):
+        """Single-frame CPU latency of the current model through the compiled Keras backend"""
+        engine = self.get_engine()
+        sample = np.zeros((1, *engine.image_size, 3), dtype=np.float32)
+        engine.predict(sample)
+        start = time.perf_counter()
+        for _ in range(runs):
+            engine.predict(sample)
+        return (time.perf_counter() - start) / runs * 1000
+    
+    def create_student_model(self, architecture='mobilenet', alpha=0.35):
+        """Create a small student network that outputs logits
+        
+        'mobilenet' is a reduced-width MobileNetV2 (alpha 0.35 by default);
+        'tiny_cnn' is a small separable-convolution network trained from scratch.
+        """
+        num_classes = len(self.class_mapping)
+        inputs = keras.Input(shape=(*self.image_size, 3))
+        
+        if architecture == 'mobilenet':
+            base_model = MobileNetV2(
+                input_shape=(*self.image_size, 3),
+                include_top=False,
+                weights='imagenet',
+                alpha=alpha
+            )
+            x = base_model(inputs)
+        elif architecture == 'tiny_cnn':
+            x = inputs
+            for filters in [16, 32, 64, 128]:
+                x = keras.layers.SeparableConv2D(filters, 3, padding='same', use_bias=False)(x)
+                x = keras.layers.BatchNormalization()(x)
+                x = keras.layers.ReLU()(x)
+                x = keras.layers.MaxPooling2D()(x)
+        else:
+            raise ValueError(f"Unknown student architecture: {architecture}")
+        
+        x = GlobalAveragePooling2D()(x)
+        logits = Dense(num_classes, name='logits')(x)
+        
+        student = Model(inputs=inputs, outputs=logits, name=f'student_{architecture}')
+        student.summary()
+        return student
+    
+    def train_distilled(self, teacher_path, architecture='mobilenet', alpha=0.35,
+                        temperature=4.0, distill_weight=0.7):
+        """Train a small student model from an existing trained teacher model"""
+        if self.train_generator is None or self.validation_generator is None:
+            self.create_data_generators()
+        
+        teacher = load_model(teacher_path)
+        print(f"Teacher model loaded from {teacher_path}")
+        
+        student = self.create_student_model(architecture, alpha)
+        distiller = Distiller(student, teacher, temperature=temperature, distill_weight=distill_weight)
+        distiller.compile(optimizer=Adam(learning_rate=self.learning_rate))
+        
+        early_stopping = EarlyStopping(
+            monitor='val_accuracy',
+            patience=10,
+            mode='max',
+            restore_best_weights=True,
+            verbose=1
+        )
+        
+        reduce_lr = ReduceLROnPlateau(
+            monitor='val_loss',
+            factor=0.2,
+            patience=5,
+            min_lr=1e-6,
+            verbose=1
+        )
+        
+        print(f"Starting distillation with {self.train_generator.samples} training samples "
+              f"and {self.validation_generator.samples} validation samples")
+        
+        self.history = distiller.fit(
+            self.train_generator,
+            steps_per_epoch=self.train_generator.samples // self.batch_size,
+            epochs=self.epochs,
+            validation_data=self.validation_generator,
+            validation_steps=self.validation_generator.samples // self.batch_size,
+            callbacks=[early_stopping, reduce_lr]
+        )
+        
+        # Add a softmax so the student outputs probabilities like the teacher
+        probabilities = keras.layers.Softmax(name='predictions')(student.output)
+        self.model = Model(inputs=student.input, outputs=probabilities, name=student.name)
+        self.model.compile(
+            optimizer=Adam(learning_rate=self.learning_rate),
+            loss='categorical_crossentropy',
+            metrics=['accuracy']
+        )
+        
+        # Save the student in the same layout as a regular model
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        final_model_path = os.path.join(self.model_dir, f'waste_classifier_student_{timestamp}.h5')
+        self.model.save(final_model_path)
+        print(f"Student model saved to {final_model_path}")
+        
+        # Also save as the latest model
+        latest_model_path = os.path.join(self.model_dir, 'latest_model.h5')
+        self.model.save(latest_model_path)
+        self.model_path = latest_model_path
+        
+        # The teacher's calibration does not carry over to the student
+        self.calibrate_model(model_paths=[final_model_path, latest_model_path])
+        
+        return self.model
     
     def evaluate_model(self):
         """Evaluate the model on the test set"""
@@ -328,6 +847,7 @@ class WasteClassifierTrainer:
         # Load the model
         try:
             self.model = load_model(model_path)
+            self.model_path = model_path
             print(f"Model loaded from {model_path}")
             
             # Load class mapping if available
@@ -342,6 +862,12 @@ class WasteClassifierTrainer:
             print(f"Error loading model: {e}")
             return False
     
+    def get_engine(self):
+        """Get a ClassifierEngine around the current model"""
+        if self.engine is None or self.engine.backend.model is not self.model:
+            self.engine = ClassifierEngine.from_keras_model(self.model, self.class_mapping)
+        return self.engine
+    
     def predict_single_image(self, image_path):
         """Predict class for a single image"""
         if self.model is None:
@@ -349,20 +875,12 @@ class WasteClassifierTrainer:
             return None
         
         try:
-            # Load and preprocess the image
+            # Load the image and classify it
             img = cv2.imread(image_path)
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            img = cv2.resize(img, self.image_size)
-            img = img / 255.0
-            img = np.expand_dims(img, axis=0)
+            result = self.get_engine().classify(img)
             
-            # Make prediction
-            prediction = self.model.predict(img)
-            predicted_class = np.argmax(prediction[0])
-            confidence = prediction[0][predicted_class] * 100
-            
-            # Get class name
-            class_name = self.class_mapping.get(str(predicted_class), f"Class {predicted_class}")
+            class_name = result["class_name"]
+            confidence = result["confidence"] * 100
             
             print(f"Predicted class: {class_name}")
             print(f"Confidence: {confidence:.2f}%")
@@ -379,21 +897,8 @@ class WasteClassifierTrainer:
             return None, 0.0
         
         try:
-            # Preprocess the image
-            img = cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB)
-            img = cv2.resize(img, self.image_size)
-            img = img / 255.0
-            img = np.expand_dims(img, axis=0)
-            
-            # Make prediction
-            prediction = self.model.predict(img)
-            predicted_class = np.argmax(prediction[0])
-            confidence = prediction[0][predicted_class]
-            
-            # Get class name
-            class_name = self.class_mapping.get(str(predicted_class), f"Class {predicted_class}")
-            
-            return class_name, confidence
+            result = self.get_engine().classify(image_array)
+            return result["class_name"], result["confidence"]
         except Exception as e:
             print(f"Error predicting image: {e}")
             return None, 0.0
@@ -445,28 +950,167 @@ class WasteClassifierTrainer:
                     dst = os.path.join(target_dir, file)
                     shutil.copy2(src, dst)
     
-    def export_tflite_model(self, quantize=True):
-        """Export the model to TFLite format"""
+    def get_sample_image_paths(self, num_samples=200, random_seed=42):
+        """Pick a random sample of training images (train split if available)"""
+        source_dir = os.path.join(self.data_dir, 'train')
+        if not os.path.exists(source_dir):
+            source_dir = self.data_dir
+        
+        image_paths = []
+        for class_name in sorted(os.listdir(source_dir)):
+            class_dir = os.path.join(source_dir, class_name)
+            if not os.path.isdir(class_dir) or class_name in ['train', 'validation', 'test']:
+                continue
+            
+            image_paths.extend(os.path.join(class_dir, f) for f in os.listdir(class_dir)
+                               if f.lower().endswith(('.png', '.jpg', '.jpeg')))
+        
+        rng = np.random.default_rng(random_seed)
+        rng.shuffle(image_paths)
+        return image_paths[:num_samples]
+    
+    def get_labeled_image_paths(self, split='train', class_names=None):
+        """List (image_path, class_index) pairs of a split, with classes in folder order"""
+        source_dir = os.path.join(self.data_dir, split)
+        if not os.path.exists(source_dir):
+            source_dir = self.data_dir
+        
+        if class_names is None:
+            class_names = sorted(c for c in os.listdir(source_dir)
+                                 if os.path.isdir(os.path.join(source_dir, c))
+                                 and c not in ['train', 'validation', 'test'])
+        
+        samples = []
+        for label, class_name in enumerate(class_names):
+            class_dir = os.path.join(source_dir, class_name)
+            if not os.path.isdir(class_dir):
+                continue
+            samples.extend((os.path.join(class_dir, f), label) for f in sorted(os.listdir(class_dir))
+                           if f.lower().endswith(('.png', '.jpg', '.jpeg')))
+        return class_names, samples
+    
+    def train_gate_classifier(self, path=None, thresholds=(0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)):
+        """Train the histogram gate for the cascade and report hit rate per margin threshold
+        
+        With a model loaded, the report also shows the category accuracy of
+        the whole cascade (gate when confident, full model otherwise) on the
+        validation split, so the threshold can be picked for throughput.
+        """
+        path = path or os.path.join(self.model_dir, os.path.basename(DEFAULT_GATE_PATH))
+        
+        class_names, samples = self.get_labeled_image_paths('train')
+        if not samples:
+            print(f"No training images found in {self.data_dir}")
+            return None
+        
+        features, labels = [], []
+        for image_path, label in samples:
+            img = cv2.imread(image_path)
+            if img is not None:
+                features.append(histogram_features(img))
+                labels.append(label)
+        
+        print(f"Training gate classifier on {len(features)} images ({', '.join(class_names)})")
+        gate = HistogramGateClassifier(class_names).fit(features, labels)
+        gate.save(path)
+        
+        # Evaluate on the validation split
+        _, samples = self.get_labeled_image_paths('validation', class_names)
+        images = [(cv2.imread(p), label) for p, label in samples]
+        images = [(img, label) for img, label in images if img is not None]
+        if not images:
+            return gate
+        
+        gate_probs = np.array([gate.predict_proba(img) for img, _ in images])
+        labels = np.array([label for _, label in images])
+        print(f"Gate accuracy: {np.mean(np.argmax(gate_probs, axis=1) == labels):.4f}")
+        
+        if self.model is None:
+            return gate
+        
+        # Simulate the cascade at each threshold from one pass of both models
+        engine = self.get_engine()
+        full_probs = np.array([engine.predict_frame(img)[0] for img, _ in images])
+        gate_categories = np.array([list(engine.category_probabilities(p).values()) for p in gate_probs])
+        true_categories = np.array([engine.sort_category(label) for label in labels])
+        
+        sorted_categories = np.sort(gate_categories, axis=1)
+        margins = sorted_categories[:, -1] - sorted_categories[:, -2]
+        gate_sort = np.array([engine.sort_category(i) for i in np.argmax(gate_probs, axis=1)])
+        full_sort = np.array([engine.sort_category(i) for i in np.argmax(full_probs, axis=1)])
+        
+        print(f"\nFull model category accuracy: {np.mean(full_sort == true_categories):.4f}")
+        print(f"{'Margin':>8}{'Gate hits':>12}{'Accuracy':>12}")
+        report = {}
+        for threshold in thresholds:
+            use_gate = margins >= threshold
+            cascade_sort = np.where(use_gate, gate_sort, full_sort)
+            report[threshold] = {
+                "gate_hit_rate": float(np.mean(use_gate)),
+                "accuracy": float(np.mean(cascade_sort == true_categories))
+            }
+            print(f"{threshold:>8.2f}{report[threshold]['gate_hit_rate']:>12.2%}"
+                  f"{report[threshold]['accuracy']:>12.4f}")
+        
+        return gate
+    
+    def representative_dataset(self, num_samples=200):
+        """Representative dataset generator for full-integer quantization"""
+        image_paths = self.get_sample_image_paths(num_samples)
+        if not image_paths:
+            raise ValueError(f"No training images found in {self.data_dir} for calibration")
+        
+        print(f"Calibrating quantization on {len(image_paths)} training images")
+        
+        def generator():
+            for image_path in image_paths:
+                img = cv2.imread(image_path)
+                if img is None:
+                    continue
+                yield [preprocess_frame(img, self.image_size)]
+        
+        return generator
+    
+    def export_tflite_model(self, quantize=True, mode=None, filename='waste_classifier.tflite',
+                            num_calibration_samples=200):
+        """Export the model to TFLite format
+        
+        mode is one of 'float', 'dynamic' (dynamic-range quantization, the
+        default when quantize is True) or 'int8' (full-integer quantization
+        calibrated on training images, with uint8 input and output).
+        """
         if self.model is None:
             print("No model available. Please train or load a model first.")
             return None
         
+        if mode is None:
+            mode = 'dynamic' if quantize else 'float'
+        if mode not in TFLITE_MODES:
+            raise ValueError(f"Unknown TFLite export mode: {mode}")
+        
         # Create TFLite converter
         converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
         
-        # Set optimization flag
-        if quantize:
+        # Set optimization flags
+        if mode == 'dynamic':
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        elif mode == 'int8':
             converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = self.representative_dataset(num_calibration_samples)
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+            converter.inference_input_type = tf.uint8
+            converter.inference_output_type = tf.uint8
         
         # Convert the model
         tflite_model = converter.convert()
         
         # Save the model
-        tflite_path = os.path.join(self.model_dir, 'waste_classifier.tflite')
+        tflite_path = os.path.join(self.model_dir, filename)
         with open(tflite_path, 'wb') as f:
             f.write(tflite_model)
         
-        print(f"TFLite model saved to {tflite_path}")
+        print(f"TFLite model ({mode}) saved to {tflite_path}")
+        self._add_export_to_calibration(tflite_path)
         
         # Save class mapping if not already saved
         mapping_path = os.path.join(self.model_dir, 'class_mapping.json')
@@ -475,7 +1119,122 @@ class WasteClassifierTrainer:
                 json.dump(self.class_mapping, f)
         
         return tflite_path
-
+    
+    def export_onnx_model(self, filename='waste_classifier.onnx'):
+        """Export the model to ONNX for the OpenCV DNN backend
+        
+        The input is converted to NCHW, the layout cv2.dnn expects, and the
+        model's input shape is written to a JSON file next to it. Requires
+        the tf2onnx package.
+        """
+        if self.model is None:
+            print("No model available. Please train or load a model first.")
+            return None
+        
+        try:
+            import tf2onnx
+        except ImportError:
+            print("ONNX export requires tf2onnx (pip install tf2onnx)")
+            return None
+        
+        onnx_path = os.path.join(self.model_dir, filename)
+        input_shape = tuple(self.model.input_shape[1:])
+        input_name = self.model.inputs[0].name.split(':')[0]
+        spec = (tf.TensorSpec((None, *input_shape), tf.float32, name=input_name),)
+        
+        tf2onnx.convert.from_keras(
+            self.model,
+            input_signature=spec,
+            opset=13,
+            inputs_as_nchw=[input_name],
+            output_path=onnx_path
+        )
+        
+        # The ONNX graph does not expose its input size to cv2.dnn
+        info_path = os.path.splitext(onnx_path)[0] + '.json'
+        with open(info_path, 'w') as f:
+            json.dump({"input_shape": list(input_shape), "layout": "NCHW"}, f)
+        
+        print(f"ONNX model saved to {onnx_path}")
+        self._add_export_to_calibration(onnx_path)
+        
+        # Save class mapping if not already saved
+        mapping_path = os.path.join(self.model_dir, 'class_mapping.json')
+        if not os.path.exists(mapping_path):
+            with open(mapping_path, 'w') as f:
+                json.dump(self.class_mapping, f)
+        
+        return onnx_path
+    
+    def get_test_generator(self):
+        """Get the test generator, falling back to the validation generator"""
+        if self.test_generator is None and self.validation_generator is None:
+            self.create_data_generators()
+        
+        if self.test_generator is None:
+            print("No test generator available. Using the validation set.")
+            return self.validation_generator
+        return self.test_generator
+    
+    def evaluate_tflite_model(self, tflite_path, num_threads=None, latency_runs=50):
+        """Measure accuracy on the test split and single-image latency of a TFLite model"""
+        backend = TFLiteBackend(tflite_path, num_threads=num_threads)
+        generator = self.get_test_generator()
+        
+        # Accuracy on the test split
+        correct = 0
+        total = 0
+        sample_image = None
+        for batch_index in range(len(generator)):
+            images, labels = generator[batch_index]
+            predictions = backend.predict(images.astype(np.float32))
+            correct += int(np.sum(np.argmax(predictions, axis=1) == np.argmax(labels, axis=1)))
+            total += len(images)
+            if sample_image is None:
+                sample_image = images[:1].astype(np.float32)
+        
+        # Latency of a single inference
+        backend.predict(sample_image)
+        start = time.perf_counter()
+        for _ in range(latency_runs):
+            backend.predict(sample_image)
+        latency_ms = (time.perf_counter() - start) / latency_runs * 1000
+        
+        return {
+            "path": tflite_path,
+            "size_kb": os.path.getsize(tflite_path) / 1024,
+            "accuracy": correct / total if total else 0.0,
+            "latency_ms": latency_ms
+        }
+    
+    def quantization_report(self, num_threads=None, num_calibration_samples=200):
+        """Export float, dynamic-range and INT8 models and compare them side by side"""
+        if self.model is None:
+            print("No model available. Please train or load a model first.")
+            return None
+        
+        report = {}
+        for mode in TFLITE_MODES:
+            tflite_path = self.export_tflite_model(
+                mode=mode,
+                filename=f'waste_classifier_{mode}.tflite',
+                num_calibration_samples=num_calibration_samples
+            )
+            report[mode] = self.evaluate_tflite_model(tflite_path, num_threads=num_threads)
+        
+        # Print the report
+        print("\nQuantization report")
+        print(f"{'Mode':<10}{'Size (KB)':>12}{'Accuracy':>12}{'Latency (ms)':>15}")
+        for mode, result in report.items():
+            print(f"{mode:<10}{result['size_kb']:>12.1f}{result['accuracy']:>12.4f}{result['latency_ms']:>15.2f}")
+        
+        # Save the report next to the models
+        report_path = os.path.join(self.model_dir, 'quantization_report.json')
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Report saved to {report_path}")
+        
+        return report
 
 def main():
     """Main function for command-line usage"""
@@ -492,14 +1251,53 @@ def main():
                         help='Learning rate for training')
     parser.add_argument('--image_size', type=int, default=224,
                         help='Image size for training (square)')
+    parser.add_argument('--alpha', type=float, default=1.0,
+                        help='Width multiplier of the MobileNetV2 base (0.35, 0.5, 0.75, 1.0, 1.3 or 1.4)')
     parser.add_argument('--split_data', action='store_true',
                         help='Split data into train/validation/test sets')
     parser.add_argument('--load_model', type=str, default=None,
                         help='Path to model to load (optional)')
     parser.add_argument('--evaluate', action='store_true',
                         help='Evaluate model after training')
+    parser.add_argument('--skip_training', action='store_true',
+                        help='Skip training and use the loaded model (with --load_model)')
+    parser.add_argument('--distill_from', type=str, default=None,
+                        help='Train a small student model distilled from this trained teacher model')
+    parser.add_argument('--student', type=str, default='mobilenet', choices=STUDENT_ARCHITECTURES,
+                        help='Student architecture for distillation')
+    parser.add_argument('--student_alpha', type=float, default=0.35,
+                        help='Width multiplier of the MobileNetV2 student')
+    parser.add_argument('--temperature', type=float, default=4.0,
+                        help='Softmax temperature for distillation')
+    parser.add_argument('--distill_weight', type=float, default=0.7,
+                        help='Weight of the soft-target loss in distillation (0-1)')
     parser.add_argument('--export_tflite', action='store_true',
                         help='Export trained model to TFLite format')
+    parser.add_argument('--export_onnx', action='store_true',
+                        help='Export the model to ONNX for the OpenCV DNN backend')
+    parser.add_argument('--train_gate', action='store_true',
+                        help='Train the histogram gate classifier for cascade mode')
+    parser.add_argument('--qat_epochs', type=int, default=0,
+                        help='Quantization-aware fine-tuning epochs after training (0 disables); '
+                             'exports models/waste_classifier_qat_int8.tflite')
+    parser.add_argument('--calibrate', action='store_true',
+                        help='Fit confidence calibration for a loaded model (done automatically after training)')
+    parser.add_argument('--calibration_precision', type=float, default=0.90,
+                        help='Target precision for the per-class confidence thresholds')
+    parser.add_argument('--prune', type=float, default=None,
+                        help='Fraction of expansion channels to remove (e.g. 0.3), then fine-tune')
+    parser.add_argument('--prune_epochs', type=int, default=5,
+                        help='Fine-tuning epochs after pruning')
+    parser.add_argument('--register', action='store_true',
+                        help='Add the model to the versioned registry in models/registry')
+    parser.add_argument('--register_path', type=str, default=None,
+                        help='Model file to register (defaults to latest_model.h5)')
+    parser.add_argument('--quantization', type=str, default='dynamic', choices=TFLITE_MODES,
+                        help='Quantization mode for the TFLite export')
+    parser.add_argument('--calibration_samples', type=int, default=200,
+                        help='Number of training images used to calibrate INT8 quantization')
+    parser.add_argument('--quantization_report', action='store_true',
+                        help='Export float, dynamic-range and INT8 models and compare accuracy and latency')
     
     args = parser.parse_args()
     
@@ -510,7 +1308,8 @@ def main():
         image_size=(args.image_size, args.image_size),
         batch_size=args.batch_size,
         epochs=args.epochs,
-        learning_rate=args.learning_rate
+        learning_rate=args.learning_rate,
+        alpha=args.alpha
     )
     
     # Split data if requested
@@ -528,18 +1327,67 @@ def main():
     trainer.create_data_generators()
     
     # Train model
-    trainer.train_model()
-    
-    # Plot training history
-    trainer.plot_training_history()
+    if args.distill_from:
+        trainer.train_distilled(
+            args.distill_from,
+            architecture=args.student,
+            alpha=args.student_alpha,
+            temperature=args.temperature,
+            distill_weight=args.distill_weight
+        )
+        trainer.plot_training_history()
+    elif not args.skip_training:
+        trainer.train_model(qat_epochs=args.qat_epochs, num_calibration_samples=args.calibration_samples)
+        
+        # Plot training history
+        trainer.plot_training_history()
+    elif args.qat_epochs > 0:
+        trainer.quantization_aware_finetune(epochs=args.qat_epochs,
+                                            num_calibration_samples=args.calibration_samples)
     
     # Evaluate model if requested
+    evaluation = None
     if args.evaluate:
-        trainer.evaluate_model()
+        evaluation = trainer.evaluate_model()
+    
+    # Prune and fine-tune if requested
+    if args.prune:
+        trainer.prune_model(ratio=args.prune, fine_tune_epochs=args.prune_epochs)
+    
+    # Fit confidence calibration if requested
+    if args.calibrate:
+        trainer.calibrate_model(target_precision=args.calibration_precision)
     
     # Export to TFLite if requested
     if args.export_tflite:
-        trainer.export_tflite_model()
+        trainer.export_tflite_model(mode=args.quantization,
+                                    num_calibration_samples=args.calibration_samples)
+    
+    # Export to ONNX if requested
+    if args.export_onnx:
+        trainer.export_onnx_model()
+    
+    # Train the cascade gate if requested
+    if args.train_gate:
+        trainer.train_gate_classifier()
+    
+    # Compare quantization modes if requested
+    if args.quantization_report:
+        trainer.quantization_report(num_calibration_samples=args.calibration_samples)
+    
+    # Add the model to the registry if requested
+    if args.register:
+        from model_registry import ModelRegistry
+        
+        metrics = {}
+        if evaluation is not None:
+            metrics = {"loss": float(evaluation[0]), "accuracy": float(evaluation[1])}
+        
+        registry = ModelRegistry(os.path.join(args.model_dir, 'registry'))
+        model_path = args.register_path or os.path.join(args.model_dir, 'latest_model.h5')
+        version = registry.register(model_path, os.path.join(args.model_dir, 'class_mapping.json'),
+                                    metrics=metrics)
+        print(f"Registered model version {version}; activate it from the app or with model_registry.py")
 
 
 if __name__ == "__main__":